@@ -0,0 +1,368 @@
+import json
+import lzma
+import os
+import struct
+import zlib
+from dataclasses import fields
+from enum import Enum
+import numpy as np
+import pandas as pd
+from constants import *
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Columnar result archives: a compact replacement for model_output.csv, which
+# repeats every categorical ('Sensor.LOW', the reason messages, the nested AOI
+# and target fields) on every row and writes float64s as text.
+#
+# Each column is stored in chunks (one per append, e.g. per batch), and each
+# chunk is encoded by what it holds:
+# - 'dictionary': categoricals (strings, enums, None, tuples): the distinct
+#                 values once, in the footer, plus integer codes, which are
+#                 then encoded as a numeric chunk
+# - 'rle':        numbers with long runs (constant columns, the slow axes of a
+#                 grid): run values and run lengths
+# - 'plain':      other numbers, byte-shuffled (the k-th byte of every value
+#                 together, which exposes the repetition in exponents and high
+#                 mantissa bytes to the compressor)
+# then compressed with CODEC (zstd if zstandard is installed, else zlib).
+# Derived metrics can be stored as float32 (float32=True: everything but the
+# inputs).
+#
+# File layout: MAGIC, the chunks, then a JSON footer describing every chunk
+# (offset, length, encoding), its length (8 bytes) and MAGIC again. The footer
+# is read on open; a column read only reads its own chunks.
+
+MAGIC = b'TSARCHV1'
+
+CODECS = ('zstd', 'zlib', 'lzma')
+
+CODEC = 'zstd' if zstandard is not None else 'zlib'
+
+# Columns kept at full precision with float32: the inputs (Config /
+# ConfigBatch fields), so grid values still compare exactly
+INPUT_FIELDS = {f.name for f in fields(Config)} | {
+    'manx_bank_angle_rad', 'sensor_assumption_fov_deg', 'sensor_assumption_resolution',
+    'sensor_assumption_johnson_req', 'sensor_assumption_cost', 'target_type', 'target_dims',
+    'target_max_speed', 'aoi_length', 'aoi_width', 'aoi_ingress', 'aoi_egress',
+}
+
+# Use run-length encoding when there are at most this fraction of runs per value
+RLE_MAX_RUNS = 0.25
+
+_ENUMS = {cls.__name__: cls for cls in (Sensor,)}
+
+
+def _is_input(name: str) -> bool:
+    base = name.removesuffix('_0').removesuffix('_1')
+    return name.startswith('config_') or base in INPUT_FIELDS
+
+
+# region Codecs
+def _compress(data: bytes, codec: str, level: int = None) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("codec 'zstd' needs the zstandard package")
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    if codec == 'zlib':
+        return zlib.compress(data, 6 if level is None else level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=6 if level is None else level)
+    raise ValueError(f'Unknown codec {codec!r}, must be one of {CODECS}')
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("This archive is zstd compressed, which needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    raise ValueError(f'Unknown codec {codec!r}, must be one of {CODECS}')
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    return np.ascontiguousarray(values).view(np.uint8).reshape(len(values), values.itemsize).T.tobytes()
+
+
+def _unshuffle(data: bytes, dtype: np.dtype, n: int) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, n).T.copy().view(dtype).reshape(n)
+# endregion
+
+
+# region Encoding
+def _runs(values: np.ndarray) -> np.ndarray:
+    # Start of each run of equal values (NaN equal to NaN)
+    change = values[1:] != values[:-1]
+    if values.dtype.kind == 'f':
+        change &= ~(np.isnan(values[1:]) & np.isnan(values[:-1]))
+    return np.concatenate([[0], np.flatnonzero(change) + 1])
+
+
+def _encode_numeric(values: np.ndarray) -> tuple[dict, bytes]:
+    # (chunk description, uncompressed bytes) of a 1-D numeric array
+    meta = {'dtype': values.dtype.str, 'rows': len(values)}
+    starts = _runs(values) if len(values) else np.empty(0, dtype=int)
+    if len(starts) <= RLE_MAX_RUNS*len(values):
+        lengths = np.diff(np.append(starts, len(values))).astype(np.uint32)
+        meta.update(encoding='rle', runs=len(starts))
+        return meta, _shuffle(values[starts]) + _shuffle(lengths)
+    meta['encoding'] = 'plain'
+    return meta, _shuffle(values)
+
+
+def _decode_numeric(meta: dict, data: bytes) -> np.ndarray:
+    dtype = np.dtype(meta['dtype'])
+    if meta['encoding'] == 'plain':
+        return _unshuffle(data, dtype, meta['rows'])
+    runs = meta['runs']
+    split = runs*dtype.itemsize
+    values  = _unshuffle(data[:split], dtype, runs)
+    lengths = _unshuffle(data[split:], np.dtype(np.uint32), runs)
+    return np.repeat(values, lengths)
+
+
+def _encode_value(value):
+    # A categorical value as JSON
+    if isinstance(value, Enum):
+        return {'enum': type(value).__name__, 'name': value.name}
+    if isinstance(value, tuple):
+        return {'tuple': [_encode_value(v) for v in value]}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'enum' in value:
+            return _ENUMS[value['enum']][value['name']]
+        return tuple(_decode_value(v) for v in value['tuple'])
+    return value
+
+
+def _encode_chunk(values: np.ndarray, float32: bool) -> tuple[dict, bytes]:
+    values = np.asarray(values)
+    if values.ndim != 1:
+        raise ValueError(f'Columns must be 1-D, not shape {values.shape}')
+
+    if values.dtype.kind in 'OUS':
+        dictionary, codes = [], {}
+        index = np.empty(len(values), dtype=np.int64)
+        for k, v in enumerate(values.tolist()):
+            if v not in codes:
+                codes[v] = len(dictionary)
+                dictionary.append(v)
+            index[k] = codes[v]
+        code_dtype = np.uint8 if len(dictionary) <= 256 else np.uint16 if len(dictionary) <= 65536 else np.uint32
+        meta, data = _encode_numeric(index.astype(code_dtype))
+        return {'encoding': 'dictionary', 'dictionary': [_encode_value(v) for v in dictionary], 'codes': meta}, data
+
+    if values.dtype.kind == 'b':
+        meta, data = _encode_numeric(values.view(np.uint8))
+        meta['bool'] = True
+        return meta, data
+
+    if values.dtype.kind not in 'iuf':
+        raise ValueError(f'Cannot archive columns of dtype {values.dtype}')
+    if float32 and values.dtype == np.float64:
+        values = values.astype(np.float32)
+    return _encode_numeric(values)
+
+
+def _decode_chunk(meta: dict, data: bytes) -> np.ndarray:
+    if meta.get('encoding') == 'dictionary':
+        dictionary = [_decode_value(v) for v in meta['dictionary']]
+        table = np.empty(len(dictionary), dtype=object)
+        for k, v in enumerate(dictionary):
+            table[k] = v
+        return table[_decode_numeric(meta['codes'], data)]
+    values = _decode_numeric(meta, data)
+    return values.view(bool) if meta.get('bool') else values
+# endregion
+
+
+# region Columns
+def batch_columns(batch, result) -> dict:
+    '''
+    Archive columns of an evaluated ConfigBatch and its BatchResult: their
+    fields, with pairs split into _0/_1 columns.
+    '''
+    data = {}
+    for source in (batch, result):
+        for f in fields(source):
+            values = getattr(source, f.name)
+            if values.ndim == 2:
+                for j in range(values.shape[1]):
+                    data[f'{f.name}_{j}'] = values[:, j]
+            else:
+                data[f.name] = values
+    return data
+
+
+def frame_columns(frame: pd.DataFrame) -> dict:
+    '''
+    Archive columns of a DataFrame (e.g. main.py's, json_normalized
+    ModelResults): columns of numeric pairs are split into _0/_1 columns,
+    other object columns are kept as categoricals.
+    '''
+    data = {}
+    for name in frame.columns:
+        values = frame[name].to_numpy()
+        if values.dtype == object:
+            present = [v for v in values if v is not None]
+            if present and all(isinstance(v, tuple) and len(v) == len(present[0]) for v in present) \
+                    and all(isinstance(x, (int, float)) for x in present[0]):
+                width = len(present[0])
+                for j in range(width):
+                    data[f'{name}_{j}'] = np.array([np.nan if v is None else v[j] for v in values], dtype=float)
+                continue
+            if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present) and present:
+                values = np.array([np.nan if v is None else v for v in values], dtype=float)
+        data[name] = values
+    return data
+# endregion
+
+
+class ArchiveWriter:
+    '''
+    Write an archive chunk by chunk: append a dict of equal-length columns
+    (the same names every time) per batch, then close.
+
+    Args:
+        path (str)
+        codec (str): one of CODECS.
+        float32 (bool | tuple[str, ...]): store these float columns as
+            float32; True for every column that isn't an input.
+        level (int): compression level (codec default if None).
+    '''
+
+    def __init__(self, path: str, codec: str = CODEC, float32: bool | tuple[str, ...] = False, level: int = None):
+        if codec not in CODECS:
+            raise ValueError(f'Unknown codec {codec!r}, must be one of {CODECS}')
+        self.path    = path
+        self.codec   = codec
+        self.float32 = float32
+        self.level   = level
+        self.columns = None # name -> list of chunk descriptions
+        self.rows    = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def _float32(self, name: str) -> bool:
+        if self.float32 is True:
+            return not _is_input(name)
+        return bool(self.float32) and name in self.float32
+
+    def append(self, columns: dict) -> 'ArchiveWriter':
+        lengths = {len(v) for v in columns.values()}
+        if len(lengths) != 1:
+            raise ValueError('Columns must all have the same length')
+        if self.columns is None:
+            self.columns = {name: [] for name in columns}
+        elif set(columns) != set(self.columns):
+            raise ValueError('Every append must have the same columns')
+
+        for name, values in columns.items():
+            meta, data = _encode_chunk(values, self._float32(name))
+            data = _compress(data, self.codec, self.level)
+            meta.update(offset=self.file.tell(), length=len(data))
+            self.file.write(data)
+            self.columns[name].append(meta)
+        self.rows += lengths.pop()
+        return self
+
+    def close(self):
+        footer = json.dumps({'codec': self.codec, 'rows': self.rows, 'columns': self.columns or {}}).encode()
+        self.file.write(footer)
+        self.file.write(struct.pack('<Q', len(footer)))
+        self.file.write(MAGIC)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_archive(path: str, columns: dict, codec: str = CODEC, float32: bool | tuple[str, ...] = False) -> 'Archive':
+    '''
+    Write columns (a dict of arrays, or a DataFrame) as a one-chunk archive.
+
+    Returns:
+        Archive: the archive, opened.
+    '''
+    if isinstance(columns, pd.DataFrame):
+        columns = frame_columns(columns)
+    with ArchiveWriter(path, codec, float32) as writer:
+        writer.append(columns)
+    return Archive(path)
+
+
+class Archive:
+    '''
+    An archive, opened for reading column by column.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a results archive')
+            f.seek(-len(MAGIC) - 8, os.SEEK_END)
+            (length,) = struct.unpack('<Q', f.read(8))
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is truncated (no footer)')
+            f.seek(-len(MAGIC) - 8 - length, os.SEEK_END)
+            footer = json.loads(f.read(length))
+        self.codec   = footer['codec']
+        self.rows    = footer['rows']
+        self._chunks = footer['columns']
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._chunks)
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name: str):
+        return name in self._chunks
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        '''
+        A column, reading only its chunks.
+        '''
+        if name not in self._chunks:
+            raise KeyError(f'No column {name!r}, archive has {self.columns}')
+        parts = []
+        with open(self.path, 'rb') as f:
+            for meta in self._chunks[name]:
+                f.seek(meta['offset'])
+                parts.append(_decode_chunk(meta, _decompress(f.read(meta['length']), self.codec)))
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def to_dataframe(self, columns: list[str] = None) -> pd.DataFrame:
+        return pd.DataFrame({name: self[name] for name in (self.columns if columns is None else columns)})
+
+    def info(self) -> pd.DataFrame:
+        '''
+        Each column's encodings and stored (compressed) bytes.
+        '''
+        rows = []
+        for name, chunks in self._chunks.items():
+            rows.append({
+                'column':    name,
+                'encodings': ','.join(sorted({c['encoding'] for c in chunks})),
+                'dtype':     chunks[0]['codes']['dtype'] if chunks[0]['encoding'] == 'dictionary' else chunks[0]['dtype'],
+                'bytes':     sum(c['length'] for c in chunks),
+            })
+        return pd.DataFrame(rows)
@@ -0,0 +1,189 @@
+from dataclasses import dataclass, fields
+import numpy as np
+from constants import *
+
+
+# Target aspect models for the limiting sweep width.
+#
+# A target at angle off the beam aob (0: beaming, crossing the aircraft's legs
+# at right angles; pi/2: moving parallel to them) crosses the legs at
+# max_speed*cos(aob) and moves down-track at max_speed*sin(aob). It presents a
+# horizontal dimension of length*|cos(aob)|, or its height if that's larger
+# (see c_DetectionRangesWGraph in manim/scenes.py), and the aircraft detects it
+# at whichever of the two it resolves from further away.
+#
+# - 'limiting_cases': the original two aspects, beaming (aob = 0, detected
+#   against the horizontal dimension) and glancing (aob = acos(height/length),
+#   where the presented horizontal dimension equals the height).
+# - 'continuous':     the worst case over all aspects in [0, pi/2], found on a
+#   grid of ASPECT_GRID_POINTS aspects (plus the glancing aspect), then refined
+#   by golden-section search around the best grid point. Both limiting aspects
+#   are candidates, so for sensors with the same horizontal and vertical IFOV
+#   it's never less conservative than 'limiting_cases'.
+#
+# Both reproduce the original formulas at the two limiting aspects, including
+# the down-track speed in knots subtracted from a distance in meters.
+
+ASPECT_GRID_POINTS  = 91 # 1 degree spacing
+ASPECT_REFINE_STEPS = 20
+
+_GOLDEN = (5**0.5 - 1)/2
+
+
+@dataclass
+class AspectInputs:
+    '''
+    What the continuous model needs beyond the limiting cases, per config:
+    detection range has to be recomputed for each presented dimension.
+    '''
+    continuous:            np.ndarray # bool, aspect_model == 'continuous'
+    slant_detection_range: np.ndarray # (n, 2)
+    alt_m:                 np.ndarray
+    half_fov_h_rad:        np.ndarray
+
+    def take(self, idx) -> 'AspectInputs':
+        return AspectInputs(**{f.name: getattr(self, f.name)[idx] for f in fields(self)})
+
+
+def glancing_aob(target_dims: np.ndarray) -> np.ndarray:
+    '''
+    Aspect where the presented horizontal dimension equals the height (NaN if
+    the target is taller than it is long).
+    '''
+    with np.errstate(invalid='ignore'):
+        return np.arccos(target_dims[..., 1]/target_dims[..., 0])
+
+
+def limiting_cases(turn_time, mach, aoi_length, target_dims, target_max_speed, xtrack_detection_width):
+    '''
+    Sweep widths for the beaming and glancing targets (the original
+    sweep_width_for_limiting_cases), vectorized.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (smaller sweep width, binding aob in rad)
+    '''
+    # Beaming
+    time = (2*aoi_length)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_beaming_tgt = xtrack_detection_width[:, 0] - time*target_max_speed*KTS_IN_M_PER_SEC
+
+    # Glancing
+    aob = glancing_aob(target_dims)
+    tgt_speed_cross_track = target_max_speed*np.cos(aob)
+    tgt_speed_down_track  = target_max_speed*np.sin(aob)
+
+    time = (2*aoi_length-tgt_speed_down_track)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_glancing_tgt = xtrack_detection_width[:, 1] - time*tgt_speed_cross_track*KTS_IN_M_PER_SEC
+
+    # Same as builtin min(): keep beaming unless glancing is strictly smaller
+    glancing = sweep_width_glancing_tgt < sweep_width_beaming_tgt
+    return (
+        np.where(glancing, sweep_width_glancing_tgt, sweep_width_beaming_tgt),
+        np.where(glancing, aob, 0.0)
+    )
+
+
+def aspect_xtrack_width(aob, target_dims, slant_detection_range, alt_m, half_fov_h_rad) -> np.ndarray:
+    '''
+    Cross-track detection width against the target at aspect aob. Config
+    arrays have shape (n,) or (n, 2); aob is (n,) or (n, k).
+    '''
+    expand = (lambda x: x[:, None]) if np.ndim(aob) == 2 else (lambda x: x)
+
+    # Horizontal dimension resolved at a range proportional to its presented
+    # length; the height always presents the same
+    slant = np.maximum(
+        expand(slant_detection_range[:, 0])*np.abs(np.cos(aob)),
+        expand(slant_detection_range[:, 1])
+    )
+    with np.errstate(invalid='ignore'):
+        ground = (slant**2 - expand(alt_m)**2)**0.5
+    return 2*ground*np.sin(expand(half_fov_h_rad))
+
+
+def aspect_sweep_width(aob, turn_time, mach, aoi_length, target_dims, target_max_speed, inputs: AspectInputs) -> np.ndarray:
+    '''
+    Sweep width that keeps a target at aspect aob from slipping between legs.
+    Config arrays have shape (n,); aob is (n,) or (n, k).
+    '''
+    expand = (lambda x: x[:, None]) if np.ndim(aob) == 2 else (lambda x: x)
+
+    xtrack = aspect_xtrack_width(aob, target_dims, inputs.slant_detection_range, inputs.alt_m, inputs.half_fov_h_rad)
+    speed  = expand(target_max_speed)
+    time   = (2*expand(aoi_length) - speed*np.sin(aob))/expand(mach)/MACH_M_PER_SEC + expand(turn_time)
+    return xtrack - time*speed*np.cos(aob)*KTS_IN_M_PER_SEC
+
+
+def worst_case(
+        turn_time, mach, aoi_length, target_dims, target_max_speed,
+        inputs: AspectInputs,
+        n_aspects: int = ASPECT_GRID_POINTS,
+        refine_steps: int = ASPECT_REFINE_STEPS
+    ):
+    '''
+    Smallest sweep width over all target aspects in [0, pi/2], vectorized over
+    configs.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (sweep width, binding aob in rad)
+    '''
+    n    = len(turn_time)
+    grid = np.linspace(0, np.pi/2, n_aspects)
+
+    def width_at(aob):
+        return aspect_sweep_width(aob, turn_time, mach, aoi_length, target_dims, target_max_speed, inputs)
+
+    widths = width_at(np.broadcast_to(grid, (n, n_aspects)))
+    k      = np.argmin(widths, axis=1)
+    rows   = np.arange(n)
+    width  = widths[rows, k]
+    aob    = grid[k]
+
+    # Refine around the best grid point
+    step = grid[1] - grid[0] if n_aspects > 1 else 0
+    lo   = np.maximum(aob - step, 0)
+    hi   = np.minimum(aob + step, np.pi/2)
+    for _ in range(refine_steps):
+        c = hi - _GOLDEN*(hi - lo)
+        d = lo + _GOLDEN*(hi - lo)
+        left = width_at(c) < width_at(d)
+        hi = np.where(left, d, hi)
+        lo = np.where(left, lo, c)
+    refined = (lo + hi)/2
+
+    # The glancing aspect sits on the kink in detection range, where the grid
+    # and the refinement are least accurate
+    glancing = glancing_aob(target_dims)
+    glancing = np.where(np.isnan(glancing), 0.0, glancing)
+
+    for candidate in (refined, glancing):
+        w = width_at(candidate)
+        better = w < width
+        width  = np.where(better, w, width)
+        aob    = np.where(better, candidate, aob)
+
+    return width, aob
+
+
+def limiting_sweep_width(
+        turn_time, mach, aoi_length, target_dims, target_max_speed, xtrack_detection_width,
+        inputs: AspectInputs = None
+    ):
+    '''
+    Limiting sweep width under each config's aspect model.
+
+    Args:
+        inputs: AspectInputs, None if every config uses 'limiting_cases'.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (sweep width, binding aob in rad)
+    '''
+    width, aob = limiting_cases(turn_time, mach, aoi_length, target_dims, target_max_speed, xtrack_detection_width)
+    if inputs is None or not inputs.continuous.any():
+        return width, aob
+
+    idx = np.flatnonzero(inputs.continuous)
+    width[idx], aob[idx] = worst_case(
+        turn_time[idx], mach[idx], aoi_length[idx], target_dims[idx], target_max_speed[idx],
+        inputs.take(idx)
+    )
+    return width, aob
@@ -0,0 +1,664 @@
+import math
+from dataclasses import dataclass, fields
+import numpy as np
+from constants import *
+from lib import validate_config
+from performance import PERFORMANCE_MODELS, evaluate_models
+from flyweight import intern
+import kernels
+import solvers
+import continuation
+from convergence_trace import ConvergenceTrace
+import aspect
+from aspect import AspectInputs
+
+
+# Batched (vectorized) version of main.evaluate_config. Configs are held as a
+# struct of arrays, one element per config, and every stage of the model is
+# evaluated with numpy over all configs still valid at that stage.
+
+REASON_SEARCH_PERF     = 'Alt > Slant detection range'
+REASON_NEG_SWEEP_WIDTH = 'Aircraft/sensor pairing has negative effective sweep width against design target'
+REASON_NO_SEARCH_LEGS  = 'Aircraft endurance cannot support any search legs'
+
+
+@dataclass
+class ConfigBatch:
+    '''
+    Struct of arrays equivalent to a list of Configs. Field names follow the
+    flattened Config (e.g. aoi_length is config.aoi.length). Pair-valued
+    fields (fov, resolution, target dims) have shape (n, 2).
+    '''
+    altitude_kft:                   np.ndarray
+    mach:                           np.ndarray
+    manx_bank_angle_rad:            np.ndarray
+    manx_decel_gees:                np.ndarray
+    manx_min_mach:                  np.ndarray
+    sensor:                         np.ndarray # object, Sensor
+    sensor_assumption_fov_deg:      np.ndarray # (n, 2)
+    sensor_assumption_resolution:   np.ndarray # (n, 2)
+    sensor_assumption_johnson_req:  np.ndarray
+    sensor_assumption_cost:         np.ndarray
+    target_type:                    np.ndarray # object, str
+    target_dims:                    np.ndarray # (n, 2)
+    target_max_speed:               np.ndarray
+    aoi_length:                     np.ndarray
+    aoi_width:                      np.ndarray
+    aoi_ingress:                    np.ndarray
+    aoi_egress:                     np.ndarray
+    aoi_revisit_time_hr:            np.ndarray
+    performance_model:              np.ndarray # object, str
+    aspect_model:                   np.ndarray # object, str
+
+    def __len__(self):
+        return len(self.altitude_kft)
+
+    @classmethod
+    def from_configs(cls, configs: list[Config]) -> 'ConfigBatch':
+        def col(get, dtype=float):
+            return np.array([get(c) for c in configs], dtype=dtype)
+
+        return cls(
+            altitude_kft                  = col(lambda c: c.altitude_kft),
+            mach                          = col(lambda c: c.mach),
+            manx_bank_angle_rad           = col(lambda c: c.manx_bank_angle_rad),
+            manx_decel_gees               = col(lambda c: c.manx_decel_gees),
+            manx_min_mach                 = col(lambda c: c.manx_min_mach),
+            sensor                        = col(lambda c: c.sensor, object),
+            sensor_assumption_fov_deg     = col(lambda c: c.sensor_assumption.fov_deg).reshape(-1, 2),
+            sensor_assumption_resolution  = col(lambda c: c.sensor_assumption.resolution).reshape(-1, 2),
+            sensor_assumption_johnson_req = col(lambda c: c.sensor_assumption.johnson_req),
+            sensor_assumption_cost        = col(lambda c: c.sensor_assumption.cost),
+            target_type                   = col(lambda c: c.target.type, object),
+            target_dims                   = col(lambda c: c.target.dims).reshape(-1, 2),
+            target_max_speed              = col(lambda c: c.target.max_speed),
+            aoi_length                    = col(lambda c: c.aoi.length),
+            aoi_width                     = col(lambda c: c.aoi.width),
+            aoi_ingress                   = col(lambda c: c.aoi.ingress),
+            aoi_egress                    = col(lambda c: c.aoi.egress),
+            aoi_revisit_time_hr           = col(lambda c: c.aoi_revisit_time_hr),
+            performance_model             = col(lambda c: c.performance_model, object),
+            aspect_model                  = col(lambda c: c.aspect_model, object),
+        )
+
+    def config(self, i: int) -> Config:
+        '''
+        Rebuild the i-th Config (with interned sub-objects).
+        '''
+        return Config(
+            altitude_kft        = float(self.altitude_kft[i]),
+            mach                = float(self.mach[i]),
+            manx_bank_angle_rad = float(self.manx_bank_angle_rad[i]),
+            manx_decel_gees     = float(self.manx_decel_gees[i]),
+            manx_min_mach       = float(self.manx_min_mach[i]),
+            sensor              = self.sensor[i],
+            sensor_assumption   = intern(SensorAssumption(
+                fov_deg     = tuple(self.sensor_assumption_fov_deg[i].tolist()),
+                resolution  = tuple(self.sensor_assumption_resolution[i].tolist()),
+                johnson_req = self.sensor_assumption_johnson_req[i].item(),
+                cost        = self.sensor_assumption_cost[i].item()
+            )),
+            target              = intern(DesignTarget(
+                type      = self.target_type[i],
+                dims      = tuple(self.target_dims[i].tolist()),
+                max_speed = self.target_max_speed[i].item()
+            )),
+            aoi                 = intern(AOI(
+                length  = self.aoi_length[i].item(),
+                width   = self.aoi_width[i].item(),
+                ingress = self.aoi_ingress[i].item(),
+                egress  = self.aoi_egress[i].item()
+            )),
+            aoi_revisit_time_hr = self.aoi_revisit_time_hr[i].item(),
+            performance_model   = self.performance_model[i],
+            aspect_model        = self.aspect_model[i]
+        )
+
+    def take(self, idx) -> 'ConfigBatch':
+        '''
+        Subset of the batch (index array or boolean mask).
+        '''
+        return ConfigBatch(**{f.name: getattr(self, f.name)[idx] for f in fields(self)})
+
+
+@dataclass
+class BatchResult:
+    '''
+    Struct of arrays equivalent to a list of ModelResults. Values that are None
+    in a ModelResult are NaN here.
+    '''
+    valid:                     np.ndarray
+    reason:                    np.ndarray # object, str or None
+    ac_cost:                   np.ndarray
+    ac_endurance_sec:          np.ndarray
+    slant_detection_range:     np.ndarray # (n, 2)
+    search_perf_valid:         np.ndarray
+    ground_detection_range:    np.ndarray # (n, 2)
+    downtrack_detection_range: np.ndarray # (n, 2)
+    xtrack_detection_width:    np.ndarray # (n, 2)
+    ac_turn_time:              np.ndarray
+    effective_sweep_width:     np.ndarray
+    search_rate:               np.ndarray
+    onsta_req_n:               np.ndarray
+    onsta_req_cost:            np.ndarray
+    sweep_width_iterations:    np.ndarray # 0 where not evaluated
+    sweep_width_converged:     np.ndarray
+    sweep_width_seeded:        np.ndarray # warm started from a neighbor (continuation.py)
+    sweep_width_fallback:      np.ndarray # warm start failed, re-solved cold
+    binding_aob_rad:           np.ndarray # target aspect setting the sweep width
+
+    @classmethod
+    def empty(cls, n: int) -> 'BatchResult':
+        def nan(*shape):
+            return np.full((n, *shape), np.nan)
+
+        return cls(
+            valid                     = np.ones(n, dtype=bool),
+            reason                    = np.full(n, None, dtype=object),
+            ac_cost                   = nan(),
+            ac_endurance_sec          = nan(),
+            slant_detection_range     = nan(2),
+            search_perf_valid         = np.zeros(n, dtype=bool),
+            ground_detection_range    = nan(2),
+            downtrack_detection_range = nan(2),
+            xtrack_detection_width    = nan(2),
+            ac_turn_time              = nan(),
+            effective_sweep_width     = nan(),
+            search_rate               = nan(),
+            onsta_req_n               = nan(),
+            onsta_req_cost            = nan(),
+            sweep_width_iterations    = np.zeros(n, dtype=int),
+            sweep_width_converged     = np.zeros(n, dtype=bool),
+            sweep_width_seeded        = np.zeros(n, dtype=bool),
+            sweep_width_fallback      = np.zeros(n, dtype=bool),
+            binding_aob_rad           = nan(),
+        )
+
+    def __len__(self):
+        return len(self.valid)
+
+    def model_result(self, i: int, config: Config) -> ModelResult:
+        '''
+        The i-th result as a ModelResult, as main.evaluate_config returns it.
+        '''
+        def value(x):
+            return None if np.isnan(x) else float(x)
+
+        def pair(x):
+            return None if np.isnan(x).any() else tuple(x.tolist())
+
+        result = ModelResult(
+            config = config,
+            valid  = bool(self.valid[i]),
+            reason = self.reason[i]
+        )
+
+        if not np.isnan(self.slant_detection_range[i]).any():
+            result.sensor_performance = SensorPerformance(
+                slant_detection_range = pair(self.slant_detection_range[i])
+            )
+            if self.search_perf_valid[i]:
+                result.ac_search_perf = AircraftSearchPerformance(
+                    valid                     = True,
+                    ground_detection_range    = pair(self.ground_detection_range[i]),
+                    downtrack_detection_range = pair(self.downtrack_detection_range[i]),
+                    xtrack_detection_width    = pair(self.xtrack_detection_width[i]),
+                )
+            else:
+                result.ac_search_perf = AircraftSearchPerformance(valid=False, reason=REASON_SEARCH_PERF)
+
+        if self.sweep_width_iterations[i]:
+            result.sweep_width_iterations = int(self.sweep_width_iterations[i])
+            result.sweep_width_converged  = bool(self.sweep_width_converged[i])
+            result.binding_aob_rad        = value(self.binding_aob_rad[i])
+
+        if result.valid or result.reason == REASON_NO_SEARCH_LEGS:
+            result.ac_turn_time          = value(self.ac_turn_time[i])
+            result.effective_sweep_width = value(self.effective_sweep_width[i])
+            result.search_rate           = value(self.search_rate[i])
+            result.onsta_req_n           = value(self.onsta_req_n[i])
+            result.onsta_req_cost        = value(self.onsta_req_cost[i])
+
+        return result
+
+
+# region Stages
+# Stages of evaluate_batch in order, and the ConfigBatch fields each reads
+# (validation reads every field). A field that first enters at a late stage
+# can be swept by rerunning only the stages from there on (see sweeps.py).
+STAGES = ('aircraft', 'sensor', 'search', 'sweep_width', 'search_rate', 'onsta')
+
+STAGE_INPUTS = {
+    'aircraft':    {'mach', 'altitude_kft', 'sensor_assumption_cost', 'performance_model'},
+    'sensor':      {'sensor_assumption_fov_deg', 'sensor_assumption_resolution', 'sensor_assumption_johnson_req', 'target_dims'},
+    'search':      {'altitude_kft', 'sensor_assumption_fov_deg'},
+    'sweep_width': {'mach', 'manx_bank_angle_rad', 'manx_decel_gees', 'manx_min_mach', 'aoi_length', 'target_dims', 'target_max_speed', 'aspect_model'},
+    'search_rate': {'mach', 'aoi_length', 'aoi_ingress', 'aoi_egress'},
+    'onsta':       {'aoi_length', 'aoi_width', 'aoi_revisit_time_hr'},
+}
+
+
+def first_stage(field: str) -> str | None:
+    '''
+    The earliest stage that reads a ConfigBatch field (None if only validation
+    reads it).
+    '''
+    return next((stage for stage in STAGES if field in STAGE_INPUTS[stage]), None)
+
+def validate_batch(batch: ConfigBatch) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized validate_config. Reasons for the (rare) invalid configs come
+    from validate_config itself, so messages match the scalar path.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (valid mask, reasons)
+    '''
+    with np.errstate(invalid='ignore'):
+        valid = (
+            (batch.sensor_assumption_johnson_req > 0)
+            & (batch.sensor_assumption_resolution > 0).all(axis=1)
+            & (batch.sensor_assumption_fov_deg > 0).all(axis=1)
+            & (batch.mach > 0)
+            & (batch.altitude_kft > 0)
+            & (batch.aoi_length > 0)
+            & (batch.aoi_width > 0)
+            & (batch.aoi_ingress > 0)
+            & (batch.aoi_egress > 0)
+            & (batch.target_dims > 0).all(axis=1)
+            & (batch.target_max_speed > 0)
+        )
+
+    reasons = np.full(len(batch), None, dtype=object)
+    # Unknown performance and aspect models are caught here too
+    unknown = ~np.isin(batch.performance_model, list(PERFORMANCE_MODELS)) | ~np.isin(batch.aspect_model, ASPECT_MODELS)
+    for i in np.flatnonzero(~valid | unknown):
+        valid[i], reasons[i] = validate_config(batch.config(i))
+
+    return valid, reasons
+
+
+def aircraft_stage(
+        mach: np.ndarray,
+        alt_kft: np.ndarray,
+        sensor_cost: np.ndarray,
+        performance_model: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized Aircraft cost/endurance.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (cost in $M incl. sensor, endurance in sec)
+    '''
+    endurance_hr, airframe_cost = evaluate_models(performance_model, mach, alt_kft)
+    return airframe_cost + sensor_cost, endurance_hr*SEC_PER_HR
+
+
+def sensor_stage(fov_deg: np.ndarray, resolution: np.ndarray, johnson_req: np.ndarray, target_dims: np.ndarray) -> np.ndarray:
+    '''
+    Vectorized calc_sensor_performance.
+
+    Returns:
+        np.ndarray: (n, 2) slant detection range vs (horizontal, vertical) dims
+    '''
+    fov_rad  = fov_deg*2*math.pi/360
+    ifov_rad = fov_rad/resolution
+    gsd      = target_dims/johnson_req[:, None]
+    return gsd/ifov_rad
+
+
+def search_stage(alt_m: np.ndarray, slant_det_range: np.ndarray, fov_deg: np.ndarray):
+    '''
+    Vectorized calc_search_performance.
+
+    Returns:
+        tuple: (valid mask, ground detection range, downtrack detection range,
+        cross-track detection width), each range (n, 2)
+    '''
+    valid = ~((alt_m[:, None] - slant_det_range) > 0).any(axis=1)
+    half_fov_h = (fov_deg[:, 0]*RAD_PER_DEG/2)[:, None]
+
+    with np.errstate(invalid='ignore'):
+        ground = (slant_det_range**2 - alt_m[:, None]**2)**0.5
+    downtrack = ground*np.cos(half_fov_h)
+    xtrack    = 2*ground*np.sin(half_fov_h)
+
+    return valid, ground, downtrack, xtrack
+
+
+def straight_accelerating_leg(mach0, dist, accel, min_mach) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized lib.calc_straight_accelerating_leg.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (time on leg, final mach)
+    '''
+    t_min_mach = (min_mach-mach0)*MACH_M_PER_SEC/(accel*GEE)
+
+    a = accel*GEE/2
+    b = mach0*MACH_M_PER_SEC
+    c = -dist
+    discriminant = b**2 - 4*a*c
+    root = np.sqrt(np.maximum(discriminant, 0))
+    t1 = (-b + root)/(2*a)
+    t2 = (-b - root)/(2*a)
+    # Minimum positive solution (inf if none, or if the body stops first)
+    t_dist = np.minimum(np.where(t1 > 0, t1, np.inf), np.where(t2 > 0, t2, np.inf))
+    t_dist = np.where(discriminant < 0, np.inf, t_dist)
+
+    reaches_min_mach = t_min_mach < t_dist
+
+    d2       = mach0*MACH_M_PER_SEC*t_min_mach + 0.5*accel*GEE*(t_min_mach**2)
+    t_cruise = (dist-d2)/mach0/MACH_M_PER_SEC
+
+    time  = np.where(reaches_min_mach, t_min_mach + t_cruise, t_dist)
+    machf = np.where(reaches_min_mach, min_mach, (mach0*MACH_M_PER_SEC + accel*GEE*t_dist)/MACH_M_PER_SEC)
+    return time, machf
+
+
+def turnaround_time(lateral_offset, leg_time, manx_mach, bank_angle_rad) -> np.ndarray:
+    '''
+    Vectorized lib.calc_coordinated_level_turnaround_time, given the time on
+    (and speed at the end of) the straight deceleration leg, which does not
+    depend on the lateral offset.
+    '''
+    tan_bank = np.tan(bank_angle_rad)
+    radius   = (MACH_M_PER_SEC*manx_mach)**2/GEE/tan_bank
+    wide     = lateral_offset >= 2*radius
+
+    # 2R <= S: semi-circle plus straight segment
+    t_wide = (lateral_offset - 2*radius)/manx_mach/MACH_M_PER_SEC + math.pi*MACH_M_PER_SEC*manx_mach/GEE/tan_bank
+
+    # 2R > S: portions of three circles
+    with np.errstate(invalid='ignore'):
+        total_angle_of_travel = math.pi + 4*np.arccos((radius+lateral_offset/2)/(2*radius))
+    t_narrow = radius*total_angle_of_travel/manx_mach/MACH_M_PER_SEC
+
+    return leg_time + np.where(wide, t_wide, t_narrow) + leg_time
+
+
+def limiting_sweep_width(turn_time, mach, aoi_length, target_dims, target_max_speed, xtrack_detection_width) -> np.ndarray:
+    '''
+    Vectorized sweep_width_for_limiting_cases (from calc_effective_sweep_width):
+    the smaller of the beaming and glancing target sweep widths.
+    '''
+    return aspect.limiting_cases(turn_time, mach, aoi_length, target_dims, target_max_speed, xtrack_detection_width)[0]
+
+
+def sweep_width_stage(
+        mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+        aoi_length, target_dims, target_max_speed,
+        downtrack_detection_range, xtrack_detection_width,
+        solver: SolverSettings = SolverSettings(),
+        trace: ConvergenceTrace = None,
+        ids: np.ndarray = None,
+        aspect_inputs: AspectInputs = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Vectorized solve_effective_sweep_width. The selected solver (see
+    solvers.py) iterates all configs together; configs drop out of the active
+    set as they converge.
+
+    With the 'jit' kernel backend selected (kernels.set_backend) and the
+    fixed point solver, each config is instead iterated to convergence in one
+    fused loop (unless tracing, which needs the numpy solvers).
+
+    With a trace, every evaluation is recorded under ids (default: position
+    in the arrays).
+
+    aspect_inputs is needed for configs using the 'continuous' aspect model
+    (see aspect.py); None if all use 'limiting_cases'. The jit kernels only
+    implement the limiting cases.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: (effective sweep
+        width, turn-around time, iterations, converged)
+    '''
+    fused = (
+        kernels.get_backend() == 'jit' and solver.method == 'fixed_point' and trace is None
+        and (aspect_inputs is None or not aspect_inputs.continuous.any())
+    )
+    if fused:
+        return kernels.effective_sweep_width(
+            mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+            aoi_length, target_dims, target_max_speed,
+            downtrack_detection_range, xtrack_detection_width,
+            tol=solver.tol, max_iter=solver.max_iter
+        )
+
+    g, w0 = _sweep_width_map(
+        mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+        aoi_length, target_dims, target_max_speed,
+        downtrack_detection_range, xtrack_detection_width,
+        aspect_inputs
+    )
+    if trace is not None:
+        g = trace.wrap(g, np.arange(len(w0)) if ids is None else ids)
+    return solvers.solve(
+        g,
+        w0       = w0,
+        method   = solver.method,
+        tol      = solver.tol,
+        max_iter = solver.max_iter
+    )
+
+
+def sweep_width_continuation_stage(
+        mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+        aoi_length, target_dims, target_max_speed,
+        downtrack_detection_range, xtrack_detection_width,
+        neighbor: np.ndarray,
+        solver: SolverSettings = SolverSettings(),
+        trace: ConvergenceTrace = None,
+        ids: np.ndarray = None,
+        aspect_inputs: AspectInputs = None
+    ) -> tuple[np.ndarray, ...]:
+    '''
+    sweep_width_stage, warm starting each config from its neighbor's solution
+    (see continuation.py). Always uses the numpy solvers.
+
+    Returns:
+        tuple[np.ndarray, ...]: (effective sweep width, turn-around time,
+        iterations, converged, seeded, fallback)
+    '''
+    g, w0 = _sweep_width_map(
+        mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+        aoi_length, target_dims, target_max_speed,
+        downtrack_detection_range, xtrack_detection_width,
+        aspect_inputs
+    )
+    if trace is not None:
+        g = trace.wrap(g, np.arange(len(w0)) if ids is None else ids)
+    return continuation.solve_continuation(
+        g,
+        w_cold   = w0,
+        neighbor = neighbor,
+        method   = solver.method,
+        tol      = solver.tol,
+        max_iter = solver.max_iter
+    )
+
+
+def _sweep_width_map(
+        mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+        aoi_length, target_dims, target_max_speed,
+        downtrack_detection_range, xtrack_detection_width,
+        aspect_inputs: AspectInputs = None
+    ):
+    '''
+    The map g(idx, offset) -> (sweep width, turn-around time) the solvers
+    iterate, and the cold start offsets.
+    '''
+    # The deceleration leg doesn't depend on the lateral offset: do it once
+    leg_time, manx_mach = straight_accelerating_leg(
+        mach0    = mach,
+        dist     = downtrack_detection_range[:, 1],
+        accel    = manx_decel_gees,
+        min_mach = manx_min_mach
+    )
+
+    def g(idx, offset):
+        turn_time = turnaround_time(offset, leg_time[idx], manx_mach[idx], manx_bank_angle_rad[idx])
+        width, _ = aspect.limiting_sweep_width(
+            turn_time, mach[idx], aoi_length[idx], target_dims[idx],
+            target_max_speed[idx], xtrack_detection_width[idx],
+            None if aspect_inputs is None else aspect_inputs.take(idx)
+        )
+        return width, turn_time
+
+    return g, xtrack_detection_width[:, 1]
+
+
+def search_rate_stage(mach, endurance_sec, aoi_length, aoi_ingress, aoi_egress, turn_time, eff_width) -> np.ndarray:
+    '''
+    Vectorized calc_ac_search_rate. NaN where the aircraft can't get there and
+    back.
+    '''
+    time_segment_terminal = (aoi_ingress + aoi_egress + 2*aoi_length)/mach/MACH_M_PER_SEC
+    time_segment_working  = 2*turn_time + 2*aoi_length/mach/MACH_IN_M_PER_HR
+
+    n_segments  = 1 + np.floor((endurance_sec-time_segment_terminal)/time_segment_working)
+    flight_time = time_segment_terminal + (n_segments-1)*time_segment_working
+    search_rate = 2*n_segments*eff_width*aoi_length/flight_time
+
+    return np.where(time_segment_terminal > endurance_sec, np.nan, search_rate)
+
+
+def onsta_stage(aoi_length, aoi_width, search_rate, revisit_time_hr) -> np.ndarray:
+    '''
+    Vectorized calc_onsta_requirement.
+    '''
+    return (aoi_length*aoi_width)/(revisit_time_hr*SEC_PER_HR)/search_rate
+# endregion
+
+
+def evaluate_batch(
+        batch: ConfigBatch,
+        aircraft: tuple[np.ndarray, np.ndarray] = None,
+        solver: SolverSettings = SolverSettings(),
+        neighbor: np.ndarray = None,
+        trace: ConvergenceTrace = None
+    ) -> BatchResult:
+    '''
+    Batched equivalent of main.evaluate_config: evaluates every config in the
+    batch, stage by stage, over the configs still valid at each stage.
+
+    Args:
+        batch: ConfigBatch
+        aircraft: optional (cost, endurance in sec) per config, as returned by
+            aircraft_stage, to reuse instead of recomputing.
+        solver: SolverSettings for the effective sweep width.
+        neighbor: optional index per config of the config to warm start its
+            effective sweep width from, -1 for none (see
+            continuation.grid_neighbors).
+        trace: optional ConvergenceTrace recording the effective sweep width
+            iterations, by index into the batch.
+
+    Returns:
+        BatchResult
+    '''
+    result = BatchResult.empty(len(batch))
+    result.valid, result.reason = validate_batch(batch)
+
+    ok = np.flatnonzero(result.valid)
+    b  = batch.take(ok)
+
+    # Aircraft
+    if aircraft is None:
+        ac_cost, endurance_sec = aircraft_stage(b.mach, b.altitude_kft, b.sensor_assumption_cost, b.performance_model)
+    else:
+        ac_cost, endurance_sec = aircraft[0][ok], aircraft[1][ok]
+    result.ac_cost[ok]          = ac_cost
+    result.ac_endurance_sec[ok] = endurance_sec
+
+    # Sensor performance
+    slant = sensor_stage(
+        b.sensor_assumption_fov_deg,
+        b.sensor_assumption_resolution,
+        b.sensor_assumption_johnson_req,
+        b.target_dims
+    )
+    result.slant_detection_range[ok] = slant
+
+    # Aircraft sensor coverage
+    search_ok, ground, downtrack, xtrack = search_stage(
+        b.altitude_kft*1000/FEET_PER_METER,
+        slant,
+        b.sensor_assumption_fov_deg
+    )
+    result.search_perf_valid[ok] = search_ok
+    result.valid[ok[~search_ok]]  = False
+    result.reason[ok[~search_ok]] = REASON_SEARCH_PERF
+
+    keep = np.flatnonzero(search_ok)
+    ok   = ok[keep]
+    b, ac_cost, endurance_sec = b.take(keep), ac_cost[keep], endurance_sec[keep]
+    ground, downtrack, xtrack = ground[keep], downtrack[keep], xtrack[keep]
+    result.ground_detection_range[ok]    = ground
+    result.downtrack_detection_range[ok] = downtrack
+    result.xtrack_detection_width[ok]    = xtrack
+
+    # Effective sweep width
+    sweep_width_inputs = (
+        b.mach, b.manx_bank_angle_rad, b.manx_decel_gees, b.manx_min_mach,
+        b.aoi_length, b.target_dims, b.target_max_speed,
+        downtrack, xtrack
+    )
+    continuous = b.aspect_model == 'continuous'
+    aspect_inputs = None
+    if continuous.any():
+        aspect_inputs = AspectInputs(
+            continuous            = continuous,
+            slant_detection_range = slant[keep],
+            alt_m                 = b.altitude_kft*1000/FEET_PER_METER,
+            half_fov_h_rad        = b.sensor_assumption_fov_deg[:, 0]*RAD_PER_DEG/2
+        )
+    if neighbor is None:
+        eff_width, turn_time, iterations, converged = sweep_width_stage(
+            *sweep_width_inputs, solver=solver, trace=trace, ids=ok, aspect_inputs=aspect_inputs
+        )
+    else:
+        # Neighbors that dropped out before this stage can't seed anything
+        local     = np.full(len(batch), -1)
+        local[ok] = np.arange(len(ok))
+        local_nb  = np.where(neighbor[ok] >= 0, local[np.maximum(neighbor[ok], 0)], -1)
+        eff_width, turn_time, iterations, converged, seeded, fallback = sweep_width_continuation_stage(
+            *sweep_width_inputs, neighbor=local_nb, solver=solver, trace=trace, ids=ok,
+            aspect_inputs=aspect_inputs
+        )
+        result.sweep_width_seeded[ok]   = seeded
+        result.sweep_width_fallback[ok] = fallback
+    result.sweep_width_iterations[ok] = iterations
+    result.sweep_width_converged[ok]  = converged
+
+    # Aspect of the target that sets the width at the solution
+    _, result.binding_aob_rad[ok] = aspect.limiting_sweep_width(
+        turn_time, b.mach, b.aoi_length, b.target_dims, b.target_max_speed, xtrack, aspect_inputs
+    )
+
+    neg = eff_width <= 0
+    result.valid[ok[neg]]  = False
+    result.reason[ok[neg]] = REASON_NEG_SWEEP_WIDTH
+
+    keep = np.flatnonzero(~neg)
+    ok   = ok[keep]
+    result.effective_sweep_width[ok] = eff_width[keep]
+    result.ac_turn_time[ok]          = turn_time[keep]
+
+    # Search rate
+    b = b.take(keep)
+    search_rate = search_rate_stage(
+        b.mach, endurance_sec[keep], b.aoi_length, b.aoi_ingress, b.aoi_egress,
+        turn_time[keep], eff_width[keep]
+    )
+    result.search_rate[ok] = search_rate
+
+    no_legs = np.isnan(search_rate)
+    result.valid[ok[no_legs]]  = False
+    result.reason[ok[no_legs]] = REASON_NO_SEARCH_LEGS
+
+    # Fleet size
+    onsta = onsta_stage(b.aoi_length, b.aoi_width, search_rate, b.aoi_revisit_time_hr)
+    result.onsta_req_n[ok]    = onsta
+    result.onsta_req_cost[ok] = onsta*ac_cost[keep]
+
+    return result
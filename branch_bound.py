@@ -0,0 +1,476 @@
+from dataclasses import dataclass, replace
+import math
+import numpy as np
+from constants import *
+from lib import validate_config
+from performance import TabulatedModel, get_model
+from batch import ConfigBatch, sensor_stage, evaluate_batch
+
+
+# Branch-and-bound global minimization of onsta_req_cost over a rectangle of
+# (altitude, mach), for one or more template configs (e.g. one per sensor).
+#
+# The rectangle is split into cells. Each cell gets a lower bound on the cost
+# of every config in it, by evaluating the model chain on intervals (one
+# interval per quantity, enclosing its value over the cell), mirroring lib.py
+# like kernels.py and gradients.py do. Cells whose bound can't beat the best
+# design found so far (the incumbent) are discarded; the others have their
+# centre evaluated, which may improve the incumbent, and are bisected in both
+# dimensions. It stops when every remaining cell's bound is within the
+# tolerance of the incumbent (the incumbent is then provably optimal, to that
+# tolerance), or cells reach max_depth bisections.
+#
+# Each generation of cells is bounded and evaluated together, vectorized like
+# batch.py.
+#
+# The effective sweep width is enclosed by iterating W <- W & G(W), with G the
+# limiting sweep width of the turn-around time at lateral offset W, starting
+# from (0, cross-track width]: every self-consistent width of every config in
+# the cell stays inside W. Branches (the min mach clamp, wide or narrow turn,
+# the floor on the number of working segments) that aren't decided over a
+# cell take the hull of both sides. Infeasible configs count as infinitely
+# expensive, so the bounds are over the feasible part of each cell, and cells
+# that are provably infeasible are discarded.
+#
+# The bounds are for the self-consistent sweep width, so designs are evaluated
+# with a tight solver (BNB_SOLVER); with the default 1% tolerance, the model's
+# cost can differ from the self-consistent one by about as much. Intervals
+# aren't outwardly rounded, so bounds hold to floating point rounding.
+#
+# Only the 'limiting_cases' aspect model is supported. Performance models
+# must be PolynomialModels, TabulatedModels or accept Intervals.
+
+BNB_SOLVER = SolverSettings(method='secant', tol=1e-10, max_iter=50)
+
+SWEEP_WIDTH_ITERATIONS = 40   # max W <- W & G(W) iterations per bound
+SWEEP_WIDTH_RTOL       = 1e-6 # stop once W changes less than this, relatively
+
+
+class Interval:
+    '''
+    Arrays of intervals [lo, hi], with interval arithmetic. Operations take
+    Intervals or plain numbers/arrays (degenerate intervals).
+    '''
+    __slots__ = ('lo', 'hi')
+    __array_ufunc__ = None # so array <op> Interval uses Interval's reflected ops
+
+    def __init__(self, lo, hi=None):
+        self.lo = np.asarray(lo, dtype=float)
+        self.hi = self.lo if hi is None else np.asarray(hi, dtype=float)
+
+    @staticmethod
+    def _lift(other) -> 'Interval':
+        return other if isinstance(other, Interval) else Interval(other)
+
+    def __add__(self, other):
+        other = self._lift(other)
+        return Interval(self.lo + other.lo, self.hi + other.hi)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = self._lift(other)
+        return Interval(self.lo - other.hi, self.hi - other.lo)
+
+    def __rsub__(self, other):
+        return self._lift(other) - self
+
+    def __neg__(self):
+        return Interval(-self.hi, -self.lo)
+
+    def __mul__(self, other):
+        other = self._lift(other)
+        # fmin/fmax skip the NaNs of 0*inf
+        with np.errstate(invalid='ignore'):
+            p = (self.lo*other.lo, self.lo*other.hi, self.hi*other.lo, self.hi*other.hi)
+        return Interval(
+            np.fmin(np.fmin(p[0], p[1]), np.fmin(p[2], p[3])),
+            np.fmax(np.fmax(p[0], p[1]), np.fmax(p[2], p[3]))
+        )
+
+    __rmul__ = __mul__
+
+    def reciprocal(self) -> 'Interval':
+        # 1/0 is inf: [0, b] -> [1/b, inf]. Straddling 0 -> everything.
+        straddles = (self.lo < 0) & (self.hi > 0)
+        with np.errstate(divide='ignore'):
+            lo, hi = 1/self.hi, 1/self.lo
+        return Interval(np.where(straddles, -np.inf, lo), np.where(straddles, np.inf, hi))
+
+    def __truediv__(self, other):
+        return self*self._lift(other).reciprocal()
+
+    def __rtruediv__(self, other):
+        return self._lift(other)*self.reciprocal()
+
+    def __pow__(self, k: int):
+        if not (isinstance(k, int) and k >= 0):
+            raise TypeError('Interval powers must be non-negative integers')
+        lo, hi = self.lo**k, self.hi**k
+        if k % 2:
+            return Interval(lo, hi)
+        straddles = (self.lo < 0) & (self.hi > 0)
+        return Interval(np.where(straddles, 0.0, np.minimum(lo, hi)), np.maximum(lo, hi))
+
+    def __getitem__(self, idx) -> 'Interval':
+        return Interval(self.lo[idx], self.hi[idx])
+
+    @property
+    def width(self) -> np.ndarray:
+        return self.hi - self.lo
+
+    def __repr__(self):
+        return f'Interval({self.lo!r}, {self.hi!r})'
+
+
+def _increasing(f, x: Interval) -> Interval:
+    return Interval(f(x.lo), f(x.hi))
+
+
+def _decreasing(f, x: Interval) -> Interval:
+    return Interval(f(x.hi), f(x.lo))
+
+
+def sqrt(x: Interval) -> Interval:
+    return _increasing(lambda v: np.sqrt(np.maximum(v, 0)), x)
+
+
+def acos(x: Interval) -> Interval:
+    return _decreasing(lambda v: np.arccos(np.clip(v, -1, 1)), x)
+
+
+def floor(x: Interval) -> Interval:
+    return _increasing(np.floor, x)
+
+
+def minimum(a: Interval, b: Interval) -> Interval:
+    return Interval(np.minimum(a.lo, b.lo), np.minimum(a.hi, b.hi))
+
+
+def hull(a: Interval, b: Interval) -> Interval:
+    return Interval(np.minimum(a.lo, b.lo), np.maximum(a.hi, b.hi))
+
+
+def intersect(a: Interval, b: Interval) -> Interval:
+    '''
+    Empty where lo > hi.
+    '''
+    return Interval(np.maximum(a.lo, b.lo), np.minimum(a.hi, b.hi))
+
+
+def select(certainly: np.ndarray, certainly_not: np.ndarray, a: Interval, b: Interval) -> Interval:
+    '''
+    a where a branch is certainly taken, b where it certainly isn't, the hull
+    of both where it's undecided over the cell.
+    '''
+    h = hull(a, b)
+    return Interval(
+        np.where(certainly, a.lo, np.where(certainly_not, b.lo, h.lo)),
+        np.where(certainly, a.hi, np.where(certainly_not, b.hi, h.hi))
+    )
+
+
+def _tabulated(model: TabulatedModel, table, mach: Interval, alt_kft: Interval) -> Interval:
+    # Bilinear interpolation is bilinear on each grid cell, so its extremes
+    # over a rectangle are at its corners or where it crosses grid lines
+    def candidates(x: Interval, grid):
+        nodes = np.broadcast_to(np.asarray(grid, dtype=float), (len(x.lo), len(grid)))
+        return np.clip(np.column_stack([x.lo, x.hi, nodes]), x.lo[:, None], x.hi[:, None])
+
+    xs, ys = candidates(mach, model.machs), candidates(alt_kft, model.alts_kft)
+    values = model._interpolate(table, xs[:, :, None], ys[:, None, :])
+    return Interval(values.min(axis=(1, 2)), values.max(axis=(1, 2)))
+
+
+def _performance(names: np.ndarray, mach: Interval, alt_kft: Interval) -> tuple[Interval, Interval]:
+    '''
+    Endurance (hr) and airframe cost over each cell, like
+    performance.evaluate_models.
+    '''
+    endurance = Interval(np.empty(len(names)), np.empty(len(names)))
+    cost      = Interval(np.empty(len(names)), np.empty(len(names)))
+
+    for name in set(names):
+        mask  = names == name
+        model = get_model(name)
+        m, a  = mach[mask], alt_kft[mask]
+        if isinstance(model, TabulatedModel):
+            e, c = _tabulated(model, model.endurance_table, m, a), _tabulated(model, model.cost_table, m, a)
+        else:
+            e, c = model.endurance_hr(m, a), model.cost(m, a)
+            if not (isinstance(e, Interval) and isinstance(c, Interval)):
+                raise ValueError(f'Performance model {name!r} can not be bounded over intervals')
+        for out, value in ((endurance, e), (cost, c)):
+            out.lo[mask], out.hi[mask] = value.lo, value.hi
+
+    return endurance, cost
+
+
+def _straight_accelerating_leg(mach0: Interval, dist: Interval, accel, min_mach) -> tuple[Interval, Interval]:
+    # lib.calc_straight_accelerating_leg, with accel < 0 (decelerating)
+    v0 = mach0*MACH_M_PER_SEC
+    t_min_mach = (min_mach - mach0)*MACH_M_PER_SEC/(accel*GEE)
+
+    # Smaller positive root of 1/2*a*t^2 + v0*t - dist, written to be
+    # monotone in v0 and dist; inf where the body would stop first
+    discriminant = v0**2 + 2*accel*GEE*dist
+    stops = discriminant.hi < 0
+    t_dist = 2*dist/(v0 + sqrt(discriminant))
+    t_dist = Interval(np.where(stops, np.inf, t_dist.lo), np.where(discriminant.lo < 0, np.inf, t_dist.hi))
+
+    clamped     = t_min_mach.hi < t_dist.lo
+    not_clamped = t_min_mach.lo >= t_dist.hi
+
+    # Reaches min_mach: decelerate, then cruise the rest of dist at mach0 (d2
+    # is the distance decelerating)
+    d2 = ((min_mach*MACH_M_PER_SEC)**2 - v0**2)/(2*accel*GEE)
+    time_clamped = t_min_mach + dist/v0 - d2/v0
+
+    # Doesn't: t_dist, which is then no more than t_min_mach
+    time_free  = Interval(t_dist.lo, np.minimum(t_dist.hi, t_min_mach.hi))
+    machf_free = sqrt(discriminant)/MACH_M_PER_SEC
+
+    time  = select(clamped, not_clamped, time_clamped, time_free)
+    machf = select(clamped, not_clamped, Interval(min_mach), machf_free)
+    return time, machf
+
+
+def _turnaround_time(lateral_offset: Interval, leg_time: Interval, manx_mach: Interval, bank_angle_rad) -> Interval:
+    # lib.calc_coordinated_level_turnaround_time, given the deceleration leg
+    tan_bank = np.tan(bank_angle_rad)
+    v = manx_mach*MACH_M_PER_SEC
+    radius = v**2/GEE/tan_bank
+
+    wide   = lateral_offset.lo >= (2*radius).hi
+    narrow = lateral_offset.hi < (2*radius).lo
+
+    # 2R <= S: semi-circle plus straight segment, (S - 2R)/v + pi*R/v
+    t_wide = lateral_offset/v + (math.pi - 2)*v/GEE/tan_bank
+
+    # 2R > S: portions of three circles, R*(pi + 4*acos((R + S/2)/2R))/v
+    t_narrow = v/GEE/tan_bank*(math.pi + 4*acos(0.5 + lateral_offset/(4*radius)))
+
+    return 2*leg_time + select(wide, narrow, t_wide, t_narrow)
+
+
+def _limiting_sweep_width(turn_time: Interval, mach: Interval, aoi_length, target_dims, target_max_speed, xtrack: Interval) -> Interval:
+    # lib.calc_limiting_sweep_width, 'limiting_cases'
+    time = (2*aoi_length)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_beaming_tgt = xtrack[:, 0] - time*(target_max_speed*KTS_IN_M_PER_SEC)
+
+    aob = np.arccos(target_dims[:, 1]/target_dims[:, 0])
+    tgt_speed_cross_track = target_max_speed*np.cos(aob)
+    tgt_speed_down_track  = target_max_speed*np.sin(aob)
+    time = (2*aoi_length - tgt_speed_down_track)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_glancing_tgt = xtrack[:, 1] - time*(tgt_speed_cross_track*KTS_IN_M_PER_SEC)
+
+    return minimum(sweep_width_beaming_tgt, sweep_width_glancing_tgt)
+
+
+def bound_cost(batch: ConfigBatch, altitude_kft: Interval, mach: Interval) -> Interval:
+    '''
+    Interval enclosing onsta_req_cost of every feasible config of each cell:
+    the batch's configs with altitude and mach anywhere in the cell's
+    intervals. inf where no config of the cell is feasible.
+
+    Args:
+        batch (ConfigBatch): one config per cell (altitude and mach unused).
+        altitude_kft, mach (Interval): the cells.
+
+    Returns:
+        Interval
+    '''
+    b = batch
+    n = len(b)
+    infeasible = np.zeros(n, dtype=bool)
+
+    # Aircraft
+    endurance_hr, airframe_cost = _performance(b.performance_model, mach, altitude_kft)
+    ac_cost       = airframe_cost + b.sensor_assumption_cost
+    endurance_sec = endurance_hr*SEC_PER_HR
+
+    # Sensor and search performance, over the altitudes below the slant
+    # detection ranges
+    slant = sensor_stage(
+        b.sensor_assumption_fov_deg, b.sensor_assumption_resolution,
+        b.sensor_assumption_johnson_req, b.target_dims
+    )
+    alt_m = altitude_kft*(1000/FEET_PER_METER)
+    ceiling = slant.min(axis=1)
+    infeasible |= alt_m.lo > ceiling
+    alt_m = Interval(np.minimum(alt_m.lo, ceiling), np.minimum(alt_m.hi, ceiling))
+
+    half_fov_h = b.sensor_assumption_fov_deg[:, 0]*RAD_PER_DEG/2
+    ground     = [sqrt(slant[:, k]**2 - alt_m**2) for k in range(2)]
+    downtrack  = ground[1]*np.cos(half_fov_h)
+    xtrack_lo  = np.stack([2*g.lo*np.sin(half_fov_h) for g in ground], -1)
+    xtrack_hi  = np.stack([2*g.hi*np.sin(half_fov_h) for g in ground], -1)
+    xtrack     = Interval(xtrack_lo, xtrack_hi)
+
+    # Effective sweep width: enclose the positive fixed points
+    leg_time, manx_mach = _straight_accelerating_leg(mach, downtrack, b.manx_decel_gees, b.manx_min_mach)
+    width = Interval(np.zeros(n), xtrack_hi[:, 1])
+    for _ in range(SWEEP_WIDTH_ITERATIONS):
+        turn_time = _turnaround_time(width, leg_time, manx_mach, b.manx_bank_angle_rad)
+        new = intersect(width, _limiting_sweep_width(
+            turn_time, mach, b.aoi_length, b.target_dims, b.target_max_speed, xtrack
+        ))
+        empty = (new.lo > new.hi) | (new.hi <= 0)
+        infeasible |= empty
+        new = Interval(np.where(empty, 0.0, new.lo), np.where(empty, 0.0, new.hi))
+        done = np.all((width.width - new.width) <= SWEEP_WIDTH_RTOL*np.maximum(new.hi, 1))
+        width = new
+        if done:
+            break
+    turn_time = _turnaround_time(width, leg_time, manx_mach, b.manx_bank_angle_rad)
+
+    # Search rate (calc_ac_search_rate), over the endurances that reach the AOI
+    time_segment_terminal = (b.aoi_ingress + b.aoi_egress + 2*b.aoi_length)/mach/MACH_M_PER_SEC
+    time_segment_working  = 2*turn_time + 2*b.aoi_length/mach/MACH_IN_M_PER_HR
+    slack = endurance_sec - time_segment_terminal
+    infeasible |= slack.hi < 0
+    slack = Interval(np.maximum(slack.lo, 0), np.maximum(slack.hi, 0))
+
+    # 2*n*w*L/flight_time, with flight_time/n = working + (terminal - working)/n
+    # so n_segments appears once (the bound over a cell straddling a step of
+    # the floor is then the lower step's)
+    n_segments  = 1 + floor(slack/time_segment_working)
+    time_per_segment = time_segment_working + (time_segment_terminal - time_segment_working)/n_segments
+    search_rate = 2*width*b.aoi_length/time_per_segment
+
+    # Fleet size (calc_onsta_requirement) and cost
+    onsta = (b.aoi_length*b.aoi_width)/(b.aoi_revisit_time_hr*SEC_PER_HR)/search_rate
+    cost  = onsta*ac_cost
+
+    return Interval(np.where(infeasible, np.inf, cost.lo), np.where(infeasible, np.inf, cost.hi))
+
+
+@dataclass
+class BranchAndBoundResult:
+    '''
+    Best design found, and a lower bound on the minimum cost over the whole
+    rectangle (the incumbent is optimal to within the gap).
+    '''
+    config:         Config # None if nothing feasible was found
+    onsta_req_cost: float
+    lower_bound:    float
+    evaluations:    int    # configs evaluated
+    bounds:         int    # cells bounded
+    generations:    int
+    unresolved:     int    # cells left at max_depth with bounds below the incumbent
+
+    @property
+    def gap(self) -> float:
+        return self.onsta_req_cost - self.lower_bound
+
+
+def branch_and_bound(
+        templates: Config | list[Config],
+        altitude_range: tuple[float, float],
+        mach_range: tuple[float, float],
+        rtol: float = 1e-4,
+        atol: float = 0.0,
+        initial: tuple[int, int] = (8, 8),
+        max_depth: int = 20,
+        solver: SolverSettings = BNB_SOLVER
+    ) -> BranchAndBoundResult:
+    '''
+    Globally minimize onsta_req_cost over altitude_range x mach_range, for
+    each template (everything but altitude and mach).
+
+    Args:
+        templates (Config | list[Config]): e.g. one per sensor.
+        altitude_range (tuple[float, float]): kft.
+        mach_range (tuple[float, float]): must be above the templates'
+            manx_min_mach.
+        rtol, atol (float): discard cells whose lower bound is within
+            max(atol, rtol*incumbent) of the incumbent.
+        initial (tuple[int, int]): starting cells per template, (altitude,
+            mach).
+        max_depth (int): bisections of the initial cells, at most.
+        solver (SolverSettings): for the designs' effective sweep width.
+
+    Returns:
+        BranchAndBoundResult
+    '''
+    templates = [templates] if isinstance(templates, Config) else list(templates)
+    for template in templates:
+        valid, reason = validate_config(template)
+        if not valid:
+            raise ValueError(reason)
+        if template.aspect_model != 'limiting_cases':
+            raise ValueError(f"Branch and bound supports the 'limiting_cases' aspect model, not {template.aspect_model!r}")
+        if not template.manx_decel_gees < 0:
+            raise ValueError(f'manx_decel_gees must be < 0, is {template.manx_decel_gees}')
+        if not mach_range[0] > template.manx_min_mach:
+            raise ValueError(f'Mach range must be above manx_min_mach, {template.manx_min_mach}')
+    base = ConfigBatch.from_configs(templates)
+
+    # Initial cells: a grid per template
+    a_edges = np.linspace(*altitude_range, initial[0] + 1)
+    m_edges = np.linspace(*mach_range, initial[1] + 1)
+    k, i, j = (x.ravel() for x in np.meshgrid(
+        np.arange(len(templates)), np.arange(initial[0]), np.arange(initial[1]), indexing='ij'
+    ))
+    cells = (k, a_edges[i], a_edges[i + 1], m_edges[j], m_edges[j + 1])
+
+    best, best_at = math.inf, None
+    pruned_bound = math.inf # lowest bound of the cells discarded
+    unresolved_bounds = []
+    evaluations = bounds = generations = 0
+
+    def threshold():
+        return best - max(atol, rtol*abs(best)) if math.isfinite(best) else math.inf
+
+    for depth in range(max_depth + 1):
+        k, a_lo, a_hi, m_lo, m_hi = cells
+        if not len(k):
+            break
+        generations += 1
+
+        batch = base.take(k)
+        lower = bound_cost(batch, Interval(a_lo, a_hi), Interval(m_lo, m_hi)).lo
+        bounds += len(k)
+        live = lower < threshold()
+        pruned_bound = min(pruned_bound, lower[~live].min(initial=math.inf))
+
+        # Evaluate the surviving cells' centres
+        idx = np.flatnonzero(live)
+        a_mid, m_mid = (a_lo[idx] + a_hi[idx])/2, (m_lo[idx] + m_hi[idx])/2
+        result = evaluate_batch(replace(batch.take(idx), altitude_kft=a_mid, mach=m_mid), solver=solver)
+        evaluations += len(idx)
+        cost = np.where(result.valid, result.onsta_req_cost, np.inf)
+        if len(idx) and cost.min() < best:
+            c = int(np.argmin(cost))
+            best, best_at = float(cost[c]), (int(k[idx[c]]), float(a_mid[c]), float(m_mid[c]))
+
+        pruned_bound = min(pruned_bound, lower[live & (lower >= threshold())].min(initial=math.inf))
+        live &= lower < threshold()
+        if depth == max_depth:
+            unresolved_bounds.append(lower[live])
+            break
+
+        # Bisect the rest in both dimensions
+        idx = np.flatnonzero(live)
+        k, a_lo, a_hi, m_lo, m_hi = (x[idx] for x in cells)
+        a_mid, m_mid = (a_lo + a_hi)/2, (m_lo + m_hi)/2
+        cells = (
+            np.tile(k, 4),
+            np.concatenate([a_lo, a_mid, a_lo, a_mid]),
+            np.concatenate([a_mid, a_hi, a_mid, a_hi]),
+            np.concatenate([m_lo, m_lo, m_mid, m_mid]),
+            np.concatenate([m_mid, m_mid, m_hi, m_hi]),
+        )
+
+    unresolved = np.concatenate(unresolved_bounds) if unresolved_bounds else np.empty(0)
+    return BranchAndBoundResult(
+        config = None if best_at is None else replace(
+            templates[best_at[0]], altitude_kft=best_at[1], mach=best_at[2]
+        ),
+        onsta_req_cost = best,
+        lower_bound    = float(min(best, pruned_bound, unresolved.min(initial=math.inf))),
+        evaluations    = evaluations,
+        bounds         = bounds,
+        generations    = generations,
+        unresolved     = len(unresolved)
+    )
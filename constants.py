@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
 from enum import Enum, auto
 import math
+from performance import DEFAULT_PERFORMANCE_MODEL, get_model
 
 # Constants
 ## Physics
@@ -15,6 +16,9 @@ KTS_IN_M_PER_SEC  = 0.51444       # (meters/s)/knot
 FEET_PER_METER    = 3.2808        # ft/m
 ## Angles
 RAD_PER_DEG       = 2*math.pi/360 # radians/degree
+## Target aspect models for the limiting sweep width (see aspect.py)
+ASPECT_MODELS        = ('limiting_cases', 'continuous')
+DEFAULT_ASPECT_MODEL = 'limiting_cases'
 
 # Data Classes
 @dataclass(frozen=True)
@@ -49,6 +53,20 @@ class AircraftSearchPerformance:
     downtrack_detection_range:  tuple[float, float] = None
     xtrack_detection_width:     tuple[float, float] = None
 
+@dataclass(frozen=True)
+class SolverSettings:
+    method:   str   = 'fixed_point' # see solvers.SOLVERS
+    tol:      float = 0.01          # relative self-consistency tolerance
+    max_iter: int   = 25            # iterations after the first
+
+@dataclass(frozen=True)
+class SweepWidthSolution:
+    effective_sweep_width: float
+    turn_time:             float
+    iterations:            int   # evaluations of the turn-around time
+    converged:             bool
+    binding_aob_rad:       float = None # target aspect that sets the width
+
 @dataclass
 class Result:
     valid: bool
@@ -71,6 +89,7 @@ class Aircraft:
     manx_min_mach:       float
     sensor:              Sensor
     sensor_assumption:   SensorAssumption
+    performance_model:   str   = DEFAULT_PERFORMANCE_MODEL
     alt_m:               float = field(init=False)
     cost:                float = field(init=False) 
     endurance_hr:        float = field(init=False)
@@ -83,6 +102,9 @@ class Aircraft:
         Note: The stipulated endurance model takes altitude in kft, but I plan to 
         work in SI units, so I'm accepting meters and converting to kft.
 
+        The model itself comes from the performance model registry (see
+        performance.py), selected by self.performance_model.
+
         Args:
             mach (float): aircraft speed in mach.
             alt_m (float): aircraft altitude in kft.
@@ -92,7 +114,7 @@ class Aircraft:
         '''
 
         # alt_kft = self.alt_m*FEET_PER_METER/1000
-        return -18.75*self.mach**2 + 8.0893*self.mach + 0.01*self.alt_kft**2 + 0.05*self.alt_kft + 9.2105
+        return get_model(self.performance_model).endurance_hr(self.mach, self.alt_kft)
 
     def calc_cost(self) -> float:
         '''
@@ -101,6 +123,10 @@ class Aircraft:
         Note: The stipulated cost model takes altitude in kft, but I plan to 
         work in SI units, so I'm accepting meters and converting to kft.
 
+        Airframe cost comes from the performance model registry (see
+        performance.py), selected by self.performance_model. Sensor cost is 
+        added on top.
+
         Args:
             mach (float): aircraft speed in mach.
             alt_m (float): aircraft altitude in kft.
@@ -110,7 +136,7 @@ class Aircraft:
             float: aircraft cost in millions of dollars.
         '''
         
-        return 50*self.mach**2 - 35*self.mach + 0.03*self.alt_kft**2 - 0.2*self.alt_kft + 11 + self.sensor_assumption.cost
+        return get_model(self.performance_model).cost(self.mach, self.alt_kft) + self.sensor_assumption.cost
 
 
     def __post_init__(self):
@@ -140,6 +166,12 @@ class Config:
     aoi: AOI
     aoi_revisit_time_hr: float
 
+    # Aircraft performance model (name in performance.PERFORMANCE_MODELS)
+    performance_model: str = DEFAULT_PERFORMANCE_MODEL
+
+    # Target aspects the sweep width has to cover (one of ASPECT_MODELS)
+    aspect_model: str = DEFAULT_ASPECT_MODEL
+
 @dataclass
 class ModelResult:
     config: Config
@@ -153,4 +185,7 @@ class ModelResult:
     search_rate: float                        = None
     onsta_req_n: float                        = None
     onsta_req_cost: float                     = None
+    sweep_width_iterations: int               = None
+    sweep_width_converged: bool               = None
+    binding_aob_rad: float                    = None
 
@@ -0,0 +1,209 @@
+from dataclasses import dataclass, fields
+import numpy as np
+from constants import *
+import solvers
+
+
+# Warm-start continuation for ordered sweeps: the converged sweep width at a
+# neighboring grid point (e.g. the previous mach at the same altitude and
+# sensor) is usually a far better starting offset than the cold start, the
+# cross-track detection width vs. the target's height.
+#
+# Points are solved in waves: wave 0 is every point without a neighbor
+# (cold start), wave k every point whose neighbor is in wave k-1. Each wave is
+# solved as one batch. Feasibility is still decided at the cold start (the
+# first evaluation, as in calc_effective_sweep_width), and a warm start that
+# doesn't converge, or comes out infeasible, is re-solved from the cold start,
+# so warm starting never changes which points are feasible. Iteration counts
+# include the feasibility check and the wasted warm iterations of fallbacks.
+#
+# The check costs each seeded point one evaluation. On main.py's grid,
+# fixed_point (tol 0.01) still saves 4% of turn-around evaluations continuing
+# along mach and 17% along altitude; aitken and secant (tol 1e-6) converge in
+# a few evaluations anyway and lose ~20%, and brentq brackets from the
+# starting point, so they aren't warm started (CONTINUATION_METHODS).
+# Run with compare=True to see the iterations saved for a given grid.
+
+# Solvers that are warm started; the others solve every point cold
+CONTINUATION_METHODS = ('fixed_point',)
+
+
+@dataclass
+class ContinuationStats:
+    waves:           int   # sequential batches solved
+    seeded:          int   # points solved from a neighbor's solution
+    fallbacks:       int   # warm starts re-solved from the cold start
+    iterations:      int   # turn-around evaluations, including fallbacks
+    cold_iterations: int | None = None # same points, all cold started
+
+    @property
+    def iterations_saved(self) -> int | None:
+        if self.cold_iterations is None:
+            return None
+        return self.cold_iterations - self.iterations
+
+
+def grid_neighbors(batch, along: str = 'mach', descending: bool = False) -> np.ndarray:
+    '''
+    For each point in the batch, the index of its neighbor along one scalar
+    field: the point with the next smaller value (next larger if descending)
+    and every other field equal. -1 for the first point of each line.
+
+    Args:
+        batch: ConfigBatch
+        along (str): ConfigBatch field the sweep is ordered along.
+        descending (bool): continue from larger to smaller values.
+
+    Returns:
+        np.ndarray: neighbor index per point.
+    '''
+    others = []
+    for f in fields(batch):
+        if f.name == along:
+            continue
+        values = getattr(batch, f.name)
+        values = values.reshape(len(batch), -1)
+        for column in values.T:
+            # Factorize so object columns (sensor, names) sort too
+            _, codes = np.unique(column.astype(str) if column.dtype == object else column, return_inverse=True)
+            others.append(codes)
+
+    key = getattr(batch, along)
+    key = -key if descending else key
+    order = np.lexsort([key] + others[::-1])
+
+    neighbor = np.full(len(batch), -1)
+    same_line = np.ones(len(order) - 1, dtype=bool) if len(order) else np.ones(0, dtype=bool)
+    for codes in others:
+        same_line &= codes[order[1:]] == codes[order[:-1]]
+    neighbor[order[1:][same_line]] = order[:-1][same_line]
+    return neighbor
+
+
+def continuation_waves(neighbor: np.ndarray) -> list[np.ndarray]:
+    '''
+    Group points into waves that can be solved together: every point's
+    neighbor is in the previous wave.
+    '''
+    depth = np.full(len(neighbor), -1)
+    depth[neighbor < 0] = 0
+    wave = 0
+    while (depth < 0).any():
+        nxt = (depth < 0) & (depth[np.maximum(neighbor, 0)] == wave) & (neighbor >= 0)
+        if not nxt.any():
+            raise ValueError('Neighbor chain has a cycle')
+        wave += 1
+        depth[nxt] = wave
+
+    return [np.flatnonzero(depth == k) for k in range(wave + 1)]
+
+
+def solve_continuation(g, w_cold, neighbor, method='fixed_point', tol=0.01, max_iter=25):
+    '''
+    solvers.solve, warm starting each point from its neighbor's solution.
+
+    Args:
+        g: map (idx, offset) -> (sweep width, turn-around time).
+        w_cold (np.ndarray): cold start offsets.
+        neighbor (np.ndarray): neighbor index per point, -1 for none.
+        method, tol, max_iter: as solvers.solve.
+
+    Returns:
+        tuple: (sweep width, turn-around time, iterations, converged, seeded,
+        fallback) where seeded marks the points whose warm start was kept and
+        fallback the ones re-solved cold.
+    '''
+    if method not in CONTINUATION_METHODS:
+        neighbor = np.full(len(w_cold), -1)
+
+    n = len(w_cold)
+    width      = np.full(n, np.nan)
+    turn_time  = np.full(n, np.nan)
+    iterations = np.zeros(n, dtype=int)
+    converged  = np.zeros(n, dtype=bool)
+    seeded     = np.zeros(n, dtype=bool)
+    fallback   = np.zeros(n, dtype=bool)
+
+    def solve_subset(idx, w0):
+        return solvers.solve(lambda local, offset: g(idx[local], offset), w0, method, tol, max_iter)
+
+    for idx in continuation_waves(neighbor):
+        nb = neighbor[idx]
+        usable = nb >= 0
+        usable[usable] = converged[nb[usable]] & (width[nb[usable]] > 0)
+
+        # The cold start decides feasibility (a config whose first width is
+        # <= 0 is infeasible, as in calc_effective_sweep_width), so check it
+        # before warm starting. Configs that fail it are done, exactly as a
+        # cold solve would leave them; only the iterations are warm started.
+        gated = idx[usable]
+        gate_width, gate_turn = g(gated, w_cold[gated])
+        infeasible = gate_width <= 0
+        done = gated[infeasible]
+        width[done], turn_time[done] = gate_width[infeasible], gate_turn[infeasible]
+        iterations[done] = 1
+        converged[done]  = True
+        usable[usable]   = ~infeasible
+
+        solve = idx[~np.isin(idx, done)]
+        warm  = usable[~np.isin(idx, done)]
+        w0 = w_cold[solve].copy()
+        w0[warm] = width[neighbor[solve[warm]]]
+        width[solve], turn_time[solve], iterations[solve], converged[solve] = solve_subset(solve, w0)
+        iterations[solve[warm]] += 1 # the gate evaluation
+        seeded[solve] = warm
+
+        # Warm starts that didn't converge to a feasible width are re-solved
+        # cold, which decides their feasibility as a cold solve would
+        retry = solve[warm & (~converged[solve] | ~(width[solve] > 0))]
+        if len(retry):
+            wasted = iterations[retry]
+            width[retry], turn_time[retry], iterations[retry], converged[retry] = solve_subset(retry, w_cold[retry])
+            iterations[retry] += wasted
+            seeded[retry]   = False
+            fallback[retry] = True
+
+    return width, turn_time, iterations, converged, seeded, fallback
+
+
+def evaluate_continuation(
+        batch,
+        along: str = 'mach',
+        descending: bool = False,
+        solver: SolverSettings = SolverSettings(),
+        compare: bool = False
+    ):
+    '''
+    evaluate_batch with the sweep width warm started along an ordered sweep
+    dimension.
+
+    Args:
+        batch: ConfigBatch
+        along (str): ConfigBatch field to continue along (see grid_neighbors).
+        descending (bool): continue from larger to smaller values.
+        solver (SolverSettings)
+        compare (bool): also solve every point cold, to report the iterations
+            saved (costs a second sweep width stage).
+
+    Returns:
+        tuple[BatchResult, ContinuationStats]
+    '''
+    from batch import evaluate_batch
+
+    neighbor = grid_neighbors(batch, along, descending)
+    result   = evaluate_batch(batch, solver=solver, neighbor=neighbor)
+
+    cold_iterations = None
+    if compare:
+        cold = evaluate_batch(batch, solver=solver)
+        cold_iterations = int(cold.sweep_width_iterations.sum())
+
+    stats = ContinuationStats(
+        waves           = len(continuation_waves(neighbor)) if solver.method in CONTINUATION_METHODS else 1,
+        seeded          = int(result.sweep_width_seeded.sum()),
+        fallbacks       = int(result.sweep_width_fallback.sum()),
+        iterations      = int(result.sweep_width_iterations.sum()),
+        cold_iterations = cold_iterations
+    )
+    return result, stats
+
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+
+# Records the sweep width iterations (offset -> turn-around time -> new offset)
+# without printing them, so they can be looked at after a parallel or batched
+# run. Rows go into preallocated arrays used as a ring buffer: once capacity
+# rows have been written the oldest are overwritten, so a trace left on for a
+# big run keeps the most recent iterations at fixed memory.
+#
+# Only configs picked by the sample (explicit ids and/or every n-th id) are
+# recorded. Config ids are whatever the caller numbers configs by: the index
+# into the batch for evaluate_batch, config_id for the scalar functions.
+
+COLUMNS = ('config', 'iteration', 'offset', 'turn_time', 'new_offset', 'rel_change')
+
+
+class ConvergenceTrace:
+
+    def __init__(self, capacity: int = 100_000, configs=None, every: int = 1):
+        '''
+        Args:
+            capacity (int): rows kept.
+            configs: optional iterable of config ids to record; None for all.
+            every (int): only record config ids divisible by every.
+        '''
+        if capacity < 1:
+            raise ValueError(f'capacity must be >= 1, is {capacity}')
+        if every < 1:
+            raise ValueError(f'every must be >= 1, is {every}')
+
+        self.capacity = capacity
+        self.configs  = None if configs is None else np.unique(np.asarray(list(configs), dtype=int))
+        self.every    = every
+
+        self._config     = np.empty(capacity, dtype=int)
+        self._iteration  = np.empty(capacity, dtype=int)
+        self._offset     = np.empty(capacity)
+        self._turn_time  = np.empty(capacity)
+        self._new_offset = np.empty(capacity)
+        self.written     = 0
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    @property
+    def dropped(self) -> int:
+        '''
+        Rows overwritten since the trace was started.
+        '''
+        return max(self.written - self.capacity, 0)
+
+    def sampled(self, ids) -> np.ndarray:
+        '''
+        Mask of the config ids that are recorded.
+        '''
+        ids  = np.asarray(ids, dtype=int)
+        keep = ids % self.every == 0
+        if self.configs is not None:
+            keep &= np.isin(ids, self.configs)
+        return keep
+
+    def record(self, ids, iteration, offset, turn_time, new_offset):
+        '''
+        Record one iteration for each of a batch of configs. Arguments are
+        arrays (or scalars) of the same length.
+        '''
+        ids, iteration, offset, turn_time, new_offset = np.broadcast_arrays(
+            np.asarray(ids, dtype=int), iteration, offset, turn_time, new_offset
+        )
+        keep = self.sampled(ids)
+        if not keep.any():
+            return
+
+        n = int(keep.sum())
+        # Only the last capacity rows of a big write survive
+        skip = max(n - self.capacity, 0)
+        rows = (self.written + skip + np.arange(n - skip)) % self.capacity
+        for buffer, values in (
+            (self._config,     ids),
+            (self._iteration,  iteration),
+            (self._offset,     offset),
+            (self._turn_time,  turn_time),
+            (self._new_offset, new_offset),
+        ):
+            buffer[rows] = values[keep][skip:]
+        self.written += n
+
+    def wrap(self, g, ids):
+        '''
+        Wrap a sweep width map g(idx, offset) -> (width, turn time), as passed
+        to solvers.solve, so that every evaluation is recorded. idx are
+        positions in ids, the config ids.
+        '''
+        ids = np.asarray(ids, dtype=int)
+        iteration = np.zeros(len(ids), dtype=int)
+
+        def traced(idx, offset):
+            width, turn_time = g(idx, offset)
+            iteration[idx] += 1
+            self.record(ids[idx], iteration[idx], offset, turn_time, width)
+            return width, turn_time
+
+        return traced
+
+    def clear(self):
+        self.written = 0
+
+    def records(self) -> dict[str, np.ndarray]:
+        '''
+        The rows kept, oldest first, as a dict of COLUMNS -> array.
+        '''
+        n = len(self)
+        order = (self.written - n + np.arange(n)) % self.capacity
+        offset     = self._offset[order]
+        new_offset = self._new_offset[order]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_change = (new_offset - offset)/offset
+
+        return {
+            'config':     self._config[order],
+            'iteration':  self._iteration[order],
+            'offset':     offset,
+            'turn_time':  self._turn_time[order],
+            'new_offset': new_offset,
+            'rel_change': rel_change,
+        }
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records(), columns=list(COLUMNS))
+
+    def to_csv(self, path: str):
+        self.to_dataframe().to_csv(path, index=False)
+
+    def save(self, path: str):
+        '''
+        Save the rows kept as a .npz archive.
+        '''
+        np.savez(path, **self.records())
+
+    def summary(self) -> pd.DataFrame:
+        '''
+        One row per recorded config: iterations seen, final relative change
+        and the number of times the relative change flipped sign (oscillating
+        configs flip on every iteration, slowly converging ones don't).
+        '''
+        df = self.to_dataframe()
+        if df.empty:
+            return pd.DataFrame(columns=['iterations', 'final_rel_change', 'sign_flips'])
+
+        df = df.sort_values(['config', 'iteration'], kind='stable')
+        sign = np.sign(df['rel_change'])
+        df['flip'] = (sign != sign.groupby(df['config']).shift()) & sign.groupby(df['config']).shift().notna()
+
+        grouped = df.groupby('config')
+        return pd.DataFrame({
+            'iterations':       grouped['iteration'].max(),
+            'final_rel_change': grouped['rel_change'].last(),
+            'sign_flips':       grouped['flip'].sum(),
+        })
@@ -0,0 +1,191 @@
+from dataclasses import dataclass
+import math
+import os
+import numpy as np
+from constants import *
+from lawnmower import LawnmowerScenario
+
+
+# Raster coverage of the AOI over time along the lawnmower track (see
+# lawnmower.py): for every cell, how often it's seen and the longest time it
+# goes unseen.
+#
+# On each leg the footprint (cross-track width by downtrack range, ahead of
+# the aircraft) sweeps a band of cells the footprint's width wide, and each
+# cell in the band is first seen when the footprint's leading edge reaches it.
+# So a leg updates a block of rows with one vector of times over the columns,
+# and the raster is processed tile by tile, with only one tile's state in
+# memory at a time. Outputs can be written to memory-mapped .npy files, so
+# rasters far bigger than memory (e.g. 1 m cells over a 100 km x 100 km AOI)
+# only need disk.
+#
+# Times are seconds from the start of the first leg; cells are stationary
+# points at their centers. The searching run back into the AOI before each leg
+# isn't counted (cells near the edges are in the footprint when the leg starts
+# anyway).
+
+MAP_NAMES = ('visits', 'first_seen', 'revisit', 'gap')
+
+
+@dataclass
+class CoverageMaps:
+    '''
+    Per-cell maps, shape (rows across the AOI's width, columns along its
+    length), row 0 at lateral position 0.
+
+    - visits:     times the cell was seen
+    - first_seen: time it was first seen (NaN if never)
+    - revisit:    mean time between sightings (NaN if seen < 2 times)
+    - gap:        longest time unseen, counting from the start and to the
+                  horizon (the horizon if never seen)
+    '''
+    resolution:  float # m per cell
+    horizon_sec: float
+    visits:      np.ndarray
+    first_seen:  np.ndarray
+    revisit:     np.ndarray
+    gap:         np.ndarray
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.visits.shape
+
+    def coverage_fraction(self) -> float:
+        '''
+        Fraction of cells seen at least once (reads the visits map tile by
+        tile).
+        '''
+        seen = sum(int(np.count_nonzero(self.visits[r:r+4096])) for r in range(0, self.shape[0], 4096))
+        return seen/(self.shape[0]*self.shape[1])
+
+    def flush(self):
+        for name in MAP_NAMES:
+            values = getattr(self, name)
+            if isinstance(values, np.memmap):
+                values.flush()
+
+
+def _allocate(shape, out_dir):
+    dtypes = {'visits': np.int32, 'first_seen': np.float32, 'revisit': np.float32, 'gap': np.float32}
+    if out_dir is None:
+        return {name: np.empty(shape, dtype=dtypes[name]) for name in MAP_NAMES}
+
+    os.makedirs(out_dir, exist_ok=True)
+    return {
+        name: np.lib.format.open_memmap(os.path.join(out_dir, f'{name}.npy'), mode='w+', dtype=dtypes[name], shape=shape)
+        for name in MAP_NAMES
+    }
+
+
+def coverage_maps(
+        scenario: LawnmowerScenario,
+        resolution: float = 100.0,
+        horizon_sec: float = None,
+        tile: tuple[int, int] = (2048, 2048),
+        out_dir: str = None,
+        footprint: int = 1
+    ) -> CoverageMaps:
+    '''
+    Rasterize the AOI and accumulate the sensor footprint along the track.
+
+    Args:
+        scenario (LawnmowerScenario)
+        resolution (float): cell size in m.
+        horizon_sec (float): simulated time; default one pass over the AOI.
+        tile (tuple[int, int]): cells per tile (rows, columns) held in memory.
+        out_dir (str): if given, maps are memory-mapped .npy files in this
+            directory (visits.npy etc.), otherwise in-memory arrays.
+        footprint (int): footprint vs. the target's horizontal (0) or vertical
+            (1) dimension.
+
+    Returns:
+        CoverageMaps
+    '''
+    s = scenario
+    if horizon_sec is None:
+        horizon_sec = s.pass_time()
+
+    n_rows = math.ceil(s.aoi_width/resolution)
+    n_cols = math.ceil(s.aoi_length/resolution)
+    maps   = _allocate((n_rows, n_cols), out_dir)
+
+    # Footprint
+    ground    = (s.slant_detection_range[footprint]**2 - s.alt_m**2)**0.5
+    half_x    = ground*math.sin(s.half_fov_h_rad)
+    downtrack = ground*math.cos(s.half_fov_h_rad)
+    speed     = s.mach*MACH_M_PER_SEC
+
+    # The legs are few: keep them as arrays to pick the ones over each tile
+    legs = np.array(list(s.legs(horizon_sec)), dtype=float).reshape(-1, 3)
+    leg_t0, leg_y, leg_dir = legs.T
+
+    y_cells = (np.arange(n_rows) + 0.5)*resolution
+    x_cells = (np.arange(n_cols) + 0.5)*resolution
+
+    # Time each column is first seen on a leg, relative to the leg's start,
+    # flying either way
+    t_forward  = np.maximum(x_cells - downtrack, 0)/speed
+    t_backward = np.maximum(s.aoi_length - x_cells - downtrack, 0)/speed
+
+    for r0 in range(0, n_rows, tile[0]):
+        r1 = min(r0 + tile[0], n_rows)
+        y  = y_cells[r0:r1]
+
+        # Legs whose band reaches this block of rows
+        over = (leg_y + half_x >= y[0]) & (leg_y - half_x <= y[-1])
+
+        for c0 in range(0, n_cols, tile[1]):
+            c1 = min(c0 + tile[1], n_cols)
+            shape = (r1 - r0, c1 - c0)
+
+            visits = np.zeros(shape, dtype=np.int32)
+            first  = np.full(shape, np.nan)
+            last   = np.zeros(shape)
+            gap    = np.zeros(shape)
+
+            for t0, y_leg, direction in zip(leg_t0[over], leg_y[over], leg_dir[over]):
+                rows = slice(
+                    np.searchsorted(y, y_leg - half_x, side='left'),
+                    np.searchsorted(y, y_leg + half_x, side='right')
+                )
+                if rows.start == rows.stop:
+                    continue
+                t = t0 + (t_forward if direction > 0 else t_backward)[c0:c1]
+                # Seen before the horizon: a contiguous run of columns, since
+                # the times are monotonic along the leg
+                seen = np.flatnonzero(t <= horizon_sec)
+                if len(seen) == 0:
+                    continue
+                cols = slice(seen[0], seen[-1] + 1)
+                t = t[cols]
+
+                block = (rows, cols)
+                np.maximum(gap[block], t - last[block], out=gap[block])
+                first[block] = np.where(visits[block] == 0, t, first[block])
+                last[block]  = t
+                visits[block] += 1
+
+            # Unseen to the horizon
+            gap = np.where(visits > 0, np.maximum(gap, horizon_sec - last), horizon_sec)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                revisit = np.where(visits > 1, (last - first)/(visits - 1), np.nan)
+
+            maps['visits'][r0:r1, c0:c1]     = visits
+            maps['first_seen'][r0:r1, c0:c1] = first
+            maps['revisit'][r0:r1, c0:c1]    = revisit
+            maps['gap'][r0:r1, c0:c1]        = gap
+
+    result = CoverageMaps(resolution=resolution, horizon_sec=horizon_sec, **maps)
+    result.flush()
+    return result
+
+
+def load_coverage_maps(out_dir: str, resolution: float, horizon_sec: float) -> CoverageMaps:
+    '''
+    Open maps written by coverage_maps(out_dir=...) read-only, memory-mapped.
+    '''
+    return CoverageMaps(
+        resolution  = resolution,
+        horizon_sec = horizon_sec,
+        **{name: np.load(os.path.join(out_dir, f'{name}.npy'), mmap_mode='r') for name in MAP_NAMES}
+    )
@@ -0,0 +1,290 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from constants import *
+from batch import evaluate_batch
+from doe import Dimension, DesignSpace
+
+
+# Sweep results persisted as an N-dimensional cube over the grid axes
+# (altitude, mach, sensor and any other ConfigBatch fields), so analysis
+# questions are answered by slicing instead of rescanning model_output.csv.
+#
+# On disk a cube is a directory:
+# - cube.json:     the axes (name and sorted values, sensors by name), the
+#                  fields stored and indexed, and the table of reasons
+# - <field>.npy:   one array per result field, shaped like the grid (C order,
+#                  the first axis slowest), memory-mapped when opened
+# - <field>.order.npy, <field>.sorted.npy: a sorted secondary index of a
+#                  field: the flat positions of its valid values in
+#                  ascending order, and the values in that order
+#
+# The grid is evaluated and written chunk by chunk, so the cube can be
+# bigger than memory. Queries select axis values or ranges (sel), take the
+# minimum of a field over a selection (min), or find the points with a field
+# in a range (query), through the field's index if it has one.
+
+CUBE_FIELDS = (
+    'ac_cost',
+    'ac_endurance_sec',
+    'ac_turn_time',
+    'effective_sweep_width',
+    'search_rate',
+    'onsta_req_n',
+    'onsta_req_cost',
+)
+
+DEFAULT_INDEXES = ('onsta_req_cost', 'onsta_req_n')
+
+_META = 'cube.json'
+
+
+def _axis_name(key) -> str:
+    # An axis key is a field name, or a tuple of fields taking the same
+    # values (named by the first, as DesignSpace.to_unit does)
+    return key if isinstance(key, str) else key[0]
+
+
+def evaluate_cube(
+        path: str,
+        template: Config,
+        axes: dict,
+        sensor_assumptions: dict = None,
+        indexes: tuple[str, ...] = DEFAULT_INDEXES,
+        chunk_size: int = 200_000,
+        solver: SolverSettings = SolverSettings()
+    ) -> 'ResultsCube':
+    '''
+    Evaluate the full grid of axes and write it as a cube at path.
+
+    Args:
+        path (str): directory to write (created if needed).
+        template (Config): values of everything that isn't an axis.
+        axes (dict): ConfigBatch field name (or tuple of names, or 'sensor')
+            -> values.
+        sensor_assumptions (dict): Sensor -> SensorAssumption, required for a
+            sensor axis.
+        indexes (tuple[str, ...]): fields to build sorted indexes on.
+        chunk_size (int): configs per evaluate_batch call.
+        solver (SolverSettings): for the effective sweep width.
+
+    Returns:
+        ResultsCube: the cube, opened.
+    '''
+    names  = [_axis_name(key) for key in axes]
+    values = {}
+    for key, name in zip(axes, names):
+        v = list(axes[key])
+        values[name] = v if key == 'sensor' else sorted(float(x) for x in v)
+
+    space = DesignSpace(
+        template,
+        [Dimension(key, levels=tuple(values[name])) for key, name in zip(axes, names)],
+        sensor_assumptions
+    )
+    shape = tuple(len(values[name]) for name in names)
+    size  = int(np.prod(shape))
+
+    os.makedirs(path, exist_ok=True)
+    open_memmap = np.lib.format.open_memmap
+    arrays = {name: open_memmap(os.path.join(path, f'{name}.npy'), mode='w+', dtype=float, shape=shape) for name in CUBE_FIELDS}
+    arrays['valid']  = open_memmap(os.path.join(path, 'valid.npy'), mode='w+', dtype=bool, shape=shape)
+    arrays['reason'] = open_memmap(os.path.join(path, 'reason.npy'), mode='w+', dtype=np.int16, shape=shape)
+    flat = {name: array.reshape(-1) for name, array in arrays.items()}
+    reasons = {None: 0}
+
+    for i in range(0, size, chunk_size):
+        idx   = np.arange(i, min(i + chunk_size, size))
+        coord = np.unravel_index(idx, shape)
+        unit  = np.column_stack([(c + 0.5)/n for c, n in zip(coord, shape)])
+        result = evaluate_batch(space.to_batch(unit), solver=solver)
+
+        for name in CUBE_FIELDS:
+            flat[name][idx] = getattr(result, name)
+        flat['valid'][idx]  = result.valid
+        flat['reason'][idx] = [reasons.setdefault(r, len(reasons)) for r in result.reason]
+
+    for array in arrays.values():
+        array.flush()
+    del arrays, flat
+
+    meta = {
+        'axes':    [[name, [v.name for v in values[name]] if name == 'sensor' else values[name]] for name in names],
+        'fields':  list(CUBE_FIELDS),
+        'indexes': [],
+        'reasons': [r for r, _ in sorted(reasons.items(), key=lambda item: item[1])],
+    }
+    with open(os.path.join(path, _META), 'w') as f:
+        json.dump(meta, f)
+
+    cube = ResultsCube(path)
+    for name in indexes:
+        cube.build_index(name)
+    return cube
+
+
+def _take_positions(array: np.ndarray, positions: list) -> np.ndarray:
+    # Slices are views (nothing read from a memory map); index arrays copy
+    for axis, p in enumerate(positions):
+        array = array[(slice(None),)*axis + (p,)] if isinstance(p, slice) else np.take(array, p, axis=axis)
+    return array
+
+
+class ResultsCube:
+    '''
+    A cube written by evaluate_cube, memory-mapped.
+
+    Selections (**where) are by axis name: a single value (e.g.
+    sensor=Sensor.MED, matched to the nearest grid value), a (low, high)
+    range, inclusive, or a list of values.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, _META)) as f:
+            meta = json.load(f)
+
+        self.axes = {}
+        for name, values in meta['axes']:
+            self.axes[name] = np.array([Sensor[v] for v in values], dtype=object) if name == 'sensor' else np.array(values)
+        self.fields  = tuple(meta['fields'])
+        self.reasons = meta['reasons']
+        self.indexes = {}
+        for name in meta['indexes']:
+            self.indexes[name] = (self._load(f'{name}.order'), self._load(f'{name}.sorted'))
+
+        self.arrays = {name: self._load(name) for name in self.fields + ('valid', 'reason')}
+
+    @classmethod
+    def open(cls, path: str) -> 'ResultsCube':
+        return cls(path)
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(values) for values in self.axes.values())
+
+    def __len__(self):
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.arrays[field]
+
+    def build_index(self, field: str):
+        '''
+        Build (or rebuild) the sorted index on a field.
+        '''
+        values = np.asarray(self.arrays[field]).reshape(-1)
+        valid  = np.flatnonzero(np.asarray(self.arrays['valid']).reshape(-1) & ~np.isnan(values))
+        order  = valid[np.argsort(values[valid], kind='stable')]
+        np.save(os.path.join(self.path, f'{field}.order.npy'), order)
+        np.save(os.path.join(self.path, f'{field}.sorted.npy'), values[order])
+
+        meta_path = os.path.join(self.path, _META)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['indexes'] = sorted(set(meta['indexes']) | {field})
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        self.indexes[field] = (self._load(f'{field}.order'), self._load(f'{field}.sorted'))
+
+    def _positions(self, name: str, selection) -> slice | np.ndarray:
+        # Positions along an axis of a selection on it
+        values = self.axes[name]
+        if name == 'sensor':
+            wanted = selection if isinstance(selection, (list, tuple)) else [selection]
+            return np.array([k for k, v in enumerate(values) if v in wanted], dtype=int)
+        if isinstance(selection, tuple):
+            low, high = selection
+            return slice(int(np.searchsorted(values, low, 'left')), int(np.searchsorted(values, high, 'right')))
+        if isinstance(selection, list):
+            return np.unique([self._nearest(values, v) for v in selection])
+        k = self._nearest(values, selection)
+        return slice(k, k + 1)
+
+    @staticmethod
+    def _nearest(values: np.ndarray, value: float) -> int:
+        return int(np.argmin(np.abs(values - value)))
+
+    def _selection(self, where: dict) -> list:
+        unknown = set(where) - set(self.axes)
+        if unknown:
+            raise ValueError(f'Unknown axes {sorted(unknown)}, cube axes are {list(self.axes)}')
+        return [self._positions(name, where[name]) if name in where else slice(None) for name in self.axes]
+
+    def sel(self, field: str, **where) -> tuple[np.ndarray, dict]:
+        '''
+        A field over a selection, with the selected axis values. Ranges and
+        single values slice the memory map without reading anything else.
+
+        Returns:
+            tuple[np.ndarray, dict]: (values, axis name -> selected values)
+        '''
+        positions = self._selection(where)
+        values = _take_positions(self.arrays[field], positions)
+        return values, {name: self.axes[name][p] for name, p in zip(self.axes, positions)}
+
+    def min(self, field: str = 'onsta_req_cost', **where) -> dict | None:
+        '''
+        The valid point minimizing field over a selection, with its
+        coordinates (None if none is valid).
+        '''
+        values, coords = self.sel(field, **where)
+        valid, _ = self.sel('valid', **where)
+        values = np.where(valid, values, np.nan)
+        if np.isnan(values).all():
+            return None
+        k = np.unravel_index(np.nanargmin(values), values.shape)
+        point = {name: coords[name][i] for name, i in zip(self.axes, k)}
+        return {**{name: v.item() if isinstance(v, np.generic) else v for name, v in point.items()}, field: float(values[k])}
+
+    def query(
+            self,
+            field: str,
+            low: float = -np.inf,
+            high: float = np.inf,
+            columns: tuple[str, ...] = None,
+            limit: int = None,
+            **where
+        ) -> pd.DataFrame:
+        '''
+        Valid points with low <= field <= high within a selection, in
+        ascending order of field, with their coordinates and columns (default
+        all fields).
+        '''
+        columns = self.fields if columns is None else tuple(columns)
+        positions = self._selection(where)
+
+        if field in self.indexes:
+            order, ordered = self.indexes[field]
+            flat = order[np.searchsorted(ordered, low, 'left'):np.searchsorted(ordered, high, 'right')]
+            keep = np.ones(len(flat), dtype=bool)
+            for c, p, n in zip(np.unravel_index(flat, self.shape), positions, self.shape):
+                if not (isinstance(p, slice) and p == slice(None)):
+                    allowed = np.zeros(n, dtype=bool)
+                    allowed[p] = True
+                    keep &= allowed[c]
+            flat = flat[keep][:limit]
+        else:
+            flat = _take_positions(np.arange(len(self)).reshape(self.shape), positions).reshape(-1)
+            values = self.arrays[field].reshape(-1)[flat]
+            ok = self.arrays['valid'].reshape(-1)[flat] & (values >= low) & (values <= high)
+            flat = flat[ok]
+            flat = flat[np.argsort(self.arrays[field].reshape(-1)[flat], kind='stable')][:limit]
+
+        return self.points(flat, columns)
+
+    def points(self, flat: np.ndarray, columns: tuple[str, ...] = None) -> pd.DataFrame:
+        '''
+        Coordinates and columns (default all fields) of points by flat
+        position.
+        '''
+        columns = self.fields if columns is None else tuple(columns)
+        coord = np.unravel_index(np.asarray(flat, dtype=int), self.shape)
+        frame = pd.DataFrame({name: self.axes[name][c] for name, c in zip(self.axes, coord)})
+        for name in columns:
+            frame[name] = self.arrays[name].reshape(-1)[flat]
+        return frame
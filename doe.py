@@ -0,0 +1,241 @@
+from dataclasses import dataclass, fields, replace
+import math
+import numpy as np
+from scipy.stats import qmc
+from constants import *
+from batch import ConfigBatch, BatchResult, evaluate_batch
+
+
+# Space-filling designs of experiments, as an alternative to main.py's full
+# factorial grids once there are more than a few dimensions (bank angle,
+# decel, min mach, revisit time, target speed, ...): n points cover a space of
+# any number of dimensions, instead of levels**dimensions.
+#
+# A DesignSpace maps points of the unit hypercube onto configs: each
+# Dimension sets one or more ConfigBatch fields over a range (linear or log)
+# or picks from discrete levels; everything else comes from a template
+# Config. The sensor can be a dimension too, with levels of Sensor members,
+# filling in the sensor assumption fields from a dict like
+# main.SENSOR_ASSUMPTIONS.
+#
+# Samplers (SAMPLERS), all from scipy.stats.qmc except 'random':
+# - 'lhs':    Latin hypercube, each dimension's range split into n strata,
+#             one point in each
+# - 'sobol':  scrambled Sobol' sequence (n and chunk_size best powers of 2)
+# - 'halton': scrambled Halton sequence
+# - 'random': uniform random, for comparison
+#
+# Sobol', Halton and random points are drawn chunk by chunk, so arbitrarily
+# many points can be streamed in constant memory. A Latin hypercube is only
+# stratified as a whole, so its unit points are drawn at once (n x dims
+# floats) and mapped to configs chunk by chunk.
+
+SAMPLERS = ('lhs', 'sobol', 'halton', 'random')
+
+SCALES = ('linear', 'log')
+
+
+@dataclass(frozen=True)
+class Dimension:
+    '''
+    One dimension of a DesignSpace.
+
+    field is a ConfigBatch field name (scalar fields only), a tuple of names
+    that take the same value (e.g. ('aoi_ingress', 'aoi_egress')), or
+    'sensor'. Give either a range (low, high, scale) or discrete levels.
+    String fields (performance_model, aspect_model, target_type) take levels
+    only.
+    '''
+    field:  str | tuple[str, ...]
+    low:    float = None
+    high:   float = None
+    scale:  str   = 'linear'
+    levels: tuple = None
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        return self.field if isinstance(self.field, tuple) else (self.field,)
+
+    @property
+    def numeric(self) -> bool:
+        '''
+        Whether the values are numbers (a range, or levels that are all
+        numbers), rather than Sensor members or strings.
+        '''
+        if self.levels is None:
+            return True
+        return all(isinstance(level, (int, float, np.number)) and not isinstance(level, bool) for level in self.levels)
+
+    def values(self, u: np.ndarray) -> np.ndarray:
+        '''
+        Map unit values u in [0, 1) onto this dimension.
+        '''
+        if self.levels is not None:
+            k = np.minimum((u*len(self.levels)).astype(int), len(self.levels) - 1)
+            return np.array(self.levels, dtype=float if self.numeric else object)[k]
+        if self.scale == 'log':
+            return np.exp(np.log(self.low) + u*(np.log(self.high) - np.log(self.low)))
+        return self.low + u*(self.high - self.low)
+
+    def unit(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Inverse of values: unit values of this dimension's values (levels map
+        to the middle of their interval).
+        '''
+        if self.levels is not None:
+            index = {level: k for k, level in enumerate(self.levels)}
+            return (np.array([index[v] for v in values]) + 0.5)/len(self.levels)
+        if self.scale == 'log':
+            return (np.log(values) - math.log(self.low))/(math.log(self.high) - math.log(self.low))
+        return (values - self.low)/(self.high - self.low)
+
+
+class DesignSpace:
+    '''
+    Maps unit hypercube points onto ConfigBatches (see the module comment).
+
+    Args:
+        template (Config): values of everything that isn't a dimension.
+        dimensions (list[Dimension])
+        sensor_assumptions (dict): Sensor -> SensorAssumption, required if
+            the sensor is a dimension.
+    '''
+
+    def __init__(self, template: Config, dimensions: list[Dimension], sensor_assumptions: dict = None):
+        self.template           = ConfigBatch.from_configs([template])
+        self.dimensions         = list(dimensions)
+        self.sensor_assumptions = sensor_assumptions
+
+        swept = [name for dim in self.dimensions for name in dim.fields]
+        if len(set(swept)) != len(swept):
+            raise ValueError(f'Fields on more than one dimension: {swept}')
+
+        scalar = {f.name for f in fields(ConfigBatch) if getattr(self.template, f.name).ndim == 1}
+        for dim in self.dimensions:
+            if dim.field == 'sensor':
+                if dim.levels is None or sensor_assumptions is None:
+                    raise ValueError('A sensor dimension needs levels and sensor_assumptions')
+                continue
+            for name in dim.fields:
+                if name not in scalar or name == 'sensor':
+                    raise ValueError(f'Can only sample scalar ConfigBatch fields, not {name!r}')
+                is_string = getattr(self.template, name).dtype == object
+                if is_string and (dim.levels is None or not all(isinstance(level, str) for level in dim.levels)):
+                    raise ValueError(f'String field {name!r} needs levels that are all strings')
+                if not is_string and not dim.numeric:
+                    raise ValueError(f'Numeric field {name!r} needs numeric levels, not {dim.levels}')
+            if dim.levels is None:
+                if dim.low is None or dim.high is None:
+                    raise ValueError(f'Dimension {dim.field!r} needs low and high, or levels')
+                if dim.scale not in SCALES:
+                    raise ValueError(f'Unknown scale {dim.scale!r}, must be one of {SCALES}')
+                if dim.scale == 'log' and not dim.low > 0:
+                    raise ValueError(f'Log-scaled dimension {dim.field!r} needs low > 0')
+
+    def __len__(self):
+        return len(self.dimensions)
+
+    def to_batch(self, unit: np.ndarray) -> ConfigBatch:
+        '''
+        ConfigBatch for unit points (n, len(dimensions)) in [0, 1).
+        '''
+        n = len(unit)
+        changes = {}
+        for k, dim in enumerate(self.dimensions):
+            values = dim.values(unit[:, k])
+            if dim.field == 'sensor':
+                changes.update(self._sensor_fields(values))
+            else:
+                changes.update({name: values for name in dim.fields})
+        return replace(self.template.take(np.zeros(n, dtype=int)), **changes)
+
+    def to_unit(self, batch: ConfigBatch) -> np.ndarray:
+        '''
+        Unit points (n, len(dimensions)) of a batch's configs, e.g. to fit
+        surrogates in the space's coordinates (see surrogate.py).
+        '''
+        return np.column_stack([dim.unit(getattr(batch, dim.fields[0])) for dim in self.dimensions])
+
+    def _sensor_fields(self, sensors: np.ndarray) -> dict:
+        assumptions = [self.sensor_assumptions[s] for s in sensors]
+        return {
+            'sensor':                        sensors,
+            'sensor_assumption_fov_deg':     np.array([a.fov_deg for a in assumptions], dtype=float).reshape(-1, 2),
+            'sensor_assumption_resolution':  np.array([a.resolution for a in assumptions], dtype=float).reshape(-1, 2),
+            'sensor_assumption_johnson_req': np.array([a.johnson_req for a in assumptions], dtype=float),
+            'sensor_assumption_cost':        np.array([a.cost for a in assumptions], dtype=float),
+        }
+
+
+def unit_points(d: int, n: int, method: str = 'sobol', chunk_size: int = 8192, seed: int = 0):
+    '''
+    Lazily yield n points of the d-dimensional unit hypercube, in chunks of
+    up to chunk_size rows.
+    '''
+    if method not in SAMPLERS:
+        raise ValueError(f'Unknown sampler {method!r}, must be one of {SAMPLERS}')
+
+    if method == 'lhs':
+        points = qmc.LatinHypercube(d=d, seed=seed).random(n)
+        for i in range(0, n, chunk_size):
+            yield points[i:i+chunk_size]
+        return
+
+    if method == 'sobol':
+        engine = qmc.Sobol(d=d, seed=seed)
+    elif method == 'halton':
+        engine = qmc.Halton(d=d, seed=seed)
+    else:
+        rng = np.random.default_rng(seed)
+        engine = None
+
+    for i in range(0, n, chunk_size):
+        m = min(chunk_size, n - i)
+        yield engine.random(m) if engine is not None else rng.random((m, d))
+
+
+def doe_batches(space: DesignSpace, n: int, method: str = 'sobol', chunk_size: int = 8192, seed: int = 0):
+    '''
+    Lazily yield ConfigBatches of n points of the design space, chunk_size
+    configs at a time, ready for evaluate_batch.
+    '''
+    for unit in unit_points(len(space), n, method, chunk_size, seed):
+        yield space.to_batch(unit)
+
+
+def concat_batches(batches: list) -> ConfigBatch | BatchResult:
+    '''
+    Concatenate ConfigBatches (or BatchResults) field by field.
+    '''
+    cls = type(batches[0])
+    return cls(**{f.name: np.concatenate([getattr(b, f.name) for b in batches]) for f in fields(cls)})
+
+
+def evaluate_doe(
+        space: DesignSpace,
+        n: int,
+        method: str = 'sobol',
+        chunk_size: int = 8192,
+        seed: int = 0,
+        solver: SolverSettings = SolverSettings()
+    ) -> tuple[ConfigBatch, BatchResult]:
+    '''
+    Evaluate n points of the design space, chunk by chunk.
+
+    Returns:
+        tuple[ConfigBatch, BatchResult]: all the configs and their results.
+    '''
+    batches, results = [], []
+    for batch in doe_batches(space, n, method, chunk_size, seed):
+        batches.append(batch)
+        results.append(evaluate_batch(batch, solver=solver))
+    return concat_batches(batches), concat_batches(results)
+
+
+def discrepancy(batch: ConfigBatch, space: DesignSpace) -> float:
+    '''
+    Centered L2 discrepancy of a batch's points over the space's ranged
+    dimensions (lower is more uniform), to compare samplers.
+    '''
+    ranged = [k for k, dim in enumerate(space.dimensions) if dim.levels is None]
+    return float(qmc.discrepancy(np.clip(space.to_unit(batch)[:, ranged], 0, 1)))
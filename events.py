@@ -0,0 +1,42 @@
+import heapq
+import itertools
+import math
+
+
+class EventQueue:
+    '''
+    Minimal discrete-event scheduler: a heap of (time, sequence, kind, data).
+    Events at the same time come out in the order they were pushed.
+    '''
+
+    def __init__(self):
+        self._heap     = []
+        self._sequence = itertools.count()
+        self.now       = 0.0
+        self.processed = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, time: float, kind: str, data=None):
+        if time < self.now:
+            raise ValueError(f'Event {kind!r} at {time} is before the current time {self.now}')
+        heapq.heappush(self._heap, (time, next(self._sequence), kind, data))
+
+    def pop(self) -> tuple[float, str, object]:
+        time, _, kind, data = heapq.heappop(self._heap)
+        self.now = time
+        self.processed += 1
+        return time, kind, data
+
+    def peek_time(self) -> float:
+        return self._heap[0][0] if self._heap else math.inf
+
+    def run(self, handlers: dict, until: float = math.inf):
+        '''
+        Process events in time order up to (and including) until. Each event
+        is passed to handlers[kind](time, data), which can push more events.
+        '''
+        while self._heap and self._heap[0][0] <= until:
+            time, kind, data = self.pop()
+            handlers[kind](time, data)
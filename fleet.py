@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+import math
+import numpy as np
+from constants import *
+from events import EventQueue
+from batch import ConfigBatch, BatchResult, evaluate_batch
+
+
+# Fleet-level simulation of a design point. calc_onsta_requirement gives a
+# fractional number of aircraft airborne; here an integer fleet of airframes
+# flies staggered sorties for days and the revisits it actually achieves are
+# measured. The launch cadence can still be fractional: with fewer than one
+# aircraft airborne on average, there are gaps between sorties.
+#
+# Each sortie: transit to the AOI (ingress), search until there's just enough
+# endurance to get back (egress), transit back, then ground_time_hr on the
+# ground before the airframe can launch again. Launches are scheduled every
+# endurance/n_airborne; a launch with no airframe ready waits for the next one
+# to come back.
+#
+# Search effort: each aircraft on station searches area at a constant rate,
+# chosen so a sortie covers search_rate*endurance, the analytic model's area
+# per sortie. The AOI counts as revisited each time the fleet's accumulated
+# area since the last revisit reaches the AOI's area; gaps with no one on
+# station show up as long revisits.
+
+
+@dataclass
+class FleetResult:
+    n_airborne:       float      # average aircraft airborne (launch cadence)
+    n_airframes:      int        # airframes needed to sustain the cadence
+    launch_interval:  float      # s
+    revisit_times:    np.ndarray # s, achieved revisit intervals
+    required_revisit: float      # s
+    days:             float
+    late_launches:    int        # launches delayed waiting for an airframe
+    events:           int
+
+    def percentile(self, q) -> float:
+        return float(np.percentile(self.revisit_times, q)) if len(self.revisit_times) else math.inf
+
+    @property
+    def mean_revisit(self) -> float:
+        return float(self.revisit_times.mean()) if len(self.revisit_times) else math.inf
+
+    def meets(self, quantile: float = 95) -> bool:
+        '''
+        Whether the quantile of achieved revisit times is within the required
+        revisit time.
+        '''
+        return self.percentile(quantile) <= self.required_revisit
+
+
+def simulate_fleet(
+        mach: float,
+        endurance_sec: float,
+        aoi_length: float,
+        aoi_width: float,
+        aoi_ingress: float,
+        aoi_egress: float,
+        search_rate: float,
+        revisit_time_hr: float,
+        n_airborne: float,
+        ground_time_hr: float = 2.0,
+        days: float = 7.0
+    ) -> FleetResult:
+    '''
+    Fly staggered sorties, launching every endurance/n_airborne.
+
+    Returns:
+        FleetResult
+    '''
+    if not n_airborne > 0:
+        raise ValueError(f'n_airborne must be > 0, is {n_airborne}')
+
+    speed       = mach*MACH_M_PER_SEC
+    transit_in  = aoi_ingress/speed
+    transit_out = aoi_egress/speed
+    on_station  = endurance_sec - transit_in - transit_out
+    if on_station <= 0:
+        raise ValueError('Endurance does not cover the transit to and from the AOI')
+
+    area        = aoi_length*aoi_width
+    rate        = search_rate*endurance_sec/on_station # m^2/s per aircraft on station
+    ground      = ground_time_hr*SEC_PER_HR
+    interval    = endurance_sec/n_airborne
+    n_airframes = math.ceil((endurance_sec + ground)/interval)
+    horizon     = days*24*SEC_PER_HR
+
+    queue       = EventQueue()
+    ready       = n_airframes # airframes on the ground, ready
+    waiting     = 0           # launches due with no airframe ready
+    late        = 0
+    on_sta      = 0           # aircraft on station
+    effort      = 0.0         # area searched since the last revisit
+    t_effort    = 0.0         # time effort was last brought up to date
+    revisits    = []
+
+    def accrue(t):
+        # Bring the area searched up to t, recording each time it completes
+        # another look at the whole AOI
+        nonlocal effort, t_effort
+        r = on_sta*rate
+        if r > 0:
+            while effort + r*(t - t_effort) >= area:
+                t_effort += (area - effort)/r
+                effort    = 0.0
+                revisits.append(t_effort)
+            effort += r*(t - t_effort)
+        t_effort = t
+
+    def launch(t, _):
+        nonlocal ready, waiting, late
+        if t + interval < horizon:
+            queue.push(t + interval, 'launch')
+        if ready == 0:
+            waiting += 1
+            late    += 1
+            return
+        ready -= 1
+        queue.push(t + transit_in, 'arrive')
+
+    def arrive(t, _):
+        nonlocal on_sta
+        accrue(t)
+        on_sta += 1
+        queue.push(t + on_station, 'depart')
+
+    def depart(t, _):
+        nonlocal on_sta
+        accrue(t)
+        on_sta -= 1
+        queue.push(t + transit_out + ground, 'ready')
+
+    def airframe_ready(t, _):
+        nonlocal ready, waiting
+        ready += 1
+        if waiting:
+            waiting -= 1
+            ready   -= 1
+            queue.push(t + transit_in, 'arrive')
+
+    queue.push(0.0, 'launch')
+    queue.run(
+        {'launch': launch, 'arrive': arrive, 'depart': depart, 'ready': airframe_ready},
+        until = horizon
+    )
+    accrue(horizon)
+
+    # Revisit intervals, from the first full look on (the fleet's build-up
+    # isn't a revisit)
+    return FleetResult(
+        n_airborne       = n_airborne,
+        n_airframes      = n_airframes,
+        launch_interval  = interval,
+        revisit_times    = np.diff(revisits),
+        required_revisit = revisit_time_hr*SEC_PER_HR,
+        days             = days,
+        late_launches    = late,
+        events           = queue.processed
+    )
+
+
+def size_fleet(
+        batch: ConfigBatch,
+        result: BatchResult,
+        i: int,
+        quantile: float = 95,
+        step: float = 0.05,
+        max_steps: int = 60,
+        **kwargs
+    ) -> FleetResult:
+    '''
+    Smallest launch cadence, starting from the analytic onsta_req_n and
+    growing by step (fractionally) at a time, whose simulated revisits meet
+    the requirement at the given quantile. Keyword arguments go to
+    simulate_fleet.
+
+    Returns:
+        FleetResult for that fleet (the largest tried if none meets it).
+    '''
+    if not result.valid[i]:
+        raise ValueError(f'Config {i} is not valid: {result.reason[i]}')
+
+    for k in range(max_steps + 1):
+        n = result.onsta_req_n[i]*(1 + step)**k
+        fleet = simulate_fleet(
+            mach            = batch.mach[i],
+            endurance_sec   = result.ac_endurance_sec[i],
+            aoi_length      = batch.aoi_length[i],
+            aoi_width       = batch.aoi_width[i],
+            aoi_ingress     = batch.aoi_ingress[i],
+            aoi_egress      = batch.aoi_egress[i],
+            search_rate     = result.search_rate[i],
+            revisit_time_hr = batch.aoi_revisit_time_hr[i],
+            n_airborne      = n,
+            **kwargs
+        )
+        if fleet.meets(quantile):
+            break
+    return fleet
+
+
+def pareto_mask(objectives: np.ndarray) -> np.ndarray:
+    '''
+    Rows of objectives (n, k), all minimized, that no other row dominates.
+    NaN rows are never optimal.
+    '''
+    objectives = np.asarray(objectives, dtype=float)
+    ok    = ~np.isnan(objectives).any(axis=1)
+    front = np.zeros(len(objectives), dtype=bool)
+
+    idx = np.flatnonzero(ok)
+    # Sweep in order of the first objective: a row is dominated only by rows
+    # before it
+    idx = idx[np.lexsort(objectives[idx].T[::-1])]
+    kept = []
+    for i in idx:
+        if not any((objectives[j] <= objectives[i]).all() for j in kept):
+            kept.append(i)
+    front[kept] = True
+    return front
+
+
+def simulate_pareto(
+        batch: ConfigBatch,
+        result: BatchResult = None,
+        objectives: tuple[str, ...] = ('onsta_req_cost', 'onsta_req_n'),
+        **kwargs
+    ) -> dict[int, FleetResult]:
+    '''
+    Size the fleet (size_fleet) for every Pareto-optimal design in the batch
+    over the given BatchResult fields.
+
+    Returns:
+        dict of batch index -> FleetResult
+    '''
+    if result is None:
+        result = evaluate_batch(batch)
+
+    values = np.column_stack([np.where(result.valid, getattr(result, name), np.nan) for name in objectives])
+    return {int(i): size_fleet(batch, result, i, **kwargs) for i in np.flatnonzero(pareto_mask(values))}
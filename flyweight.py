@@ -0,0 +1,261 @@
+import json
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass, replace
+from enum import Enum
+from constants import *
+
+
+# Frozen sub-objects that many Configs/ModelResults point to. These are
+# interned, and written once (then referred to by ID) when serialized.
+SHARED_TYPES = (
+    DesignTarget,
+    AOI,
+    SensorAssumption,
+    SensorPerformance,
+    AircraftSearchPerformance
+)
+
+# Aircraft kept by make_aircraft, least recently used dropped first. A grid
+# sweep has a distinct aircraft per point, so this only pays off for
+# repeated evaluations of the same airframes (e.g. sweeps over target, AOI
+# or revisit time), and is bounded so long-lived processes don't grow.
+AIRCRAFT_CACHE_SIZE = 4096
+
+_interned = {}
+_aircraft = OrderedDict() # key -> Aircraft, least recently used first
+_aircraft_stats = {'hits': 0, 'misses': 0}
+
+
+def intern(obj):
+    '''
+    Return the canonical instance of a frozen dataclass. Equal objects passed
+    in later return the first instance seen, so every Config built from the
+    same values points to the same sub-objects.
+
+    Args:
+        obj: instance of a frozen (hashable) dataclass.
+
+    Returns:
+        The interned instance equal to obj.
+    '''
+    return _interned.setdefault(obj, obj)
+
+
+def intern_config(config: Config) -> Config:
+    '''
+    Return a Config whose target, AOI and sensor assumption are the interned
+    instances. Returns config itself if it already points to them.
+    '''
+    target            = intern(config.target)
+    aoi               = intern(config.aoi)
+    sensor_assumption = intern(config.sensor_assumption)
+
+    if (target is config.target
+        and aoi is config.aoi
+        and sensor_assumption is config.sensor_assumption):
+        return config
+
+    return replace(
+        config,
+        sensor_assumption = sensor_assumption,
+        target            = target,
+        aoi               = aoi
+    )
+
+
+def make_aircraft(config: Config) -> Aircraft:
+    '''
+    Memoized Aircraft construction. The aircraft only depends on the airframe
+    and sensor fields of the config, so configs that differ only in target, AOI
+    or revisit time share one instance (and its cost/endurance calculations).
+
+    The returned Aircraft is shared: treat it as read-only. Up to
+    AIRCRAFT_CACHE_SIZE are kept, least recently used dropped first.
+    '''
+    key = (
+        config.altitude_kft,
+        config.mach,
+        config.manx_bank_angle_rad,
+        config.manx_decel_gees,
+        config.manx_min_mach,
+        config.sensor,
+        config.sensor_assumption,
+        config.performance_model
+    )
+
+    ac = _aircraft.get(key)
+    if ac is None:
+        _aircraft_stats['misses'] += 1
+        ac = Aircraft(
+            alt_kft             = config.altitude_kft,
+            mach                = config.mach,
+            manx_bank_angle_rad = config.manx_bank_angle_rad,
+            manx_decel_gees     = config.manx_decel_gees,
+            manx_min_mach       = config.manx_min_mach,
+            sensor              = config.sensor,
+            sensor_assumption   = config.sensor_assumption,
+            performance_model   = config.performance_model
+        )
+        _aircraft[key] = ac
+        if len(_aircraft) > AIRCRAFT_CACHE_SIZE:
+            _aircraft.popitem(last=False)
+    else:
+        _aircraft_stats['hits'] += 1
+        _aircraft.move_to_end(key)
+
+    return ac
+
+
+def cache_info() -> dict:
+    '''
+    Sizes of the intern table and Aircraft cache, and Aircraft cache hits/misses.
+    '''
+    return {
+        'interned':          len(_interned),
+        'aircraft':          len(_aircraft),
+        'aircraft_hits':     _aircraft_stats['hits'],
+        'aircraft_misses':   _aircraft_stats['misses'],
+    }
+
+
+def clear_caches():
+    _interned.clear()
+    _aircraft.clear()
+    _aircraft_stats['hits']   = 0
+    _aircraft_stats['misses'] = 0
+
+
+# region Serialization
+def _encode(value, shared: dict, shared_ids: dict):
+    '''
+    Encode a value for JSON. Shared objects are encoded once into shared and
+    replaced by their ID everywhere they appear.
+    '''
+    if isinstance(value, SHARED_TYPES):
+        ref = shared_ids.get(value)
+        if ref is None:
+            ref = f'{type(value).__name__}/{len(shared_ids)}'
+            shared_ids[value] = ref
+            shared[ref] = _encode_fields(value, shared, shared_ids)
+        return {'ref': ref}
+
+    if is_dataclass(value):
+        return _encode_fields(value, shared, shared_ids)
+
+    if isinstance(value, Enum):
+        return value.name
+
+    if isinstance(value, tuple):
+        return [_encode(v, shared, shared_ids) for v in value]
+
+    # numpy scalars (from np.arange grids) -> python floats
+    if hasattr(value, 'item'):
+        return value.item()
+
+    return value
+
+
+def _encode_fields(obj, shared: dict, shared_ids: dict) -> dict:
+    return {f.name: _encode(getattr(obj, f.name), shared, shared_ids) for f in fields(obj)}
+
+
+def _decode(value, typ, shared: dict, decoded: dict):
+    if value is None:
+        return None
+
+    if isinstance(value, dict) and 'ref' in value:
+        ref = value['ref']
+        if ref not in decoded:
+            typ = next(t for t in SHARED_TYPES if t.__name__ == ref.split('/')[0])
+            decoded[ref] = intern(_decode_fields(shared[ref], typ, shared, decoded))
+        return decoded[ref]
+
+    if isinstance(typ, type) and is_dataclass(typ):
+        return _decode_fields(value, typ, shared, decoded)
+
+    if isinstance(typ, type) and issubclass(typ, Enum):
+        return typ[value]
+
+    if isinstance(value, list):
+        return tuple(value)
+
+    return value
+
+
+def _decode_fields(data: dict, typ, shared: dict, decoded: dict):
+    kwargs = {f.name: _decode(data[f.name], f.type, shared, decoded) for f in fields(typ) if f.init and f.name in data}
+    return typ(**kwargs)
+
+
+def _nested(typ) -> bool:
+    # Dataclass fields written as columns of their own (e.g. the Config of
+    # each result), rather than shared by ID
+    return isinstance(typ, type) and is_dataclass(typ) and typ not in SHARED_TYPES
+
+
+def _encode_columns(objs: list, typ, shared: dict, shared_ids: dict) -> dict:
+    '''
+    Encode same-typed dataclasses as a dict of field -> list of values. Shared
+    objects are listed by ID, nested dataclasses as columns themselves.
+    '''
+    columns = {}
+    for f in fields(typ):
+        values = [getattr(obj, f.name) for obj in objs]
+        if _nested(f.type):
+            columns[f.name] = _encode_columns(values, f.type, shared, shared_ids)
+        elif f.type in SHARED_TYPES:
+            columns[f.name] = [None if v is None else _encode(v, shared, shared_ids)['ref'] for v in values]
+        else:
+            columns[f.name] = [_encode(v, shared, shared_ids) for v in values]
+    return columns
+
+
+def _decode_columns(columns: dict, typ, n: int, shared: dict, decoded: dict) -> list:
+    values = {}
+    for f in fields(typ):
+        if not f.init or f.name not in columns:
+            continue
+        column = columns[f.name]
+        if _nested(f.type):
+            values[f.name] = _decode_columns(column, f.type, n, shared, decoded)
+        elif f.type in SHARED_TYPES:
+            values[f.name] = [None if v is None else _decode({'ref': v}, f.type, shared, decoded) for v in column]
+        else:
+            values[f.name] = [_decode(v, f.type, shared, decoded) for v in column]
+    return [typ(**{name: column[i] for name, column in values.items()}) for i in range(n)]
+
+
+def write_results(results: list[ModelResult], path: str):
+    '''
+    Write model results as JSON. Each shared object (target, AOI, sensor
+    assumption, sensor/search performance) is written once under "shared" and
+    results refer to it by ID. Results are written as columns (field -> list
+    of values, the Config's fields nested under "config"), so field names
+    appear once rather than on every row.
+
+    Args:
+        results: list[ModelResult]
+        path: str. Output file path.
+    '''
+    shared     = {}
+    shared_ids = {}
+    columns = _encode_columns(results, ModelResult, shared, shared_ids)
+
+    with open(path, 'w') as f:
+        json.dump({'shared': shared, 'n': len(results), 'columns': columns}, f, separators=(',', ':'))
+
+
+def read_results(path: str) -> list[ModelResult]:
+    '''
+    Read results written by write_results (or the earlier row-per-result
+    layout). Shared objects are decoded once and interned, so the returned
+    results share sub-objects again.
+    '''
+    with open(path) as f:
+        data = json.load(f)
+
+    decoded = {}
+    if 'results' in data:
+        return [_decode_fields(row, ModelResult, data['shared'], decoded) for row in data['results']]
+    return _decode_columns(data['columns'], ModelResult, data['n'], data['shared'], decoded)
+# endregion
@@ -0,0 +1,441 @@
+from dataclasses import dataclass, replace
+import math
+import numpy as np
+from constants import *
+from performance import get_model
+from lib import (
+    validate_config,
+    calc_sensor_performance,
+    calc_search_performance,
+    solve_effective_sweep_width
+)
+from flyweight import make_aircraft
+
+
+# Forward-mode derivatives of onsta_req_cost (and onsta_req_n) with respect to
+# the airframe and sensor design parameters (PARAMS), for gradient-based
+# design optimization.
+#
+# The model chain is re-evaluated on dual numbers (a value plus its gradient
+# with respect to every parameter), mirroring lib.py one function at a time
+# like kernels.py does. The effective sweep width is a fixed point,
+# w = W(T(w)) (turn-around time T, limiting sweep width W); its derivative
+# comes from the implicit function theorem at the solved width,
+#
+#     dw/dp = (dW/dp) / (1 - dW/dw)
+#
+# evaluated with one more dual pass of the map, with w itself as an extra
+# dual direction.
+#
+# The chain is smooth except at its branches, each reported as a Branch with
+# which side it's on and the margins (dual numbers, positive on the current
+# side) that reach 0 where it switches:
+# - 'min_mach_clamp':  the deceleration leg reaches manx_min_mach
+# - 'turn_wide':       lateral offset >= 2x the turn radius
+# - 'glancing_binds':  the glancing target sets the sweep width
+# - 'legs_per_sortie': the floor() in calc_ac_search_rate (the number of
+#                      working segments, constant between integers)
+# plus the feasibility constraints 'detects_below' (altitude < slant
+# detection ranges), 'positive_sweep_width' and 'reaches_aoi'. The
+# gradients are exact within a branch; compare the branches of two
+# evaluations (same_branches) to see if a step crossed one, or bound the step
+# first (max_step).
+#
+# Only the 'limiting_cases' aspect model is supported. Performance models
+# that can't be evaluated on dual numbers (e.g. TabulatedModel) are
+# differentiated by central differences instead.
+
+PARAMS = (
+    'altitude_kft',
+    'mach',
+    'fov_deg_h',
+    'fov_deg_v',
+    'resolution_h',
+    'resolution_v',
+    'johnson_req',
+    'sensor_cost',
+)
+
+PERFORMANCE_FD_STEP = 1e-6 # relative step for performance models without duals
+
+
+class Dual:
+    '''
+    Value with its gradient with respect to the parameters. Comparisons use
+    the value only.
+    '''
+    __slots__ = ('value', 'grad')
+
+    def __init__(self, value: float, grad: np.ndarray):
+        self.value = float(value)
+        self.grad  = grad
+
+    @classmethod
+    def variable(cls, value: float, i: int, n: int) -> 'Dual':
+        grad = np.zeros(n)
+        grad[i] = 1.0
+        return cls(value, grad)
+
+    def _lift(self, other) -> 'Dual':
+        return other if isinstance(other, Dual) else Dual(other, np.zeros_like(self.grad))
+
+    def __add__(self, other):
+        other = self._lift(other)
+        return Dual(self.value + other.value, self.grad + other.grad)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = self._lift(other)
+        return Dual(self.value - other.value, self.grad - other.grad)
+
+    def __rsub__(self, other):
+        return self._lift(other) - self
+
+    def __mul__(self, other):
+        other = self._lift(other)
+        return Dual(self.value*other.value, self.grad*other.value + other.grad*self.value)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = self._lift(other)
+        return Dual(self.value/other.value, (self.grad*other.value - other.grad*self.value)/other.value**2)
+
+    def __rtruediv__(self, other):
+        return self._lift(other)/self
+
+    def __neg__(self):
+        return Dual(-self.value, -self.grad)
+
+    def __pow__(self, k):
+        if isinstance(k, Dual):
+            raise TypeError('Dual exponents are not supported')
+        return Dual(self.value**k, k*self.value**(k - 1)*self.grad)
+
+    def __lt__(self, other):
+        return self.value < _value(other)
+
+    def __le__(self, other):
+        return self.value <= _value(other)
+
+    def __gt__(self, other):
+        return self.value > _value(other)
+
+    def __ge__(self, other):
+        return self.value >= _value(other)
+
+    def __float__(self):
+        return self.value
+
+    def __repr__(self):
+        return f'Dual({self.value!r}, {self.grad!r})'
+
+
+def _value(x) -> float:
+    return x.value if isinstance(x, Dual) else x
+
+
+def _chain(x, f, df):
+    # f(x) and its derivative df(x) applied to a Dual or a float
+    if isinstance(x, Dual):
+        return Dual(f(x.value), df(x.value)*x.grad)
+    return f(x)
+
+
+def sqrt(x):
+    return _chain(x, math.sqrt, lambda v: 0.5/math.sqrt(v))
+
+
+def sin(x):
+    return _chain(x, math.sin, math.cos)
+
+
+def cos(x):
+    return _chain(x, math.cos, lambda v: -math.sin(v))
+
+
+def tan(x):
+    return _chain(x, math.tan, lambda v: 1/math.cos(v)**2)
+
+
+def acos(x):
+    return _chain(x, math.acos, lambda v: -1/math.sqrt(1 - v*v))
+
+
+@dataclass
+class Branch:
+    '''
+    Which side of a branch the evaluation is on (side), and margins that
+    are >= 0 on this side and reach 0 where it switches.
+    '''
+    side:    object
+    margins: tuple
+
+    def max_step(self, direction: np.ndarray) -> float:
+        '''
+        Largest step t along direction before a linearized margin reaches 0
+        (inf if none is approached).
+        '''
+        steps = [
+            m.value/-(m.grad@direction) for m in self.margins
+            if isinstance(m, Dual) and m.grad@direction < 0
+        ]
+        return min(steps, default=math.inf)
+
+
+def _binary(taken: bool, margin) -> Branch:
+    # margin > 0 on the taken side
+    return Branch(side=taken, margins=(margin if taken else -margin,))
+
+
+@dataclass
+class CostGradient:
+    '''
+    onsta_req_cost and onsta_req_n with their gradients with respect to
+    params, and the branches the evaluation went through.
+    '''
+    params:          tuple[str, ...]
+    x:               np.ndarray
+    onsta_req_cost:  float
+    cost_gradient:   np.ndarray
+    onsta_req_n:     float
+    n_gradient:      np.ndarray
+    branches:        dict
+
+    def same_branches(self, other: 'CostGradient') -> bool:
+        return all(self.branches[name].side == other.branches[name].side for name in self.branches)
+
+    def changed_branches(self, other: 'CostGradient') -> list[str]:
+        return [name for name in self.branches if self.branches[name].side != other.branches[name].side]
+
+    def max_step(self, direction: np.ndarray) -> float:
+        '''
+        Largest step along direction (in params space) that stays on the same
+        side of every branch, to first order.
+        '''
+        return min(branch.max_step(np.asarray(direction, dtype=float)) for branch in self.branches.values())
+
+
+def design_params(config: Config) -> np.ndarray:
+    '''
+    The config's values of PARAMS.
+    '''
+    sa = config.sensor_assumption
+    return np.array([
+        config.altitude_kft, config.mach,
+        sa.fov_deg[0], sa.fov_deg[1],
+        sa.resolution[0], sa.resolution[1],
+        sa.johnson_req, sa.cost
+    ], dtype=float)
+
+
+def with_params(config: Config, x) -> Config:
+    '''
+    The config with PARAMS set to x.
+    '''
+    x = [float(v) for v in x]
+    return replace(
+        config,
+        altitude_kft      = x[0],
+        mach              = x[1],
+        sensor_assumption = SensorAssumption(
+            fov_deg     = (x[2], x[3]),
+            resolution  = (x[4], x[5]),
+            johnson_req = x[6],
+            cost        = x[7]
+        )
+    )
+
+
+def _performance(model_name: str, mach: Dual, alt_kft: Dual) -> tuple[Dual, Dual]:
+    '''
+    Endurance (hr) and airframe cost as Duals.
+    '''
+    model = get_model(model_name)
+    try:
+        endurance, cost = model.endurance_hr(mach, alt_kft), model.cost(mach, alt_kft)
+        if isinstance(endurance, Dual) and isinstance(cost, Dual):
+            return endurance, cost
+    except (TypeError, ValueError):
+        pass
+
+    # Central differences in mach and altitude
+    def fd(fn):
+        m, a = mach.value, alt_kft.value
+        hm, ha = PERFORMANCE_FD_STEP*max(abs(m), 1), PERFORMANCE_FD_STEP*max(abs(a), 1)
+        d_mach = (fn(m + hm, a) - fn(m - hm, a))/(2*hm)
+        d_alt  = (fn(m, a + ha) - fn(m, a - ha))/(2*ha)
+        return Dual(fn(m, a), d_mach*mach.grad + d_alt*alt_kft.grad)
+
+    return fd(model.endurance_hr), fd(model.cost)
+
+
+def _straight_accelerating_leg(mach0, dist, accel, min_mach, branches):
+    # lib.calc_straight_accelerating_leg
+    t_min_mach = (min_mach - mach0)*MACH_M_PER_SEC/(accel*GEE)
+
+    a = accel*GEE/2
+    b = mach0*MACH_M_PER_SEC
+    c = -dist
+    discriminant = b**2 - 4*a*c
+    if discriminant < 0:
+        t_dist = None
+    else:
+        t1 = (-b + sqrt(discriminant))/(2*a)
+        t2 = (-b - sqrt(discriminant))/(2*a)
+        t_dist = min([t for t in [t1, t2] if t > 0], key=_value)
+
+    clamped = t_dist is None or t_min_mach < t_dist
+    if t_dist is None:
+        # Would stop before dist, until the discriminant reaches 0
+        branches['min_mach_clamp'] = Branch(side=True, margins=(-discriminant,))
+    else:
+        branches['min_mach_clamp'] = _binary(clamped, t_dist - t_min_mach)
+
+    if clamped:
+        t_decel = t_min_mach
+        d2 = mach0*MACH_M_PER_SEC*t_decel + 0.5*accel*GEE*(t_decel**2)
+        d1 = dist - d2
+        t_cruise = d1/mach0/MACH_M_PER_SEC
+        return t_decel + t_cruise, min_mach
+    return t_dist, (mach0*MACH_M_PER_SEC + accel*GEE*t_dist)/MACH_M_PER_SEC
+
+
+def _turnaround_time(config, mach, lateral_offset, downtrack_h, branches):
+    # lib.calc_coordinated_level_turnaround_time
+    t1, manx_mach = _straight_accelerating_leg(
+        mach, downtrack_h, config.manx_decel_gees, config.manx_min_mach, branches
+    )
+    tan_bank = math.tan(config.manx_bank_angle_rad)
+    radius   = (MACH_M_PER_SEC*manx_mach)**2/GEE/tan_bank
+
+    wide = lateral_offset >= 2*radius
+    branches['turn_wide'] = _binary(wide, lateral_offset - 2*radius)
+    if wide:
+        time_on_straight_segment = (lateral_offset - 2*radius)/manx_mach/MACH_M_PER_SEC
+        time_on_turn = math.pi*MACH_M_PER_SEC*manx_mach/GEE/tan_bank
+        t2 = time_on_straight_segment + time_on_turn
+    else:
+        total_angle_of_travel = math.pi + 4*acos((radius + lateral_offset/2)/(2*radius))
+        t2 = radius*total_angle_of_travel/manx_mach/MACH_M_PER_SEC
+
+    return t1 + t2 + t1
+
+
+def _limiting_sweep_width(config, mach, turn_time, xtrack, branches):
+    # lib.calc_limiting_sweep_width, 'limiting_cases'
+    time = (2*config.aoi.length)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_beaming_tgt = xtrack[0] - time*config.target.max_speed*KTS_IN_M_PER_SEC
+
+    aob = math.acos(config.target.dims[1]/config.target.dims[0])
+    tgt_speed_cross_track = config.target.max_speed*math.cos(aob)
+    tgt_speed_down_track  = config.target.max_speed*math.sin(aob)
+    time = (2*config.aoi.length - tgt_speed_down_track)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_glancing_tgt = xtrack[1] - time*tgt_speed_cross_track*KTS_IN_M_PER_SEC
+
+    glancing = sweep_width_glancing_tgt < sweep_width_beaming_tgt
+    branches['glancing_binds'] = _binary(glancing, sweep_width_beaming_tgt - sweep_width_glancing_tgt)
+    return sweep_width_glancing_tgt if glancing else sweep_width_beaming_tgt
+
+
+def cost_gradient(config: Config, solver: SolverSettings = SolverSettings()) -> CostGradient:
+    '''
+    onsta_req_cost and onsta_req_n of a valid config, with their gradients
+    with respect to PARAMS. The values are the model's (main.evaluate_config
+    with this solver); use a tight solver tolerance for gradients consistent
+    with finite differences of the values.
+
+    Raises:
+        ValueError: if the config is invalid or infeasible.
+    '''
+    valid, reason = validate_config(config)
+    if not valid:
+        raise ValueError(reason)
+    if config.aspect_model != 'limiting_cases':
+        raise ValueError(f"Gradients support the 'limiting_cases' aspect model, not {config.aspect_model!r}")
+
+    n = len(PARAMS) + 1 # plus the sweep width, for the fixed point
+    x = design_params(config)
+    alt_kft, mach, fov_h, fov_v, res_h, res_v, johnson, sensor_cost = (
+        Dual.variable(v, i, n) for i, v in enumerate(x)
+    )
+    branches = {}
+
+    # Aircraft
+    endurance_hr, airframe_cost = _performance(config.performance_model, mach, alt_kft)
+    ac_cost       = airframe_cost + sensor_cost
+    endurance_sec = endurance_hr*SEC_PER_HR
+
+    # Sensor performance (calc_sensor_performance)
+    slant = [
+        (dim/johnson)/(fov*2*math.pi/360/res)
+        for dim, fov, res in zip(config.target.dims, (fov_h, fov_v), (res_h, res_v))
+    ]
+
+    # Search performance (calc_search_performance)
+    alt_m = alt_kft*1000/FEET_PER_METER
+    branches['detects_below'] = Branch(side=True, margins=tuple(s - alt_m for s in slant))
+    if any(alt_m > s for s in slant):
+        raise ValueError('Alt > Slant detection range')
+    ground    = [sqrt(s**2 - alt_m**2) for s in slant]
+    half_fov  = fov_h*RAD_PER_DEG/2
+    downtrack = [g*cos(half_fov) for g in ground]
+    xtrack    = [2*g*sin(half_fov) for g in ground]
+
+    # Effective sweep width: the model's solution, differentiated implicitly
+    perf = calc_search_performance(
+        alt_m           = config.altitude_kft*1000/FEET_PER_METER,
+        slant_det_range = calc_sensor_performance(config.sensor_assumption, config.target).slant_detection_range,
+        fov_rad         = tuple(fov*RAD_PER_DEG for fov in config.sensor_assumption.fov_deg),
+        aoi             = config.aoi
+    )
+    solution = solve_effective_sweep_width(config, make_aircraft(config), perf, solver)
+
+    w = Dual.variable(solution.effective_sweep_width, n - 1, n)
+    W = _limiting_sweep_width(config, mach, _turnaround_time(config, mach, w, downtrack[1], branches), xtrack, branches)
+    dw = W.grad[:-1]/(1 - W.grad[-1])
+    eff_width = Dual(solution.effective_sweep_width, np.append(dw, 0.0))
+    branches['positive_sweep_width'] = Branch(side=True, margins=(eff_width,))
+    if solution.effective_sweep_width <= 0:
+        raise ValueError('Aircraft/sensor pairing has negative effective sweep width against design target')
+
+    T = _turnaround_time(config, mach, w, downtrack[1], {})
+    turn_time = Dual(solution.turn_time, np.append(T.grad[:-1] + T.grad[-1]*dw, 0.0))
+
+    # Search rate (calc_ac_search_rate)
+    aoi = config.aoi
+    time_segment_terminal = (aoi.ingress + aoi.egress + 2*aoi.length)/mach/MACH_M_PER_SEC
+    time_segment_working  = 2*turn_time + 2*aoi.length/mach/MACH_IN_M_PER_HR
+    branches['reaches_aoi'] = Branch(side=True, margins=(endurance_sec - time_segment_terminal,))
+    if time_segment_terminal > endurance_sec:
+        raise ValueError('Aircraft endurance cannot support any search legs')
+
+    segments = (endurance_sec - time_segment_terminal)/time_segment_working
+    n_working = math.floor(segments.value)
+    branches['legs_per_sortie'] = Branch(side=n_working, margins=(segments - n_working, n_working + 1 - segments))
+    n_segments  = 1 + n_working
+    flight_time = time_segment_terminal + (n_segments - 1)*time_segment_working
+    search_rate = 2*n_segments*eff_width*aoi.length/flight_time
+
+    # Fleet size (calc_onsta_requirement)
+    onsta = (aoi.length*aoi.width)/(config.aoi_revisit_time_hr*SEC_PER_HR)/search_rate
+    cost  = onsta*ac_cost
+
+    return CostGradient(
+        params         = PARAMS,
+        x              = x,
+        onsta_req_cost = cost.value,
+        cost_gradient  = cost.grad[:-1],
+        onsta_req_n    = onsta.value,
+        n_gradient     = onsta.grad[:-1],
+        branches       = {name: _total(branch, dw) for name, branch in branches.items()}
+    )
+
+
+def _total(branch: Branch, dw: np.ndarray) -> Branch:
+    # Margins' gradients w.r.t. the params, following the sweep width
+    return Branch(
+        side    = branch.side,
+        margins = tuple(Dual(m.value, m.grad[:-1] + m.grad[-1]*dw) for m in branch.margins)
+    )
@@ -0,0 +1,379 @@
+import math
+import warnings
+import numpy as np
+from constants import *
+
+# Numba is optional. Without it the 'jit' kernels below run as plain python
+# (same code, just not compiled). A numba that is installed but fails to
+# import (broken install, version mismatch with numpy, a module shadowing one
+# of its dependencies) is reported and treated like a missing one, except
+# that set_backend('jit') then refuses instead of silently running slowly.
+JIT_ERROR = None # why an installed numba couldn't be loaded
+try:
+    import numba
+except ImportError:
+    numba = None
+except Exception as e:
+    numba = None
+    JIT_ERROR = f'{type(e).__name__}: {e}'
+    warnings.warn(f'numba failed to import, jit kernels run uncompiled python ({JIT_ERROR})')
+
+JIT_AVAILABLE = numba is not None
+
+# Backends for the sweep-width stage of the batched engine (batch.py):
+# - 'numpy': numpy masks over all active configs per iteration (default)
+# - 'jit':   one fused loop over configs, each iterated to convergence by the
+#            scalar kernels below (compiled with numba when installed)
+BACKENDS = ('numpy', 'jit')
+_backend = 'numpy'
+
+
+def _jit(fn):
+    if numba is None:
+        return fn
+    return numba.njit(cache=True)(fn)
+
+
+# region Scalar kernels
+# These mirror the lib.py functions one for one, but take plain floats so
+# numba can compile them.
+@_jit
+def _turn_radius(mach, bank_angle_rad):
+    return (MACH_M_PER_SEC*mach)**2/GEE/math.tan(bank_angle_rad)
+
+
+@_jit
+def _const_turn_time(mach, bank_angle_rad, arc_angle_rad):
+    return arc_angle_rad*MACH_M_PER_SEC*mach/GEE/math.tan(bank_angle_rad)
+
+
+@_jit
+def _straight_accelerating_leg(mach0, dist, accel, min_mach):
+    t_min_mach = (min_mach-mach0)*MACH_M_PER_SEC/(accel*GEE)
+
+    a = accel*GEE/2
+    b = mach0*MACH_M_PER_SEC
+    c = -dist
+    discriminant = (b**2) - (4*a*c)
+    t_dist = math.inf
+    if discriminant >= 0:
+        t1 = (-b + (discriminant)**0.5) / (2*a)
+        t2 = (-b - (discriminant)**0.5) / (2*a)
+        if t1 > 0:
+            t_dist = t1
+        if t2 > 0 and t2 < t_dist:
+            t_dist = t2
+
+    if t_min_mach < t_dist:
+        t_decel  = t_min_mach
+        d2       = mach0*MACH_M_PER_SEC*t_decel + 0.5*accel*GEE*(t_decel**2)
+        t_cruise = (dist-d2)/mach0/MACH_M_PER_SEC
+        return t_decel + t_cruise, min_mach
+
+    return t_dist, (mach0*MACH_M_PER_SEC + accel*GEE*t_dist)/MACH_M_PER_SEC
+
+
+@_jit
+def _turn(leg_time, manx_mach, bank_angle_rad, lateral_offset):
+    radius = _turn_radius(manx_mach, bank_angle_rad)
+    if lateral_offset >= 2*radius:
+        t2 = (lateral_offset - 2*radius)/manx_mach/MACH_M_PER_SEC + _const_turn_time(manx_mach, bank_angle_rad, math.pi)
+    else:
+        total_angle_of_travel = math.pi + 4*(math.acos((radius+lateral_offset/2)/(2*radius)))
+        t2 = radius*total_angle_of_travel/manx_mach/MACH_M_PER_SEC
+    return leg_time + t2 + leg_time
+
+
+@_jit
+def _turnaround_time(mach, bank_angle_rad, decel_gees, min_mach, downtrack_range_v, lateral_offset):
+    leg_time, manx_mach = _straight_accelerating_leg(mach, downtrack_range_v, decel_gees, min_mach)
+    return _turn(leg_time, manx_mach, bank_angle_rad, lateral_offset)
+
+
+@_jit
+def _limiting_sweep_width(turn_time, mach, aoi_length, dim_h, dim_v, max_speed, xtrack_h, xtrack_v):
+    # Beaming
+    time = (2*aoi_length)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_beaming_tgt = xtrack_h - time*max_speed*KTS_IN_M_PER_SEC
+
+    # Glancing
+    if dim_v > dim_h:
+        return sweep_width_beaming_tgt
+    aob = math.acos(dim_v/dim_h)
+    tgt_speed_cross_track = max_speed*math.cos(aob)
+    tgt_speed_down_track  = max_speed*math.sin(aob)
+
+    time = (2*aoi_length-tgt_speed_down_track)/mach/MACH_M_PER_SEC + turn_time
+    sweep_width_glancing_tgt = xtrack_v - time*tgt_speed_cross_track*KTS_IN_M_PER_SEC
+
+    return min(sweep_width_beaming_tgt, sweep_width_glancing_tgt)
+
+
+@_jit
+def _sweep_width_loop(
+        mach, bank_angle_rad, decel_gees, min_mach,
+        aoi_length, dim_h, dim_v, max_speed,
+        downtrack_v, xtrack_h, xtrack_v,
+        tol, max_iter,
+        width_out, turn_time_out, iterations_out, converged_out
+    ):
+    for k in range(len(mach)):
+        leg_time, manx_mach = _straight_accelerating_leg(mach[k], downtrack_v[k], decel_gees[k], min_mach[k])
+
+        width_0   = xtrack_v[k]
+        turn_time = _turn(leg_time, manx_mach, bank_angle_rad[k], width_0)
+        width_1   = _limiting_sweep_width(turn_time, mach[k], aoi_length[k], dim_h[k], dim_v[k], max_speed[k], xtrack_h[k], xtrack_v[k])
+
+        i = 0
+        converged = True
+        if width_1 > 0:
+            while abs((width_1 - width_0)/width_0) > tol and i < max_iter:
+                i = i+1
+                width_0   = width_1
+                turn_time = _turn(leg_time, manx_mach, bank_angle_rad[k], width_0)
+                width_1   = _limiting_sweep_width(turn_time, mach[k], aoi_length[k], dim_h[k], dim_v[k], max_speed[k], xtrack_h[k], xtrack_v[k])
+            converged = not abs((width_1 - width_0)/width_0) > tol
+
+        width_out[k]      = width_1
+        turn_time_out[k]  = turn_time
+        # Evaluations of the turn-around time, as counted by solvers.py
+        iterations_out[k] = i+1
+        converged_out[k]  = converged
+# endregion
+
+
+# region Array interface
+def _arrays(*args):
+    return [np.ascontiguousarray(a, dtype=float) for a in np.broadcast_arrays(*args)]
+
+
+def turn_radius(mach, bank_angle_rad) -> np.ndarray:
+    '''
+    lib.turn_radius over arrays.
+    '''
+    mach, bank_angle_rad = _arrays(mach, bank_angle_rad)
+    return (MACH_M_PER_SEC*mach)**2/GEE/np.tan(bank_angle_rad)
+
+
+def const_turn_time(mach, bank_angle_rad, arc_angle_rad) -> np.ndarray:
+    '''
+    lib.const_turn_time over arrays.
+    '''
+    mach, bank_angle_rad, arc_angle_rad = _arrays(mach, bank_angle_rad, arc_angle_rad)
+    return arc_angle_rad*MACH_M_PER_SEC*mach/GEE/np.tan(bank_angle_rad)
+
+
+@_jit
+def _straight_accelerating_leg_loop(mach0, dist, accel, min_mach, time_out, machf_out):
+    for k in range(len(mach0)):
+        time_out[k], machf_out[k] = _straight_accelerating_leg(mach0[k], dist[k], accel[k], min_mach[k])
+
+
+def straight_accelerating_leg(mach0, dist, accel, min_mach) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    lib.calc_straight_accelerating_leg over arrays.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (time on leg, final mach)
+    '''
+    mach0, dist, accel, min_mach = _arrays(mach0, dist, accel, min_mach)
+    time  = np.empty(mach0.shape)
+    machf = np.empty(mach0.shape)
+    _straight_accelerating_leg_loop(mach0.ravel(), dist.ravel(), accel.ravel(), min_mach.ravel(), time.ravel(), machf.ravel())
+    return time, machf
+
+
+@_jit
+def _turnaround_time_loop(mach, bank_angle_rad, decel_gees, min_mach, downtrack_v, lateral_offset, out):
+    for k in range(len(mach)):
+        out[k] = _turnaround_time(mach[k], bank_angle_rad[k], decel_gees[k], min_mach[k], downtrack_v[k], lateral_offset[k])
+
+
+def coordinated_level_turnaround_time(mach, bank_angle_rad, decel_gees, min_mach, downtrack_range_v, lateral_offset) -> np.ndarray:
+    '''
+    lib.calc_coordinated_level_turnaround_time over arrays. downtrack_range_v is
+    the downtrack detection range against the target's vertical dimension.
+    '''
+    arrays = _arrays(mach, bank_angle_rad, decel_gees, min_mach, downtrack_range_v, lateral_offset)
+    out = np.empty(arrays[0].shape)
+    _turnaround_time_loop(*[a.ravel() for a in arrays], out.ravel())
+    return out
+
+
+def effective_sweep_width(
+        mach, manx_bank_angle_rad, manx_decel_gees, manx_min_mach,
+        aoi_length, target_dims, target_max_speed,
+        downtrack_detection_range, xtrack_detection_width,
+        tol: float = 0.01,
+        max_iter: int = 25
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    lib.calc_effective_sweep_width (fixed point iteration) over arrays, as one
+    fused loop. Same outputs as batch.sweep_width_stage.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: (effective sweep
+        width, turn-around time, iterations, converged)
+    '''
+    n = len(mach)
+    width      = np.empty(n)
+    turn_time  = np.empty(n)
+    iterations = np.empty(n, dtype=np.int64)
+    converged  = np.empty(n, dtype=np.bool_)
+
+    f = lambda a: np.ascontiguousarray(a, dtype=float)
+    _sweep_width_loop(
+        f(mach), f(manx_bank_angle_rad), f(manx_decel_gees), f(manx_min_mach),
+        f(aoi_length), f(target_dims[:, 0]), f(target_dims[:, 1]), f(target_max_speed),
+        f(downtrack_detection_range[:, 1]), f(xtrack_detection_width[:, 0]), f(xtrack_detection_width[:, 1]),
+        float(tol), int(max_iter),
+        width, turn_time, iterations, converged
+    )
+    return width, turn_time, iterations, converged
+# endregion
+
+
+# region Backend selection
+def get_backend() -> str:
+    return _backend
+
+
+def set_backend(name: str, verify: bool = True):
+    '''
+    Select the backend for the batched engine's sweep-width stage.
+
+    Args:
+        name (str): 'numpy' or 'jit'. 'jit' runs as plain python (slowly) if
+            numba isn't installed, and raises if numba is installed but
+            failed to import (see JIT_ERROR).
+        verify (bool): check the 'jit' kernels against the lib.py reference
+            before switching (see check_against_reference).
+    '''
+    global _backend
+
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown backend {name!r}, choose from {BACKENDS}')
+
+    if name == 'jit':
+        if JIT_ERROR is not None:
+            raise RuntimeError(f'jit backend unavailable: numba is installed but failed to import ({JIT_ERROR})')
+        if not JIT_AVAILABLE:
+            warnings.warn('numba not installed, jit backend runs uncompiled python')
+        if verify:
+            errors = check_against_reference(n=200)
+            bad = {k: v for k, v in errors.items() if v > 1e-9}
+            if bad:
+                raise RuntimeError(f'jit kernels disagree with reference: {bad}')
+
+    _backend = name
+
+
+def check_against_reference(n: int = 1000, seed: int = 0) -> dict:
+    '''
+    Evaluate the array kernels and the lib.py reference functions on the same
+    random inputs.
+
+    Returns:
+        dict: max relative error per kernel.
+    '''
+    from lib import (
+        turn_radius as ref_turn_radius,
+        const_turn_time as ref_const_turn_time,
+        calc_straight_accelerating_leg,
+        calc_coordinated_level_turnaround_time,
+        calc_search_performance,
+        calc_sensor_performance,
+        calc_effective_sweep_width
+    )
+
+    rng = np.random.default_rng(seed)
+
+    def rel_err(actual, expected):
+        actual, expected = np.asarray(actual, dtype=float), np.asarray(expected, dtype=float)
+        return float(np.max(np.abs(actual-expected)/np.maximum(np.abs(expected), 1e-300), initial=0))
+
+    mach     = rng.uniform(0.3, 0.9, n)
+    bank     = rng.uniform(20, 60, n)*RAD_PER_DEG
+    arc      = rng.uniform(0, 2*math.pi, n)
+    decel    = rng.uniform(-1.5, -0.2, n)
+    min_mach = rng.uniform(0.1, 0.25, n)
+    dist     = rng.uniform(1e2, 5e4, n)
+    offset   = rng.uniform(1e2, 2e4, n)
+
+    errors = {}
+    errors['turn_radius'] = rel_err(
+        turn_radius(mach, bank),
+        [ref_turn_radius(m, b) for m, b in zip(mach, bank)]
+    )
+    errors['const_turn_time'] = rel_err(
+        const_turn_time(mach, bank, arc),
+        [ref_const_turn_time(m, b, a) for m, b, a in zip(mach, bank, arc)]
+    )
+    errors['straight_accelerating_leg'] = rel_err(
+        np.column_stack(straight_accelerating_leg(mach, dist, decel, min_mach)),
+        [calc_straight_accelerating_leg(m, d, a, mm) for m, d, a, mm in zip(mach, dist, decel, min_mach)]
+    )
+
+    # Sweep width and turn-around on realistic configs
+    expected_turn, expected_sweep, rows = [], [], []
+    for k in range(n):
+        sensor_assumption = SensorAssumption(
+            fov_deg     = (float(rng.uniform(10, 60)),)*2,
+            resolution  = (int(rng.integers(480, 1920)),)*2,
+            johnson_req = int(rng.integers(2, 12)),
+            cost        = 1
+        )
+        config = Config(
+            altitude_kft        = float(rng.uniform(5, 25)),
+            mach                = float(mach[k]),
+            manx_bank_angle_rad = float(bank[k]),
+            manx_decel_gees     = float(decel[k]),
+            manx_min_mach       = float(min_mach[k]),
+            sensor              = Sensor.MED,
+            sensor_assumption   = sensor_assumption,
+            target              = DesignTarget(type='Frigate', dims=(160, 40), max_speed=25),
+            aoi                 = AOI(length=100_000, width=100_000, ingress=100_000, egress=100_000),
+            aoi_revisit_time_hr = 6
+        )
+        ac = Aircraft(
+            alt_kft             = config.altitude_kft,
+            mach                = config.mach,
+            manx_bank_angle_rad = config.manx_bank_angle_rad,
+            manx_decel_gees     = config.manx_decel_gees,
+            manx_min_mach       = config.manx_min_mach,
+            sensor              = config.sensor,
+            sensor_assumption   = config.sensor_assumption
+        )
+        search_perf = calc_search_performance(
+            alt_m           = ac.alt_m,
+            slant_det_range = calc_sensor_performance(sensor_assumption, config.target).slant_detection_range,
+            fov_rad         = tuple([fov_deg * RAD_PER_DEG for fov_deg in sensor_assumption.fov_deg]),
+            aoi             = config.aoi
+        )
+        if not search_perf.valid:
+            continue
+
+        expected_turn.append(calc_coordinated_level_turnaround_time(ac, offset[k], search_perf))
+        expected_sweep.append(calc_effective_sweep_width(config, ac, search_perf))
+        rows.append((k, config, search_perf))
+
+    if rows:
+        idx       = np.array([k for k, _, _ in rows])
+        downtrack = np.array([p.downtrack_detection_range for _, _, p in rows])
+        xtrack    = np.array([p.xtrack_detection_width for _, _, p in rows])
+
+        errors['coordinated_level_turnaround_time'] = rel_err(
+            coordinated_level_turnaround_time(mach[idx], bank[idx], decel[idx], min_mach[idx], downtrack[:, 1], offset[idx]),
+            expected_turn
+        )
+        width, turn_time, _, _ = effective_sweep_width(
+            mach[idx], bank[idx], decel[idx], min_mach[idx],
+            np.array([c.aoi.length for _, c, _ in rows], dtype=float),
+            np.array([c.target.dims for _, c, _ in rows], dtype=float),
+            np.array([c.target.max_speed for _, c, _ in rows], dtype=float),
+            downtrack, xtrack
+        )
+        errors['effective_sweep_width'] = rel_err(np.column_stack([width, turn_time]), expected_sweep)
+
+    return errors
+# endregion
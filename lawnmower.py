@@ -0,0 +1,299 @@
+from dataclasses import dataclass
+import math
+import numpy as np
+from constants import *
+from events import EventQueue
+import aspect
+from batch import ConfigBatch, BatchResult, evaluate_batch, straight_accelerating_leg
+
+
+# Discrete-event simulation of the lawnmower search the analytic model assumes,
+# to check its overlap assumptions against randomly placed moving targets.
+#
+# The aircraft flies legs down the AOI's length, offset laterally by the
+# effective sweep width, starting half a sweep width in from the edge. Between
+# legs it turns around outside the AOI (calc_coordinated_level_turnaround_time):
+# straight out, turn, then straight back in for the downtrack detection range
+# vs. the target's height, which it searches on. Having covered the AOI's
+# width it works back the other way. Legs are flown at the physical cruise
+# speed (the analytic model's time_segment_working uses MACH_IN_M_PER_HR).
+#
+# Targets start uniformly over the AOI with uniform random headings and move at
+# constant speed, reflecting off the AOI's edges. The sensor sees a rectangle
+# ahead of the aircraft: cross-track width and downtrack range against the
+# dimension each target presents at its aspect (see aspect.py). Sensor looks
+# are scheduled often enough that no target can cross the footprint between
+# looks.
+
+
+@dataclass
+class LawnmowerScenario:
+    '''
+    Everything the simulation needs for one config.
+    '''
+    mach:                  float
+    aoi_length:            float # m
+    aoi_width:             float # m
+    sweep_width:           float # m, effective sweep width (leg spacing)
+    turn_time:             float # s
+    straight_time:         float # s, each straight part of the turn-around
+    straight_dist:         float # m, downtrack detection range vs. height
+    target_dims:           np.ndarray
+    target_max_speed:      float # kts
+    slant_detection_range: np.ndarray
+    alt_m:                 float
+    half_fov_h_rad:        float
+    manx_mach:             float = None # at the end of the deceleration leg
+
+    @classmethod
+    def from_batch(cls, batch: ConfigBatch, result: BatchResult, i: int) -> 'LawnmowerScenario':
+        '''
+        Scenario for config i of an evaluated batch (must be valid through the
+        sweep width stage).
+        '''
+        if not result.effective_sweep_width[i] > 0:
+            raise ValueError(f'Config {i} has no positive effective sweep width: {result.reason[i]}')
+
+        straight_time, manx_mach = straight_accelerating_leg(
+            mach0    = batch.mach[i:i+1],
+            dist     = result.downtrack_detection_range[i:i+1, 1],
+            accel    = batch.manx_decel_gees[i:i+1],
+            min_mach = batch.manx_min_mach[i:i+1]
+        )
+        return cls(
+            mach                  = float(batch.mach[i]),
+            aoi_length            = float(batch.aoi_length[i]),
+            aoi_width             = float(batch.aoi_width[i]),
+            sweep_width           = float(result.effective_sweep_width[i]),
+            turn_time             = float(result.ac_turn_time[i]),
+            straight_time         = float(straight_time[0]),
+            straight_dist         = float(result.downtrack_detection_range[i, 1]),
+            target_dims           = batch.target_dims[i],
+            target_max_speed      = float(batch.target_max_speed[i]),
+            slant_detection_range = result.slant_detection_range[i],
+            alt_m                 = float(batch.altitude_kft[i]*1000/FEET_PER_METER),
+            half_fov_h_rad        = float(batch.sensor_assumption_fov_deg[i, 0]*RAD_PER_DEG/2),
+            manx_mach             = float(manx_mach[0]),
+        )
+
+    @property
+    def n_legs(self) -> int:
+        return max(math.ceil(self.aoi_width/self.sweep_width), 1)
+
+    @property
+    def leg_time(self) -> float:
+        return self.aoi_length/self.mach/MACH_M_PER_SEC
+
+    def pass_time(self) -> float:
+        '''
+        Time to cover the AOI's width once (first leg to last leg).
+        '''
+        return self.n_legs*self.leg_time + (self.n_legs - 1)*self.turn_time
+
+    def next_leg(self, k: int, step: int) -> tuple[int, int]:
+        '''
+        Index of the leg after leg k, moving step (+1 or -1) legs across and
+        working back at the edges. Returns (next leg, step).
+        '''
+        if self.n_legs == 1:
+            return 0, step
+        if not 0 <= k + step < self.n_legs:
+            step = -step
+        return k + step, step
+
+    def legs(self, horizon_sec: float = math.inf):
+        '''
+        Lazily yield (start time, lateral position, direction) of each leg
+        starting before horizon_sec, in order. Direction is +1 flying from
+        x = 0 to the AOI's length, -1 back.
+        '''
+        t, k, step, direction = 0.0, 0, 1, 1
+        while t < horizon_sec:
+            yield t, self.sweep_width/2 + k*self.sweep_width, direction
+            k, step = self.next_leg(k, step)
+            t += self.leg_time + self.turn_time
+            direction = -direction
+
+
+@dataclass
+class LawnmowerResult:
+    n_targets:         int
+    horizon_sec:       float
+    time_to_detection: np.ndarray # s, NaN if not detected within the horizon
+    looks:             int        # sensor looks simulated
+    events:            int
+
+    @property
+    def pd(self) -> float:
+        '''
+        Empirical probability of detection within the horizon.
+        '''
+        return float(np.mean(~np.isnan(self.time_to_detection)))
+
+    @property
+    def mean_time_to_detection(self) -> float:
+        detected = self.time_to_detection[~np.isnan(self.time_to_detection)]
+        return float(detected.mean()) if len(detected) else math.nan
+
+    def time_to_detection_percentile(self, q) -> float:
+        return float(np.nanpercentile(self.time_to_detection, q))
+
+
+def _fold(u, length):
+    '''
+    Position along [0, length] of a point moving freely along u, reflecting
+    off both ends.
+    '''
+    return length - np.abs(np.mod(u, 2*length) - length)
+
+
+def simulate_lawnmower(
+        scenario: LawnmowerScenario,
+        n_targets: int = 100_000,
+        horizon_sec: float = None,
+        seed: int = 0,
+        target_speed: str = 'max'
+    ) -> LawnmowerResult:
+    '''
+    Fly the lawnmower pattern against randomly placed moving targets.
+
+    Args:
+        scenario (LawnmowerScenario)
+        n_targets (int)
+        horizon_sec (float): simulated time; default one pass over the AOI.
+        seed (int): random seed for the targets.
+        target_speed (str): 'max' (every target at the design target's max
+            speed) or 'uniform' (uniform between 0 and max).
+
+    Returns:
+        LawnmowerResult
+    '''
+    s   = scenario
+    rng = np.random.default_rng(seed)
+    if horizon_sec is None:
+        horizon_sec = s.pass_time()
+
+    # Targets
+    x0      = rng.uniform(0, s.aoi_length, n_targets)
+    y0      = rng.uniform(0, s.aoi_width, n_targets)
+    heading = rng.uniform(0, 2*np.pi, n_targets)
+    if target_speed == 'max':
+        speed = np.full(n_targets, s.target_max_speed)
+    elif target_speed == 'uniform':
+        speed = rng.uniform(0, s.target_max_speed, n_targets)
+    else:
+        raise ValueError(f"target_speed must be 'max' or 'uniform', is {target_speed!r}")
+    vx = speed*KTS_IN_M_PER_SEC*np.cos(heading)
+    vy = speed*KTS_IN_M_PER_SEC*np.sin(heading)
+
+    # Footprint against each target's aspect (angle off the beam; reflecting
+    # off the edges doesn't change it)
+    aob = np.arccos(np.abs(np.sin(heading)))[None, :]
+    xtrack = aspect.aspect_xtrack_width(
+        aob,
+        s.target_dims[None, :],
+        s.slant_detection_range[None, :],
+        np.array([s.alt_m]),
+        np.array([s.half_fov_h_rad])
+    )[0]
+    downtrack = xtrack/2/math.tan(s.half_fov_h_rad)
+
+    # Look often enough that nothing crosses the shallowest footprint between
+    # looks
+    ac_speed = s.mach*MACH_M_PER_SEC
+    dt_look  = downtrack.min()/(ac_speed + s.target_max_speed*KTS_IN_M_PER_SEC)
+
+    time_to_detection = np.full(n_targets, np.nan)
+    active  = np.arange(n_targets)
+    n_looks = 0
+
+    def look(t, xa, ya, direction):
+        nonlocal active, n_looks
+        n_looks += 1
+        if len(active) == 0:
+            return
+        xt = _fold(x0[active] + vx[active]*t, s.aoi_length)
+        yt = _fold(y0[active] + vy[active]*t, s.aoi_width)
+        dx = (xt - xa)*direction
+        hit = (dx >= 0) & (dx <= downtrack[active]) & (np.abs(yt - ya) <= xtrack[active]/2)
+        time_to_detection[active[hit]] = t
+        active = active[~hit]
+
+    queue = EventQueue()
+    step  = 1 # legs to move across after each turn, -1 working back
+
+    # Straight, searching segments are (kind, t0, t1, x0, x1, y, direction),
+    # kind 'leg' or 'run_in' (back into the AOI after turning around)
+    def searching(t, segment):
+        _, t0, t1, xs, xe, y, direction = segment
+        frac = (t - t0)/(t1 - t0) if t1 > t0 else 1.0
+        look(t, xs + frac*(xe - xs), y, direction)
+        if t + dt_look < t1:
+            queue.push(t + dt_look, 'look', segment)
+        else:
+            queue.push(t1, 'segment_end', segment)
+
+    def segment_end(t, segment):
+        kind, _, _, _, xe, y, direction = segment
+        look(t, xe, y, direction)
+        queue.push(t, 'turn' if kind == 'leg' else 'leg', segment)
+
+    def leg(t, segment):
+        _, _, _, _, _, y, direction = segment
+        xs, xe = (0.0, s.aoi_length) if direction > 0 else (s.aoi_length, 0.0)
+        searching(t, ('leg', t, t + s.leg_time, xs, xe, y, direction))
+
+    def turn(t, segment):
+        nonlocal step
+        _, _, _, _, xe, y, direction = segment
+        # Next leg's lateral position, working back at the edges
+        k, step = s.next_leg(round((y - s.sweep_width/2)/s.sweep_width), step)
+        y_next  = s.sweep_width/2 + k*s.sweep_width
+        # Out, turn, then the straight run back in, searching
+        t_in = t + s.turn_time - s.straight_time
+        xs   = xe + direction*s.straight_dist
+        queue.push(t_in, 'run_in', ('run_in', t_in, t_in + s.straight_time, xs, xe, y_next, -direction))
+
+    queue.push(0.0, 'leg', ('run_in', 0.0, 0.0, 0.0, 0.0, s.sweep_width/2, 1))
+    queue.run(
+        {
+            'leg':         leg,
+            'look':        searching,
+            'segment_end': segment_end,
+            'turn':        turn,
+            'run_in':      searching,
+        },
+        until = horizon_sec
+    )
+
+    return LawnmowerResult(
+        n_targets         = n_targets,
+        horizon_sec       = horizon_sec,
+        time_to_detection = time_to_detection,
+        looks             = n_looks,
+        events            = queue.processed
+    )
+
+
+def simulate_batch(
+        batch: ConfigBatch,
+        result: BatchResult = None,
+        idx = None,
+        n_targets: int = 100_000,
+        horizon_sec: float = None,
+        seed: int = 0
+    ) -> list[LawnmowerResult | None]:
+    '''
+    Spot-check a sweep: simulate configs idx (default: all) of the batch.
+    None for configs without a positive effective sweep width.
+    '''
+    if result is None:
+        result = evaluate_batch(batch)
+    if idx is None:
+        idx = range(len(batch))
+
+    return [
+        simulate_lawnmower(LawnmowerScenario.from_batch(batch, result, i), n_targets, horizon_sec, seed)
+        if result.effective_sweep_width[i] > 0 else None
+        for i in idx
+    ]
@@ -1,6 +1,11 @@
 import math
 from dataclasses import fields
+import numpy as np
 from constants import *
+from performance import PERFORMANCE_MODELS
+import solvers
+from convergence_trace import ConvergenceTrace
+import aspect
 
 
 def validate_config(config: Config) -> tuple[bool, str]:
@@ -46,6 +51,12 @@ def validate_config(config: Config) -> tuple[bool, str]:
     if config.target.max_speed <= 0:
         return((False, f'Target speed value must be > 0, is {config.target.max_speed}'))
 
+    if config.performance_model not in PERFORMANCE_MODELS:
+        return((False, f'Unknown performance model {config.performance_model}'))
+
+    if config.aspect_model not in ASPECT_MODELS:
+        return((False, f'Unknown aspect model {config.aspect_model}'))
+
 
     return (True, None)
 
@@ -320,11 +331,102 @@ def calc_coordinated_level_turnaround_time(
     return t1 + t2 + t3
 
 
+def calc_limiting_sweep_width(
+        config: Config,
+        ac: Aircraft,
+        turn_time: float,
+        ac_search_perf: AircraftSearchPerformance,
+        sensor_perf: SensorPerformance = None
+    ) -> float:
+    '''
+    Sweep width that keeps the limiting targets (beaming and glancing, see
+    calc_effective_sweep_width) from slipping between legs, given the 
+    turn-around time between legs.
+
+    With config.aspect_model 'continuous', the worst case over all target 
+    aspects instead (see aspect.py).
+
+    Args:
+        sensor_perf (SensorPerformance): optional, the config's sensor
+            performance, computed here if not given.
+
+    Returns:
+        float: the smaller of the beaming and glancing sweep widths, in meters.
+    '''
+    return calc_binding_aspect(config, ac, turn_time, ac_search_perf, sensor_perf)[0]
+
+
+def calc_binding_aspect(
+        config: Config,
+        ac: Aircraft,
+        turn_time: float,
+        ac_search_perf: AircraftSearchPerformance,
+        sensor_perf: SensorPerformance = None
+    ) -> tuple[float, float]:
+    '''
+    Limiting sweep width under config.aspect_model, and the target aspect 
+    (angle off the beam, 0 is beaming) that sets it.
+
+    Args:
+        sensor_perf (SensorPerformance): optional, the config's sensor
+            performance ('continuous' only), computed here if not given.
+
+    Returns:
+        tuple[float, float]: (sweep width in meters, binding aob in rad)
+    '''
+
+    if config.aspect_model == 'continuous':
+        if sensor_perf is None:
+            sensor_perf = calc_sensor_performance(config.sensor_assumption, config.target)
+        inputs = aspect.AspectInputs(
+            continuous            = np.array([True]),
+            slant_detection_range = np.array([sensor_perf.slant_detection_range]),
+            alt_m                 = np.array([ac.alt_m]),
+            half_fov_h_rad        = np.array([config.sensor_assumption.fov_deg[0]*RAD_PER_DEG/2])
+        )
+        width, aob = aspect.limiting_sweep_width(
+            turn_time              = np.array([turn_time]),
+            mach                   = np.array([ac.mach]),
+            aoi_length             = np.array([config.aoi.length]),
+            target_dims            = np.array([config.target.dims], dtype=float),
+            target_max_speed       = np.array([config.target.max_speed]),
+            xtrack_detection_width = np.array([ac_search_perf.xtrack_detection_width]),
+            inputs                 = inputs
+        )
+        return float(width[0]), float(aob[0])
+
+    # Beaming
+    time_downtrack = (2*config.aoi.length)/ac.mach/MACH_M_PER_SEC
+    time_turning   = turn_time
+    time           = time_downtrack + time_turning
+
+    tgt_beaming_dist_trav_cross_track = time * config.target.max_speed * KTS_IN_M_PER_SEC
+    sweep_width_beaming_tgt           = ac_search_perf.xtrack_detection_width[0] - tgt_beaming_dist_trav_cross_track
+
+    # Glancing
+    aob = math.acos(config.target.dims[1]/config.target.dims[0])
+    tgt_speed_cross_track = config.target.max_speed * math.cos(aob)
+    tgt_speed_down_track  = config.target.max_speed * math.sin(aob)
+
+    time_downtrack = (2*config.aoi.length-tgt_speed_down_track)/ac.mach/MACH_M_PER_SEC
+    time_turning   = turn_time
+    time           = time_downtrack + time_turning
+
+    tgt_glancing_dist_trav_cross_track = time * tgt_speed_cross_track * KTS_IN_M_PER_SEC
+    sweep_width_glancing_tgt           = ac_search_perf.xtrack_detection_width[1] - tgt_glancing_dist_trav_cross_track
+
+    # Same as min(): keep beaming unless glancing is strictly smaller
+    if sweep_width_glancing_tgt < sweep_width_beaming_tgt:
+        return sweep_width_glancing_tgt, aob
+    return sweep_width_beaming_tgt, 0.0
+
+
 def calc_effective_sweep_width(
         config: Config,
         ac: Aircraft,
         ac_search_perf: AircraftSearchPerformance,
-        debug: bool = False
+        trace: ConvergenceTrace = None,
+        config_id: int = 0
 ) -> tuple[float, float]:
     '''
     Calculate the effective sweep width and turn-around time for the aircraft
@@ -379,18 +481,23 @@ def calc_effective_sweep_width(
     than 1%, repeat steps 3) and 4) up to 25 times.
 
     Args:
+    trace: ConvergenceTrace: optional, records each iteration (offset, 
+    turn-around time, new offset) under config_id
 
     Returns:
     tuple[float, float]: (effective sweep width in meters, turn-around time in 
     sec)
     '''
 
-    if debug: print(f'calc_effective_sweep_width for {config.altitude_kft}, {config.mach}, {config.sensor}')
-    
     # Initial effective sweep width is cross-track detection width vs. target's
     # height
     effective_sweep_width_0 = ac_search_perf.xtrack_detection_width[1]
 
+    # Doesn't change between iterations
+    sensor_perf = None
+    if config.aspect_model == 'continuous':
+        sensor_perf = calc_sensor_performance(config.sensor_assumption, config.target)
+
 
     # Calc initial aircraft turn-around time
     ac_turn_time_0 = calc_coordinated_level_turnaround_time(
@@ -400,43 +507,17 @@ def calc_effective_sweep_width(
     )
 
 
-    # Calc initial effective sweep width
-    ## Limiting beaming target
-    def sweep_width_for_limiting_cases(config, ac, turn_time, ac_search_perf):
-
-        # Beaming
-        time_downtrack = (2*config.aoi.length)/ac.mach/MACH_M_PER_SEC
-        time_turning   = turn_time
-        time           = time_downtrack + time_turning
-
-        tgt_beaming_dist_trav_cross_track = time * config.target.max_speed * KTS_IN_M_PER_SEC
-        sweep_width_beaming_tgt           = ac_search_perf.xtrack_detection_width[0] - tgt_beaming_dist_trav_cross_track
-
-        # Glancing
-        aob = math.acos(config.target.dims[1]/config.target.dims[0])
-        tgt_speed_cross_track = config.target.max_speed * math.cos(aob)
-        tgt_speed_down_track  = config.target.max_speed * math.sin(aob)
-
-        time_downtrack = (2*config.aoi.length-tgt_speed_down_track)/ac.mach/MACH_M_PER_SEC
-        time_turning   = turn_time
-        time           = time_downtrack + time_turning
-
-        tgt_glancing_dist_trav_cross_track = time * tgt_speed_cross_track * KTS_IN_M_PER_SEC
-        sweep_width_glancing_tgt           = ac_search_perf.xtrack_detection_width[1] - tgt_glancing_dist_trav_cross_track
-
-        return min(sweep_width_beaming_tgt, sweep_width_glancing_tgt)
-
     # Calc first iteration
-    effective_sweep_width_1 = sweep_width_for_limiting_cases(config, ac, ac_turn_time_0, ac_search_perf)
-    if debug: print(f'    offset/time -> new offset: {effective_sweep_width_0:0.0f}/{ac_turn_time_0:0.0f} -> {effective_sweep_width_1:0.0f} {100*(effective_sweep_width_1-effective_sweep_width_0)/effective_sweep_width_0:0.5f}%')
+    effective_sweep_width_1 = calc_limiting_sweep_width(config, ac, ac_turn_time_0, ac_search_perf, sensor_perf)
+    if trace is not None: trace.record(config_id, 1, effective_sweep_width_0, ac_turn_time_0, effective_sweep_width_1)
     
     # Check if negative (infeasible) or 0 (infeasible and will cause DivByZero 
     # error shortly)
     if effective_sweep_width_1 <= 0:
-        if debug: print(f'    neg width, exiting!\n')
         return (effective_sweep_width_1, ac_turn_time_0)
 
     # Check for convergence
+    ac_turn_time_1 = ac_turn_time_0
     i=0
     while abs(((effective_sweep_width_1 - effective_sweep_width_0)/effective_sweep_width_0)) > 0.01 and i<25:
         i = i+1
@@ -446,14 +527,83 @@ def calc_effective_sweep_width(
             lateral_offset = effective_sweep_width_0,
             ac_search_perf = ac_search_perf
         )
-        effective_sweep_width_1 = sweep_width_for_limiting_cases(config, ac, ac_turn_time_1, ac_search_perf)
-        if debug: print(f' {i}: offset/time -> new offset: {effective_sweep_width_0:0.0f}/{ac_turn_time_1:0.0f} -> {effective_sweep_width_1:0.0f} {100*(effective_sweep_width_1-effective_sweep_width_0)/effective_sweep_width_0:0.5f}%')
+        effective_sweep_width_1 = calc_limiting_sweep_width(config, ac, ac_turn_time_1, ac_search_perf, sensor_perf)
+        if trace is not None: trace.record(config_id, i+1, effective_sweep_width_0, ac_turn_time_1, effective_sweep_width_1)
 
 
-    if debug: print()
     return (effective_sweep_width_1, ac_turn_time_1)
     
 
+def solve_effective_sweep_width(
+        config: Config,
+        ac: Aircraft,
+        ac_search_perf: AircraftSearchPerformance,
+        solver: SolverSettings = SolverSettings(),
+        trace: ConvergenceTrace = None,
+        config_id: int = 0,
+        sensor_perf: SensorPerformance = None
+) -> SweepWidthSolution:
+    '''
+    Same calculation as calc_effective_sweep_width, with a selectable solver
+    for the self-consistent lateral offset (see solvers.py) and a reported 
+    iteration count and convergence status. The default settings reproduce
+    calc_effective_sweep_width.
+
+    Args:
+        config (Config)
+        ac (Aircraft)
+        ac_search_perf (AircraftSearchPerformance)
+        solver (SolverSettings): method, tolerance and iteration cap.
+        trace (ConvergenceTrace): optional, records every evaluation under
+            config_id.
+        sensor_perf (SensorPerformance): optional, the config's sensor
+            performance ('continuous' only), computed once here if not given.
+
+    Returns:
+        SweepWidthSolution, with the binding aspect of the final width
+    '''
+    if config.aspect_model == 'continuous' and sensor_perf is None:
+        sensor_perf = calc_sensor_performance(config.sensor_assumption, config.target)
+
+    # Binding aspect of every evaluation, by turn-around time: the solvers
+    # return the width and turn time of one of their evaluations
+    binding_aob = {}
+
+    def g(idx, offsets):
+        turn_time = calc_coordinated_level_turnaround_time(
+            ac             = ac,
+            lateral_offset = float(offsets[0]),
+            ac_search_perf = ac_search_perf
+        )
+        width, binding_aob[turn_time] = calc_binding_aspect(config, ac, turn_time, ac_search_perf, sensor_perf)
+        return np.array([width]), np.array([turn_time])
+
+    if trace is not None:
+        g = trace.wrap(g, [config_id])
+
+    width, turn_time, iterations, converged = solvers.solve(
+        g,
+        w0       = np.array([ac_search_perf.xtrack_detection_width[1]]),
+        method   = solver.method,
+        tol      = solver.tol,
+        max_iter = solver.max_iter
+    )
+
+    turn_time = float(turn_time[0])
+    aob = binding_aob.get(turn_time)
+    if aob is None:
+        # NaN turn time
+        aob = calc_binding_aspect(config, ac, turn_time, ac_search_perf, sensor_perf)[1]
+
+    return SweepWidthSolution(
+        effective_sweep_width = float(width[0]),
+        turn_time             = turn_time,
+        iterations            = int(iterations[0]),
+        converged             = bool(converged[0]),
+        binding_aob_rad       = aob
+    )
+
+
 def calc_ac_search_rate(ac: Aircraft, aoi: AOI, turn_time: float, eff_width: float) -> float:
     '''
     Determines the rate at which the aircraft searches the AOI (m^2/s).
@@ -9,10 +9,16 @@ from lib import (
     validate_config, 
     calc_sensor_performance, 
     calc_search_performance,
-    calc_effective_sweep_width,
+    solve_effective_sweep_width,
     calc_ac_search_rate,
     calc_onsta_requirement
 )
+from flyweight import intern, make_aircraft, write_results
+from convergence_trace import ConvergenceTrace
+from render import PLOTS_OUTPUT_PATH, render_plots, columns_from_results
+from pipeline import sweep_pipeline, grid_batches
+from archive import write_archive
+from server import EvaluationServer, DEFAULT_PORT
 
 
 # region Design Parameters
@@ -38,6 +44,30 @@ MANX_BANK_ANGLE_DEG = 35
 MANX_BANK_ANGLE_RAD = MANX_BANK_ANGLE_DEG * RAD_PER_DEG
 MANX_DECEL_GEES = -0.7
 MANX_MIN_MACH = 0.15
+
+# Effective sweep width solver: method ('fixed_point', 'aitken', 'secant' or
+# 'brentq'), relative tolerance, iteration cap
+SWEEP_WIDTH_SOLVER = SolverSettings(method='fixed_point', tol=0.01, max_iter=25)
+
+# Target aspects the sweep width has to cover: 'limiting_cases' (beaming and
+# glancing) or 'continuous' (worst case over all aspects, see aspect.py)
+ASPECT_MODEL = 'limiting_cases'
+
+# Set to e.g. ConvergenceTrace(every=10) to record the sweep width iterations 
+# (written to output/sweep_width_trace.csv)
+SWEEP_WIDTH_TRACE = None
+
+# Plots: 'python' (render.py, in process, SVG) or 'r' (r/analysis.R via 
+# Rscript, PNG)
+PLOT_RENDERER = 'python'
+
+# Evaluate, write and plot concurrently in batches (pipeline.py) instead of 
+# one after another; writes output/model_output.csv.gz, no JSON copy or trace
+PIPELINED = False
+
+# Store derived metrics in output/model_output.tsa as float32 (inputs stay 
+# float64)
+ARCHIVE_FLOAT32 = False
 # endregion
 
 TARGET = DesignTarget(
@@ -68,7 +98,12 @@ SENSOR_ASSUMPTIONS = {
 }
 
 # region evaluate_config
-def evaluate_config(config: Config) -> ModelResult:
+def evaluate_config(
+        config: Config,
+        solver: SolverSettings = SWEEP_WIDTH_SOLVER,
+        trace: ConvergenceTrace = None,
+        config_id: int = 0
+) -> ModelResult:
     '''
     Given a particular configuration of the scenario, perform calculations to 
     determine aircraft/sensor performance.
@@ -76,6 +111,9 @@ def evaluate_config(config: Config) -> ModelResult:
     Args:
     config: Config: instance of the Config dataclass specifying all necessary
     attributes of the scenario to do calculations
+    solver: SolverSettings: how to solve for the effective sweep width
+    trace: ConvergenceTrace: optional, records the effective sweep width 
+    iterations under config_id
 
     Returns:
     ModelResult: instance of ModelResult dataclass containing the Config (inputs)
@@ -93,16 +131,9 @@ def evaluate_config(config: Config) -> ModelResult:
         return result 
 
 
-    # Instantiate the aircraft
-    ac = Aircraft(
-        alt_kft             = config.altitude_kft, 
-        mach                = config.mach,
-        manx_bank_angle_rad = config.manx_bank_angle_rad,
-        manx_decel_gees     = config.manx_decel_gees,
-        manx_min_mach       = config.manx_min_mach,
-        sensor              = config.sensor, 
-        sensor_assumption   = config.sensor_assumption
-    )
+    # Instantiate the aircraft (shared between configs with the same airframe
+    # and sensor)
+    ac = make_aircraft(config)
 
     # Calc sensor performance
     result.sensor_performance = calc_sensor_performance(
@@ -124,12 +155,24 @@ def evaluate_config(config: Config) -> ModelResult:
         return(result)
 
     # Calc effective sweep width, account for overlap for limiting targets
-    effective_sweep_width, ac_turn_time = calc_effective_sweep_width(
+    solution = solve_effective_sweep_width(
         config         = config, 
         ac             = ac, 
         ac_search_perf = result.ac_search_perf, 
-        # debug          = True
+        solver         = solver,
+        trace          = trace,
+        config_id      = config_id,
+        sensor_perf    = result.sensor_performance
     )
+    effective_sweep_width = solution.effective_sweep_width
+    ac_turn_time          = solution.turn_time
+
+    # Flag (rather than silently accept) points that didn't converge
+    result.sweep_width_iterations = solution.iterations
+    result.sweep_width_converged  = solution.converged
+
+    # Target aspect that sets the width
+    result.binding_aob_rad = solution.binding_aob_rad
 
     if effective_sweep_width <= 0:
         result.valid  = False
@@ -168,42 +211,100 @@ def evaluate_config(config: Config) -> ModelResult:
     return result
 
 
-def main():
-
-    # Run model - evaluate_config for various inputs
-    results = []
+def grid_configs():
+    '''
+    Lazily yield the Config of every altitude, mach and sensor.
+    '''
     for altitude in altitudes:
         for mach in machs:
             for sensor in sensors:
-                config = Config(
+                yield Config(
                     altitude_kft        = altitude,
                     mach                = mach,
                     manx_bank_angle_rad = MANX_BANK_ANGLE_RAD,
                     manx_decel_gees     = MANX_DECEL_GEES,
                     manx_min_mach       = MANX_MIN_MACH,
                     sensor              = sensor,
-                    sensor_assumption   = SENSOR_ASSUMPTIONS[sensor],
-                    target              = TARGET,
-                    aoi                 = AOI,
-                    aoi_revisit_time_hr = AOI_REVISIT_TIME_HR
+                    sensor_assumption   = intern(SENSOR_ASSUMPTIONS[sensor]),
+                    target              = intern(TARGET),
+                    aoi                 = intern(AOI),
+                    aoi_revisit_time_hr = AOI_REVISIT_TIME_HR,
+                    aspect_model        = ASPECT_MODEL
                 )
-                
-                result = evaluate_config(config)
-                results.append(result)
+
+
+def main_pipelined():
+    '''
+    main, with evaluation, writing and plotting overlapped (see pipeline.py).
+    Writes output/model_output.csv.gz, output/model_output.tsa and the
+    plots, and prints where each stage's time went.
+    '''
+    report, _ = sweep_pipeline(
+        grid_batches(grid_configs()),
+        plots_dir    = PLOTS_OUTPUT_PATH,
+        solver       = SWEEP_WIDTH_SOLVER,
+        archive_path = 'output/model_output.tsa',
+        float32      = ARCHIVE_FLOAT32
+    )
+    print(report)
+
+
+def main_serve(port: int = DEFAULT_PORT):
+    '''
+    Serve single-point evaluations of this scenario on localhost (see
+    server.py) until interrupted. Points default to the first grid point.
+    '''
+    server = EvaluationServer(next(grid_configs()), SENSOR_ASSUMPTIONS, port=port, solver=SWEEP_WIDTH_SOLVER)
+    print(f'Serving on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats.summary())
+
+
+def main():
+
+    if PIPELINED:
+        main_pipelined()
+        sys.exit()
+
+    # Run model - evaluate_config for various inputs
+    results = []
+    for config in grid_configs():
+        result = evaluate_config(config, trace=SWEEP_WIDTH_TRACE, config_id=len(results))
+        results.append(result)
 
     # Write results to output.csv
     results_dicts = [asdict(r) for r in results]
     df = pd.json_normalize(results_dicts, sep='_')
     df.to_csv('output/model_output.csv')
 
-    # Run R script to do analysis
-    subprocess.call([r'Rscript', r'./r/analysis.R'], cwd=os.getcwd())
+    # Compact copy: shared sub-objects written once, referenced by ID
+    write_results(results, 'output/model_output.json')
+
+    # Columnar archive (see archive.py): dictionary/run-length encoded and 
+    # compressed
+    write_archive('output/model_output.tsa', df, float32=ARCHIVE_FLOAT32)
+
+    if SWEEP_WIDTH_TRACE is not None:
+        SWEEP_WIDTH_TRACE.to_csv('output/sweep_width_trace.csv')
+
+    # Plots
+    if PLOT_RENDERER == 'python':
+        render_plots(columns_from_results(results))
+    else:
+        # Run R script to do analysis
+        subprocess.call([r'Rscript', r'./r/analysis.R'], cwd=os.getcwd())
 
     sys.exit()
 
 
 if __name__ == '__main__':
-    main()
+    # python main.py serve [port]: evaluation server instead of the sweep
+    if sys.argv[1:2] == ['serve']:
+        main_serve(*[int(p) for p in sys.argv[2:3]])
+    else:
+        main()
 
 
 
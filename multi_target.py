@@ -0,0 +1,96 @@
+from dataclasses import dataclass, fields, replace
+import numpy as np
+from constants import *
+from performance import PERFORMANCE_MODELS
+from batch import ConfigBatch, BatchResult, aircraft_stage, evaluate_batch
+
+
+@dataclass
+class MultiTargetResult:
+    '''
+    Results for every (target, config) pair, and the worst case per config.
+
+    per_target[t] is the BatchResult for targets[t]. The binding target for a
+    config is the first target it can't be designed against, or, if it's
+    feasible against all of them, the one requiring the most on-station cost.
+    '''
+    targets:        list[DesignTarget]
+    per_target:     list[BatchResult]
+    valid:          np.ndarray # feasible against every target
+    binding_target: np.ndarray # index into targets
+    onsta_req_n:    np.ndarray # at the binding target
+    onsta_req_cost: np.ndarray # at the binding target
+
+    def binding_target_type(self) -> np.ndarray:
+        return np.array([self.targets[t].type for t in self.binding_target], dtype=object)
+
+
+def evaluate_multi_target(batch: ConfigBatch, targets: list[DesignTarget]) -> MultiTargetResult:
+    '''
+    Evaluate every config in the batch against each target in one pass. The
+    target fields of the batch are ignored.
+
+    Aircraft cost and endurance don't depend on the target, so they're computed
+    once per config and shared by all targets; everything from the sensor
+    performance on is evaluated for all (target, config) pairs in one batch.
+
+    Args:
+        batch: ConfigBatch of design points.
+        targets: list[DesignTarget]
+
+    Returns:
+        MultiTargetResult
+    '''
+    n, n_targets = len(batch), len(targets)
+
+    # Target-independent: aircraft cost and endurance (unknown performance
+    # models are left NaN, validation reports them)
+    ac_cost       = np.full(n, np.nan)
+    endurance_sec = np.full(n, np.nan)
+    known = np.isin(batch.performance_model, list(PERFORMANCE_MODELS))
+    ac_cost[known], endurance_sec[known] = aircraft_stage(
+        batch.mach[known],
+        batch.altitude_kft[known],
+        batch.sensor_assumption_cost[known],
+        batch.performance_model[known]
+    )
+
+    # All (target, config) pairs, target-major
+    tiled = ConfigBatch(**{f.name: _tile(getattr(batch, f.name), n_targets) for f in fields(batch)})
+    tiled = replace(
+        tiled,
+        target_type      = np.repeat(np.array([t.type for t in targets], dtype=object), n),
+        target_dims      = np.repeat(np.array([t.dims for t in targets], dtype=float), n, axis=0),
+        target_max_speed = np.repeat(np.array([t.max_speed for t in targets], dtype=float), n),
+    )
+    result = evaluate_batch(tiled, aircraft=(np.tile(ac_cost, n_targets), np.tile(endurance_sec, n_targets)))
+
+    per_target = [
+        BatchResult(**{f.name: getattr(result, f.name)[t*n:(t+1)*n] for f in fields(result)})
+        for t in range(n_targets)
+    ]
+
+    valid = result.valid.reshape(n_targets, n)
+    cost  = result.onsta_req_cost.reshape(n_targets, n)
+    onsta = result.onsta_req_n.reshape(n_targets, n)
+
+    # Infeasible against a target binds before any cost does
+    binding = np.where(
+        valid.all(axis=0),
+        np.argmax(np.where(valid, cost, -np.inf), axis=0),
+        np.argmin(valid, axis=0)
+    )
+    columns = np.arange(n)
+
+    return MultiTargetResult(
+        targets        = list(targets),
+        per_target     = per_target,
+        valid          = valid.all(axis=0),
+        binding_target = binding,
+        onsta_req_n    = onsta[binding, columns],
+        onsta_req_cost = cost[binding, columns],
+    )
+
+
+def _tile(values: np.ndarray, reps: int) -> np.ndarray:
+    return np.tile(values, (reps,) + (1,)*(values.ndim-1))
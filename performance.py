@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from typing import Callable
+import numpy as np
+
+
+# Aircraft performance models: endurance (hr) and airframe cost ($M, not
+# including the sensor) as functions of mach and altitude in kft.
+#
+# Every model accepts either python floats or numpy arrays (broadcast against
+# each other) so the same model serves the per-config Aircraft and the batched
+# engine.
+
+@dataclass(frozen=True)
+class PolynomialModel:
+    '''
+    Polynomial in mach and altitude. Each term is (coefficient, mach power,
+    altitude power), e.g. (-18.75, 2, 0) is -18.75*mach**2.
+    '''
+    endurance_terms: tuple[tuple[float, int, int], ...]
+    cost_terms:      tuple[tuple[float, int, int], ...]
+
+    @staticmethod
+    def _evaluate(terms, mach, alt_kft):
+        total = 0
+        for coeff, mach_pow, alt_pow in terms:
+            term = coeff
+            if mach_pow:
+                term = term*mach**mach_pow
+            if alt_pow:
+                term = term*alt_kft**alt_pow
+            total = total + term
+        return total
+
+    def endurance_hr(self, mach, alt_kft):
+        return self._evaluate(self.endurance_terms, mach, alt_kft)
+
+    def cost(self, mach, alt_kft):
+        return self._evaluate(self.cost_terms, mach, alt_kft)
+
+
+@dataclass(frozen=True)
+class TabulatedModel:
+    '''
+    Endurance and cost tabulated on a (mach, altitude) grid and bilinearly
+    interpolated. Points outside the grid are clamped to its edges.
+
+    Tables are indexed [mach, altitude].
+    '''
+    machs:           tuple[float, ...]
+    alts_kft:        tuple[float, ...]
+    endurance_table: tuple[tuple[float, ...], ...]
+    cost_table:      tuple[tuple[float, ...], ...]
+
+    def _interpolate(self, table, mach, alt_kft):
+        scalar = np.isscalar(mach) and np.isscalar(alt_kft)
+
+        xs = np.asarray(self.machs, dtype=float)
+        ys = np.asarray(self.alts_kft, dtype=float)
+        z  = np.asarray(table, dtype=float)
+        x, y = np.broadcast_arrays(np.asarray(mach, dtype=float), np.asarray(alt_kft, dtype=float))
+        x = np.clip(x, xs[0], xs[-1])
+        y = np.clip(y, ys[0], ys[-1])
+
+        # Lower cell corner for each point
+        i = np.clip(np.searchsorted(xs, x, side='right') - 1, 0, len(xs) - 2)
+        j = np.clip(np.searchsorted(ys, y, side='right') - 1, 0, len(ys) - 2)
+        tx = (x - xs[i])/(xs[i+1] - xs[i])
+        ty = (y - ys[j])/(ys[j+1] - ys[j])
+
+        value = (
+            z[i,   j  ]*(1-tx)*(1-ty) +
+            z[i+1, j  ]*tx*(1-ty) +
+            z[i,   j+1]*(1-tx)*ty +
+            z[i+1, j+1]*tx*ty
+        )
+        return float(value) if scalar else value
+
+    def endurance_hr(self, mach, alt_kft):
+        return self._interpolate(self.endurance_table, mach, alt_kft)
+
+    def cost(self, mach, alt_kft):
+        return self._interpolate(self.cost_table, mach, alt_kft)
+
+
+@dataclass(frozen=True)
+class CallableModel:
+    '''
+    User-supplied endurance and cost functions of (mach, alt_kft). If the
+    functions only handle scalars, set vectorized=False and arrays are
+    evaluated element by element.
+    '''
+    endurance_fn: Callable
+    cost_fn:      Callable
+    vectorized:   bool = True
+
+    def _call(self, fn, mach, alt_kft):
+        if self.vectorized or (np.isscalar(mach) and np.isscalar(alt_kft)):
+            return fn(mach, alt_kft)
+        return np.vectorize(fn, otypes=[float])(mach, alt_kft)
+
+    def endurance_hr(self, mach, alt_kft):
+        return self._call(self.endurance_fn, mach, alt_kft)
+
+    def cost(self, mach, alt_kft):
+        return self._call(self.cost_fn, mach, alt_kft)
+
+
+# region Registry
+DEFAULT_PERFORMANCE_MODEL = 'baseline'
+
+# The stipulated endurance and cost models
+PERFORMANCE_MODELS = {
+    DEFAULT_PERFORMANCE_MODEL: PolynomialModel(
+        endurance_terms = (
+            (-18.75,  2, 0),
+            (8.0893,  1, 0),
+            (0.01,    0, 2),
+            (0.05,    0, 1),
+            (9.2105,  0, 0),
+        ),
+        cost_terms = (
+            (50,      2, 0),
+            (-35,     1, 0),
+            (0.03,    0, 2),
+            (-0.2,    0, 1),
+            (11,      0, 0),
+        )
+    ),
+}
+
+
+def register_model(name: str, model, overwrite: bool = False):
+    '''
+    Add a performance model to the registry so configs can refer to it by name.
+
+    Args:
+        name (str): name configs use to select the model.
+        model: PolynomialModel, TabulatedModel, CallableModel or any object with
+            endurance_hr(mach, alt_kft) and cost(mach, alt_kft) methods.
+        overwrite (bool): allow replacing an existing model.
+    '''
+    if name in PERFORMANCE_MODELS and not overwrite:
+        raise ValueError(f'Performance model {name!r} already registered')
+    PERFORMANCE_MODELS[name] = model
+
+
+def get_model(name: str):
+    try:
+        return PERFORMANCE_MODELS[name]
+    except KeyError:
+        raise KeyError(f'Unknown performance model {name!r}, registered: {list(PERFORMANCE_MODELS)}') from None
+
+
+def evaluate_models(names, mach, alt_kft) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized endurance and airframe cost over arrays where each element may
+    use a different performance model. Each model is evaluated once over all
+    of its elements.
+
+    Args:
+        names: array-like of model names, broadcastable with mach and alt_kft.
+        mach: array-like of mach.
+        alt_kft: array-like of altitude in kft.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (endurance in hr, airframe cost in $M)
+    '''
+    names, mach, alt_kft = np.broadcast_arrays(
+        np.asarray(names, dtype=object),
+        np.asarray(mach, dtype=float),
+        np.asarray(alt_kft, dtype=float)
+    )
+    endurance = np.empty(mach.shape)
+    cost      = np.empty(mach.shape)
+
+    for name in set(names.flat):
+        mask  = names == name
+        model = get_model(name)
+        endurance[mask] = model.endurance_hr(mach[mask], alt_kft[mask])
+        cost[mask]      = model.cost(mach[mask], alt_kft[mask])
+
+    return endurance, cost
+# endregion
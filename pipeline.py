@@ -0,0 +1,395 @@
+import gzip
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from typing import Callable, Iterable
+import numpy as np
+import pandas as pd
+from constants import *
+from batch import ConfigBatch, BatchResult, evaluate_batch
+from doe import concat_batches
+from render import columns, render_plots
+from archive import CODEC, ArchiveWriter, batch_columns
+
+
+# Pipelined sweep runner. main.main does everything in turn: evaluate every
+# config, write the results, then wait for Rscript to plot them. Here each
+# stage is a thread, and stages pass batches along bounded queues:
+#
+#   source (yield ConfigBatches) -> evaluate -> write (compressed CSV and/or
+#                                               archive.py archive)
+#                                            -> aggregate (reducers, plots)
+#
+# so batch k is written while batch k+1 is evaluated and batch k+2 is being
+# generated, and the total time approaches that of the slowest stage rather
+# than the sum. Queues are bounded (maxsize batches), so a fast stage blocks
+# instead of buffering the whole sweep in memory ahead of a slow one.
+#
+# Each stage reports where its time went: busy (in its own work), starved
+# (waiting on an empty input queue: upstream is slower) and blocked (waiting
+# on a full output queue: downstream is slower). The stage with the most busy
+# time is the bottleneck; the wall time of a balanced pipeline is about its
+# busy time.
+#
+# numpy, zlib and file I/O release the GIL for most of the work in these
+# stages, which is what lets threads overlap.
+
+DEFAULT_QUEUE_SIZE = 2
+
+RESULTS_CSV_PATH = 'output/model_output.csv.gz'
+
+_DONE = object() # end of stream marker
+
+
+@dataclass
+class Stage:
+    '''
+    A pipeline stage: work(item) returns the item to pass on (None passes
+    nothing), close() runs once after the last item and may return a final
+    item.
+    '''
+    name:  str
+    work:  Callable
+    close: Callable = None
+
+
+@dataclass
+class StageStats:
+    '''
+    Where a stage's time went, in seconds.
+    '''
+    name:        str
+    items:       int   = 0
+    busy_sec:    float = 0.0 # working (including close)
+    starved_sec: float = 0.0 # waiting for input
+    blocked_sec: float = 0.0 # waiting for room downstream
+
+    @property
+    def stalled_sec(self) -> float:
+        return self.starved_sec + self.blocked_sec
+
+
+@dataclass
+class PipelineReport:
+    '''
+    End-to-end wall time and each stage's StageStats, source first.
+    '''
+    wall_sec: float
+    stages:   list[StageStats] = field(default_factory=list)
+
+    @property
+    def bottleneck(self) -> StageStats:
+        return max(self.stages, key=lambda s: s.busy_sec)
+
+    @property
+    def serial_sec(self) -> float:
+        '''
+        Time the stages would take one after another.
+        '''
+        return sum(s.busy_sec for s in self.stages)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        frame = pd.DataFrame([{f.name: getattr(s, f.name) for f in fields(s)} for s in self.stages])
+        frame['stalled_sec'] = frame['starved_sec'] + frame['blocked_sec']
+        return frame
+
+    def __str__(self):
+        lines = [f'{"stage":<12}{"items":>8}{"busy s":>10}{"starved s":>11}{"blocked s":>11}']
+        for s in self.stages:
+            lines.append(f'{s.name:<12}{s.items:>8}{s.busy_sec:>10.2f}{s.starved_sec:>11.2f}{s.blocked_sec:>11.2f}')
+        lines.append(
+            f'wall {self.wall_sec:.2f} s, stages in series {self.serial_sec:.2f} s, '
+            f'bottleneck {self.bottleneck.name} ({self.bottleneck.busy_sec:.2f} s)'
+        )
+        return '\n'.join(lines)
+
+
+class _Stop(Exception):
+    # Raised in a stage thread when another stage failed
+    pass
+
+
+def _put(q: queue.Queue, item, stats: StageStats, failed: threading.Event):
+    start = time.perf_counter()
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            if failed.is_set():
+                raise _Stop
+    stats.blocked_sec += time.perf_counter() - start
+
+
+def _get(q: queue.Queue, stats: StageStats, failed: threading.Event):
+    start = time.perf_counter()
+    while True:
+        try:
+            item = q.get(timeout=0.1)
+            break
+        except queue.Empty:
+            if failed.is_set():
+                raise _Stop
+    stats.starved_sec += time.perf_counter() - start
+    return item
+
+
+def run_pipeline(source: Iterable, stages: list[Stage], maxsize: int = DEFAULT_QUEUE_SIZE) -> PipelineReport:
+    '''
+    Run source and stages concurrently, each in a thread, each stage taking
+    the previous one's output through a queue of at most maxsize items. An
+    exception in any stage stops the pipeline and is raised here.
+
+    Args:
+        source (Iterable): items fed to the first stage (generated in its
+            own thread, so e.g. a generator of ConfigBatches overlaps too).
+        stages (list[Stage])
+        maxsize (int): queue bound, items.
+
+    Returns:
+        PipelineReport
+    '''
+    queues = [queue.Queue(maxsize) for _ in stages]
+    stats  = [StageStats('source')] + [StageStats(s.name) for s in stages]
+    failed = threading.Event()
+    errors = []
+
+    def run_source():
+        s = stats[0]
+        try:
+            iterator = iter(source)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    s.busy_sec += time.perf_counter() - start
+                    break
+                s.busy_sec += time.perf_counter() - start
+                s.items += 1
+                _put(queues[0], item, s, failed)
+            _put(queues[0], _DONE, s, failed)
+        except _Stop:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+
+    def run_stage(k: int):
+        stage, s = stages[k], stats[k + 1]
+        out = queues[k + 1] if k + 1 < len(stages) else None
+        try:
+            while True:
+                item = _get(queues[k], s, failed)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                item = stage.work(item)
+                s.busy_sec += time.perf_counter() - start
+                s.items += 1
+                if item is not None and out is not None:
+                    _put(out, item, s, failed)
+            if stage.close is not None:
+                start = time.perf_counter()
+                item = stage.close()
+                s.busy_sec += time.perf_counter() - start
+                if item is not None and out is not None:
+                    _put(out, item, s, failed)
+            if out is not None:
+                _put(out, _DONE, s, failed)
+        except _Stop:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_source, name='source', daemon=True)]
+    threads += [threading.Thread(target=run_stage, args=(k,), name=stage.name, daemon=True) for k, stage in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = PipelineReport(wall_sec=time.perf_counter() - start, stages=stats)
+
+    if errors:
+        raise errors[0]
+    return report
+
+
+# region Sweep stages
+def _frame(batch: ConfigBatch, result: BatchResult) -> pd.DataFrame:
+    # Flat table of a batch and its results: pairs split into _0/_1 columns,
+    # sensors by name
+    data = {}
+    for source in (batch, result):
+        for f in fields(source):
+            values = getattr(source, f.name)
+            if values.ndim == 2:
+                for j in range(values.shape[1]):
+                    data[f'{f.name}_{j}'] = values[:, j]
+            elif f.name == 'sensor':
+                data[f.name] = [s.name for s in values]
+            else:
+                data[f.name] = values
+    return pd.DataFrame(data)
+
+
+class CsvWriter:
+    '''
+    Write stage: appends each (batch, result) to a gzipped CSV (one gzip
+    member per batch, which gzip readers, pandas included, read as one
+    file), and passes it on.
+    '''
+
+    def __init__(self, path: str = RESULTS_CSV_PATH, compresslevel: int = 1):
+        self.path          = path
+        self.compresslevel = compresslevel
+        self.rows          = 0
+        self.bytes         = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        open(path, 'wb').close()
+
+    def __call__(self, item):
+        batch, result = item
+        text = _frame(batch, result).to_csv(header=self.rows == 0, index=False)
+        data = gzip.compress(text.encode(), compresslevel=self.compresslevel)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+        self.rows  += len(batch)
+        self.bytes += len(data)
+        return item
+
+
+class ArchiveSink:
+    '''
+    Write stage: appends each (batch, result) to an archive (archive.py), one
+    chunk per batch, and passes it on.
+    '''
+
+    def __init__(self, path: str, codec: str = CODEC, float32: bool | tuple[str, ...] = False):
+        self.writer = ArchiveWriter(path, codec, float32)
+
+    def __call__(self, item):
+        self.writer.append(batch_columns(*item))
+        return item
+
+    def close(self):
+        self.writer.close()
+
+
+class Aggregator:
+    '''
+    Aggregate stage: offers each (batch, result) to reducers (reducers.py)
+    and, if plots_dir is given, keeps the plot columns (render.columns, ~40
+    bytes a point) to render the plots there on close. Reducers run in
+    bounded memory; the plots need the whole sweep, so they are for sweeps
+    that fit in memory, such as main.py's grid.
+    '''
+
+    def __init__(self, reducers: list = (), plots_dir: str = None):
+        self.reducers  = list(reducers)
+        self.plots_dir = plots_dir
+        self.rows      = 0
+        self.data      = []
+        self.plots     = []
+
+    def __call__(self, item):
+        batch, result = item
+        ids = self.rows + np.arange(len(batch))
+        self.rows += len(batch)
+        for reducer in self.reducers:
+            reducer.update(batch, result, ids)
+        if self.plots_dir is not None:
+            self.data.append(columns(batch, result))
+        return item
+
+    def close(self):
+        if self.plots_dir is not None and self.data:
+            data = {name: np.concatenate([d[name] for d in self.data]) for name in self.data[0]}
+            self.plots = render_plots(data, self.plots_dir)
+
+
+def sweep_pipeline(
+        batches: Iterable,
+        csv_path: str = RESULTS_CSV_PATH,
+        reducers: list = (),
+        plots_dir: str = None,
+        solver: SolverSettings = SolverSettings(),
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        archive_path: str = None,
+        float32: bool | tuple[str, ...] = False
+    ) -> tuple[PipelineReport, Aggregator]:
+    '''
+    Evaluate a stream of ConfigBatches (e.g. doe.doe_batches, or
+    grid_batches), writing them to csv_path (None to skip) and/or an archive
+    at archive_path (float32 as for archive.ArchiveWriter) and aggregating
+    them, all concurrently. Pass plots_dir (e.g. render.PLOTS_OUTPUT_PATH)
+    to also plot the sweep; this keeps every point's plot columns (see
+    Aggregator), so leave it None for large DOE streams.
+
+    Returns:
+        tuple[PipelineReport, Aggregator]: the timings, and the aggregator
+        (with its reducers and the paths of the plots).
+    '''
+    aggregator = Aggregator(reducers, plots_dir)
+    stages = [Stage('evaluate', lambda batch: (batch, evaluate_batch(batch, solver=solver)))]
+    if csv_path is not None:
+        stages.append(Stage('write', CsvWriter(csv_path)))
+    if archive_path is not None:
+        sink = ArchiveSink(archive_path, float32=float32)
+        stages.append(Stage('archive', sink, sink.close))
+    stages.append(Stage('aggregate', aggregator, aggregator.close))
+    return run_pipeline(batches, stages, maxsize), aggregator
+
+
+def sweep_serial(
+        batches: Iterable,
+        csv_path: str = RESULTS_CSV_PATH,
+        reducers: list = (),
+        plots_dir: str = None,
+        solver: SolverSettings = SolverSettings()
+    ) -> tuple[PipelineReport, Aggregator]:
+    '''
+    sweep_pipeline's work, done the way main.main does it: evaluate
+    everything, then write, then aggregate and plot. For comparison.
+    '''
+    aggregator = Aggregator(reducers, plots_dir)
+    stats = [StageStats(name) for name in ('source', 'evaluate', 'write', 'aggregate')]
+    start = time.perf_counter()
+
+    def timed(s: StageStats, fn, *args):
+        t = time.perf_counter()
+        out = fn(*args)
+        s.busy_sec += time.perf_counter() - t
+        s.items += 1
+        return out
+
+    batches = list(timed(stats[0], list, batches))
+    results = [timed(stats[1], evaluate_batch, batch, None, solver) for batch in batches]
+    if csv_path is not None:
+        writer = CsvWriter(csv_path)
+        timed(stats[2], writer, (concat_batches(batches), concat_batches(results)))
+    for item in zip(batches, results):
+        timed(stats[3], aggregator, item)
+    timed(stats[3], aggregator.close)
+
+    return PipelineReport(wall_sec=time.perf_counter() - start, stages=stats), aggregator
+
+
+def grid_batches(configs: Iterable[Config], batch_size: int = 2000):
+    '''
+    Lazily group Configs (e.g. main.py's nested loops over altitude, mach
+    and sensor) into ConfigBatches of batch_size.
+    '''
+    chunk = []
+    for config in configs:
+        chunk.append(config)
+        if len(chunk) == batch_size:
+            yield ConfigBatch.from_configs(chunk)
+            chunk = []
+    if chunk:
+        yield ConfigBatch.from_configs(chunk)
+# endregion
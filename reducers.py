@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from constants import *
+from batch import ConfigBatch, BatchResult, evaluate_batch
+
+
+# Streaming reducers over evaluated batches: the cheapest feasible designs
+# overall, per sensor and per altitude band (what r/analysis.R mostly reads
+# out of model_output.csv), kept up to date batch by batch, so the answers are
+# there at the end of a sweep without materializing or rereading its results.
+#
+# Each reducer keeps the k best valid rows seen, by key (smallest first), with
+# a few columns of each (ConfigBatch or BatchResult fields). Memory is bounded
+# by k (per group): each batch's rows are screened against the current k-th
+# best with numpy and only those that could enter are merged in.
+#
+# Rows are identified by an id: by default their position in the stream, or
+# ids given with each batch, e.g. global row numbers when shards of a sweep
+# are reduced by separate workers. Reducers are plain data (picklable) and
+# merge: reducing shards separately and merging gives the same answer as
+# reducing everything in one, ties going to the smaller id.
+
+DEFAULT_COLUMNS = (
+    'sensor',
+    'altitude_kft',
+    'mach',
+    'sensor_assumption_cost',
+    'ac_cost',
+    'onsta_req_n',
+    'onsta_req_cost',
+)
+
+
+def _column(batch: ConfigBatch, result: BatchResult, name: str) -> np.ndarray:
+    for source in (result, batch):
+        if hasattr(source, name):
+            values = getattr(source, name)
+            if values.ndim != 1:
+                raise ValueError(f'Can only keep scalar fields, not {name!r}')
+            return values
+    raise ValueError(f'{name!r} is not a ConfigBatch or BatchResult field')
+
+
+class TopK:
+    '''
+    The k valid rows with the smallest key.
+
+    Args:
+        k (int)
+        key (str): ConfigBatch or BatchResult field to rank by.
+        columns (tuple[str, ...]): fields to keep for each row.
+    '''
+
+    def __init__(self, k: int = 10, key: str = 'onsta_req_cost', columns: tuple[str, ...] = DEFAULT_COLUMNS):
+        if k < 1:
+            raise ValueError(f'k must be >= 1, is {k}')
+        self.k       = k
+        self.key     = key
+        self.columns = tuple(columns)
+        self.ids     = np.empty(0, dtype=int)
+        self.values  = np.empty(0)
+        self.data    = None # column -> array, from the first row kept
+        self.seen    = 0    # rows offered
+        self.valid   = 0    # valid rows offered
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, batch: ConfigBatch, result: BatchResult, ids: np.ndarray = None) -> 'TopK':
+        '''
+        Offer an evaluated batch's rows (ids default to their position in the
+        stream).
+        '''
+        ids = self.seen + np.arange(len(result)) if ids is None else np.asarray(ids)
+        values = _column(batch, result, self.key)
+        self._offer(batch, result, np.arange(len(result)), ids, values, result.valid & ~np.isnan(values))
+        return self
+
+    def _offer(self, batch, result, rows, ids, values, ok):
+        # rows: positions in the batch of ids, values and ok
+        self.seen  += len(rows)
+        self.valid += int(np.count_nonzero(ok))
+        if len(self) == self.k:
+            ok = ok & (values <= self.values[-1])
+        idx = np.flatnonzero(ok)
+        if len(idx):
+            self._keep(ids[idx], values[idx], {name: _column(batch, result, name)[rows[idx]] for name in self.columns})
+
+    def _keep(self, ids, values, data):
+        if self.data is not None:
+            ids    = np.concatenate([self.ids, ids])
+            values = np.concatenate([self.values, values])
+            data   = {name: np.concatenate([self.data[name], data[name]]) for name in self.columns}
+        order = np.lexsort((ids, values))[:self.k]
+        self.ids, self.values = ids[order], values[order]
+        self.data = {name: column[order] for name, column in data.items()}
+
+    def merge(self, other: 'TopK') -> 'TopK':
+        '''
+        Fold in another reducer's rows (e.g. another shard's), in place.
+        '''
+        if (other.k, other.key, other.columns) != (self.k, self.key, self.columns):
+            raise ValueError('Can only merge reducers with the same k, key and columns')
+        self.seen  += other.seen
+        self.valid += other.valid
+        if other.data is not None:
+            self._keep(other.ids, other.values, other.data)
+        return self
+
+    def to_dataframe(self) -> pd.DataFrame:
+        '''
+        Rows kept, best first, with their rank and id.
+        '''
+        frame = pd.DataFrame({'rank': np.arange(1, len(self) + 1), 'id': self.ids})
+        for name in self.columns:
+            frame[name] = self.data[name] if self.data is not None else []
+        if self.key not in self.columns:
+            frame[self.key] = self.values
+        return frame
+
+
+class GroupedTopK:
+    '''
+    TopK within each group of rows: rows with the same value of a field
+    (e.g. 'sensor'), or in the same band of width band of a numeric field
+    (e.g. 'altitude_kft' in 5 kft bands, labelled by their lower edge).
+    k=1 gives each group's best row.
+    '''
+
+    def __init__(
+            self,
+            k: int = 10,
+            field: str = 'sensor',
+            band: float = None,
+            key: str = 'onsta_req_cost',
+            columns: tuple[str, ...] = DEFAULT_COLUMNS
+        ):
+        self.k       = k
+        self.field   = field
+        self.band    = band
+        self.key     = key
+        self.columns = tuple(columns)
+        self.groups  = {} # group -> TopK
+
+    def _group(self, group) -> TopK:
+        if group not in self.groups:
+            self.groups[group] = TopK(self.k, self.key, self.columns)
+        return self.groups[group]
+
+    def update(self, batch: ConfigBatch, result: BatchResult, ids: np.ndarray = None) -> 'GroupedTopK':
+        '''
+        Offer an evaluated batch's rows (ids default to their position in the
+        stream).
+        '''
+        seen = sum(top.seen for top in self.groups.values())
+        ids = seen + np.arange(len(result)) if ids is None else np.asarray(ids)
+        values = _column(batch, result, self.key)
+        ok = result.valid & ~np.isnan(values)
+
+        groups = _column(batch, result, self.field)
+        if self.band is not None:
+            groups = np.floor(groups/self.band)*self.band
+        for group in set(groups.tolist()):
+            rows = np.flatnonzero(groups == group)
+            self._group(group)._offer(batch, result, rows, ids[rows], values[rows], ok[rows])
+        return self
+
+    def merge(self, other: 'GroupedTopK') -> 'GroupedTopK':
+        '''
+        Fold in another reducer's groups (e.g. another shard's), in place.
+        '''
+        if (other.k, other.field, other.band, other.key, other.columns) != \
+                (self.k, self.field, self.band, self.key, self.columns):
+            raise ValueError('Can only merge reducers with the same k, field, band, key and columns')
+        for group, top in other.groups.items():
+            self._group(group).merge(top)
+        return self
+
+    def to_dataframe(self) -> pd.DataFrame:
+        '''
+        Rows kept, by group (in sorted order where groups sort), best first.
+        '''
+        try:
+            groups = sorted(self.groups, key=lambda g: g.value if isinstance(g, Enum) else g)
+        except TypeError:
+            groups = list(self.groups)
+        name = self.field if self.band is None else f'{self.field}_band'
+        frames = [self.groups[group].to_dataframe() for group in groups]
+        frame = pd.concat(frames, ignore_index=True) if frames else TopK(self.k, self.key, self.columns).to_dataframe()
+        column = [group for group, f in zip(groups, frames) for _ in range(len(f))]
+        if name in frame:
+            frame.pop(name)
+        frame.insert(0, name, column)
+        return frame
+
+
+def reduce_batches(batches, reducers: list, solver: SolverSettings = SolverSettings(), start: int = 0) -> list:
+    '''
+    Evaluate a stream of ConfigBatches (e.g. doe.doe_batches) one at a time,
+    offering each to every reducer. Rows are numbered from start.
+
+    Returns:
+        list: the reducers.
+    '''
+    for batch in batches:
+        result = evaluate_batch(batch, solver=solver)
+        ids = start + np.arange(len(batch))
+        start += len(batch)
+        for reducer in reducers:
+            reducer.update(batch, result, ids)
+    return reducers
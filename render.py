@@ -0,0 +1,517 @@
+import base64
+import math
+import os
+import struct
+import zlib
+import numpy as np
+from constants import *
+
+
+# In-process versions of r/lib.R's plots (make_sensor_feasibility_plot,
+# make_cost_heatmap, make_elasticity_heatmap), drawn straight from columnar
+# results: no CSV round trip and no Rscript start-up.
+#
+# Points are aggregated to the plot's resolution with numpy, datashader style:
+# each panel is a raster of bins, at most one per screen pixel, so plotting
+# time depends on the number of points only through one pass of binning. A
+# grid coarser than the screen gets one bin per grid point (like geom_tile,
+# with the spacing of the first two grid values), upscaled to the panel.
+# Elasticity also sorts the valid points into grid lines (O(n log n) time,
+# O(n) memory), and is only drawn for gridded data (is_grid).
+#
+# Figures are SVG (text, axes and legends as vectors) with each panel's raster
+# embedded as a PNG, encoded here with zlib, so nothing beyond numpy is needed.
+#
+# Data is a dict of equal-length 1-D columns: altitude_kft, mach, sensor,
+# valid, onsta_req_cost and sensor_assumption_cost (see columns).
+
+PLOTS_OUTPUT_PATH = 'output/plots'
+
+SENSOR_COLORS = { # RColorBrewer Dark2, as in r/analysis.R
+    Sensor.LOW:  (0x1B, 0x9E, 0x77),
+    Sensor.MED:  (0xD9, 0x5F, 0x02),
+    Sensor.HIGH: (0x75, 0x70, 0xB3),
+}
+
+GREEN_WHITE_RED = ((0, 255, 0), (255, 255, 255), (255, 0, 0))
+
+AGGREGATIONS = ('min', 'max', 'mean', 'any')
+
+# Figure geometry in px (r/lib.R saves 4 in high with aspect ratio 0.6)
+FIGURE_SIZE  = (960, 576)
+MARGINS      = (70, 110, 60, 50) # left, right, top, bottom
+PANEL_GAP    = 18
+
+
+# region Data
+def columns(batch, result) -> dict:
+    '''
+    Plot columns of an evaluated ConfigBatch and its BatchResult.
+    '''
+    return {
+        'altitude_kft':           batch.altitude_kft,
+        'mach':                   batch.mach,
+        'sensor':                 batch.sensor,
+        'valid':                  result.valid,
+        'onsta_req_cost':         result.onsta_req_cost,
+        'sensor_assumption_cost': batch.sensor_assumption_cost,
+    }
+
+
+def columns_from_results(results: list[ModelResult]) -> dict:
+    '''
+    Plot columns of a list of ModelResults, as main.main produces.
+    '''
+    def col(get, dtype=float):
+        return np.array([get(r) for r in results], dtype=dtype)
+
+    return {
+        'altitude_kft':           col(lambda r: r.config.altitude_kft),
+        'mach':                   col(lambda r: r.config.mach),
+        'sensor':                 col(lambda r: r.config.sensor, object),
+        'valid':                  col(lambda r: r.valid, bool),
+        'onsta_req_cost':         col(lambda r: np.nan if r.onsta_req_cost is None else r.onsta_req_cost),
+        'sensor_assumption_cost': col(lambda r: r.config.sensor_assumption.cost),
+    }
+
+
+def columns_from_cube(cube, sensor_assumptions: dict) -> dict:
+    '''
+    Plot columns of a ResultsCube with altitude_kft, mach and sensor axes
+    (read whole), sensor costs from sensor_assumptions.
+    '''
+    grid = np.meshgrid(*cube.axes.values(), indexing='ij')
+    axes = {name: values.reshape(-1) for name, values in zip(cube.axes, grid)}
+    missing = {'altitude_kft', 'mach', 'sensor'} - set(axes)
+    if missing:
+        raise ValueError(f'Cube has no {sorted(missing)} axes')
+    return {
+        'altitude_kft':           axes['altitude_kft'].astype(float),
+        'mach':                   axes['mach'].astype(float),
+        'sensor':                 axes['sensor'],
+        'valid':                  np.asarray(cube['valid']).reshape(-1),
+        'onsta_req_cost':         np.asarray(cube['onsta_req_cost']).reshape(-1),
+        'sensor_assumption_cost': np.array([sensor_assumptions[s].cost for s in axes['sensor']], dtype=float),
+    }
+
+
+def _elasticity_keys(data: dict) -> dict:
+    # Grid variables of r/lib.R's calc_elasticity; sensors are ordered by and
+    # measured with their cost
+    return {
+        'altitude_kft': data['altitude_kft'],
+        'mach':         data['mach'],
+        'sensor':       data['sensor_assumption_cost'],
+    }
+
+
+def is_grid(data: dict) -> bool:
+    '''
+    Whether the designs fill the product of their altitude, mach and sensor
+    values (e.g. main.py's grid), so calc_elasticity has lines to follow.
+    Scattered designs (a DOE) have about one design per line.
+    '''
+    levels = [len(np.unique(values)) for values in _elasticity_keys(data).values()]
+    return math.prod(levels) <= len(data['mach'])
+
+
+def calc_elasticity(data: dict, elastic_var: str, obj_var: str = 'onsta_req_cost') -> np.ndarray:
+    '''
+    r/lib.R's calc_elasticity: (relative change in obj_var)/(relative change
+    in elastic_var) from the previous valid design along elastic_var, with
+    the other grid variables held constant; sensors are ordered by and
+    measured with their cost. NaN for the first valid design along each line
+    and for invalid designs.
+
+    The valid designs are sorted into lines (the held-constant variables,
+    then elastic_var), so memory is linear in the number of designs.
+    '''
+    keys = _elasticity_keys(data)
+    if elastic_var not in keys:
+        raise ValueError(f'elastic_var must be one of {list(keys)}, not {elastic_var!r}')
+
+    ok   = data['valid'] & ~np.isnan(data[obj_var])
+    rows = np.flatnonzero(ok)
+    out  = np.full(len(ok), np.nan)
+    if not len(rows):
+        return out
+    held = [values[rows] for name, values in keys.items() if name != elastic_var]
+    var  = keys[elastic_var][rows].astype(float)
+    obj  = data[obj_var][rows]
+
+    # np.lexsort sorts by the last key first
+    order = np.lexsort([var] + held[::-1])
+    held  = [values[order] for values in held]
+    var, obj = var[order], obj[order]
+
+    # Line and level (a line's run of equal elastic_var values) boundaries
+    same_line = np.ones(len(rows) - 1, dtype=bool)
+    for values in held:
+        same_line &= values[1:] == values[:-1]
+    new_level = np.concatenate([[True], ~(same_line & (var[1:] == var[:-1]))])
+
+    # Previous valid design: the last one of the line's previous level
+    start = np.flatnonzero(new_level)[np.cumsum(new_level) - 1]
+    previous = start - 1
+    has_previous = np.zeros(len(rows), dtype=bool)
+    has_previous[start > 0] = same_line[previous[start > 0]]
+    prev = np.maximum(previous, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        elasticity = ((obj - obj[prev])/obj[prev])/((var - var[prev])/var[prev])
+
+    out[rows[order]] = np.where(has_previous, elasticity, np.nan)
+    return out
+# endregion
+
+
+# region Aggregation
+def bins(values: np.ndarray, pixels: int) -> tuple[float, float, int]:
+    '''
+    Uniform bins over values: one per grid value (spaced like the first two)
+    if there are no more than pixels of them, else pixels bins over the
+    range.
+
+    Returns:
+        tuple[float, float, int]: (low edge, high edge, number of bins)
+    '''
+    levels = np.unique(values)
+    low, high = float(levels[0]), float(levels[-1])
+    if len(levels) == 1:
+        return low - 0.5, high + 0.5, 1
+    if len(levels) <= pixels:
+        half = (levels[1] - levels[0])/2
+        return low - half, high + half, int(round((high - low)/(2*half))) + 1
+    return low, high, pixels
+
+
+def aggregate(x, y, values, x_bins, y_bins, how: str = 'min') -> np.ndarray:
+    '''
+    Aggregate points onto a raster of bins (rows are y bins, lowest first);
+    NaN where a bin has no point. how is one of AGGREGATIONS ('any' counts
+    points: 1.0 if any).
+    '''
+    if how not in AGGREGATIONS:
+        raise ValueError(f'Unknown aggregation {how!r}, must be one of {AGGREGATIONS}')
+    (x0, x1, nx), (y0, y1, ny) = x_bins, y_bins
+    i = np.clip(((x - x0)/(x1 - x0)*nx).astype(int), 0, nx - 1)
+    j = np.clip(((y - y0)/(y1 - y0)*ny).astype(int), 0, ny - 1)
+    k = j*nx + i
+
+    count = np.bincount(k, minlength=nx*ny).astype(float)
+    if how == 'any':
+        out = np.where(count > 0, 1.0, np.nan)
+    elif how == 'mean':
+        with np.errstate(invalid='ignore'):
+            out = np.bincount(k, weights=values, minlength=nx*ny)/count
+    else:
+        out = np.full(nx*ny, np.inf if how == 'min' else -np.inf)
+        (np.fmin if how == 'min' else np.fmax).at(out, k, values)
+        out[count == 0] = np.nan
+    return out.reshape(ny, nx)
+
+
+def _upscale(raster: np.ndarray, width: int, height: int) -> np.ndarray:
+    # Nearest bin for each pixel centre; rows flipped so the top row is the
+    # highest y
+    ny, nx = raster.shape[:2]
+    cols = ((np.arange(width) + 0.5)*nx/width).astype(int)
+    rows = ((np.arange(height) + 0.5)*ny/height).astype(int)
+    return raster[rows[::-1]][:, cols]
+# endregion
+
+
+# region Colour
+def gradient(t: np.ndarray, stops=GREEN_WHITE_RED) -> np.ndarray:
+    '''
+    RGBA (uint8) for t in [0, 1] along evenly spaced colour stops;
+    transparent where t is NaN.
+    '''
+    stops = np.asarray(stops, dtype=float)
+    at = np.linspace(0, 1, len(stops))
+    tt = np.nan_to_num(np.clip(t, 0, 1))
+    rgba = np.empty(t.shape + (4,), dtype=np.uint8)
+    for c in range(3):
+        rgba[..., c] = np.round(np.interp(tt, at, stops[:, c]))
+    rgba[..., 3] = np.where(np.isnan(t), 0, 255)
+    return rgba
+
+
+def _over(dst: np.ndarray, rgb, alpha: np.ndarray) -> np.ndarray:
+    # Composite a solid colour with per-pixel alpha over dst (float RGBA, 0-1)
+    a = alpha[..., None]
+    out = dst.copy()
+    out[..., 3:] = a + dst[..., 3:]*(1 - a)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[..., :3] = np.where(
+            out[..., 3:] > 0,
+            (np.asarray(rgb)/255*a + dst[..., :3]*dst[..., 3:]*(1 - a))/out[..., 3:],
+            0
+        )
+    return out
+
+
+def _outline(mask: np.ndarray, width: int = 2) -> np.ndarray:
+    # Pixels of mask within width of its edge
+    inner = mask.copy()
+    for _ in range(width):
+        shrunk = inner.copy()
+        shrunk[1:]     &= inner[:-1]
+        shrunk[:-1]    &= inner[1:]
+        shrunk[:, 1:]  &= inner[:, :-1]
+        shrunk[:, :-1] &= inner[:, 1:]
+        inner = shrunk
+    return mask & ~inner
+# endregion
+
+
+# region Output
+def png_bytes(rgba: np.ndarray) -> bytes:
+    '''
+    PNG encoding of an RGBA uint8 image (height, width, 4).
+    '''
+    height, width = rgba.shape[:2]
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)], axis=1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+        + chunk(b'IEND', b'')
+    )
+
+
+def write_png(path: str, rgba: np.ndarray):
+    with open(path, 'wb') as f:
+        f.write(png_bytes(rgba))
+
+
+def _ticks(low: float, high: float, n: int = 5) -> np.ndarray:
+    # 'Nice' tick values (1, 2 or 5 x 10^k apart) within [low, high]
+    raw  = (high - low)/max(n, 1)
+    base = 10**math.floor(math.log10(raw))
+    step = next(m*base for m in (1, 2, 5, 10) if m*base >= raw)
+    return np.arange(math.ceil(low/step)*step, high + step*1e-9, step)
+
+
+def _label(value: float) -> str:
+    return f'{value:.4g}'
+
+
+class _Figure:
+    # Minimal SVG builder
+    def __init__(self, title: str, subtitle: str = None, size=FIGURE_SIZE):
+        self.width, self.height = size
+        self.items = [f'<rect width="{self.width}" height="{self.height}" fill="white"/>']
+        self.text(self.width/2, 24, title, size=16, anchor='middle')
+        if subtitle:
+            self.text(self.width/2, 42, subtitle, size=11, anchor='middle', color='#555')
+
+    def text(self, x, y, s, size=11, anchor='start', color='black', rotate=None):
+        transform = f' transform="rotate({rotate} {x:.1f} {y:.1f})"' if rotate else ''
+        s = str(s).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        self.items.append(
+            f'<text x="{x:.1f}" y="{y:.1f}" font-family="sans-serif" font-size="{size}" '
+            f'text-anchor="{anchor}" fill="{color}"{transform}>{s}</text>'
+        )
+
+    def line(self, x0, y0, x1, y1, color='#999', width=1):
+        self.items.append(f'<line x1="{x0:.1f}" y1="{y0:.1f}" x2="{x1:.1f}" y2="{y1:.1f}" stroke="{color}" stroke-width="{width}"/>')
+
+    def rect(self, x, y, w, h, fill='none', stroke='#999', opacity=1):
+        self.items.append(
+            f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" fill="{fill}" '
+            f'fill-opacity="{opacity}" stroke="{stroke}"/>'
+        )
+
+    def image(self, x, y, rgba: np.ndarray):
+        h, w = rgba.shape[:2]
+        data = base64.b64encode(png_bytes(rgba)).decode('ascii')
+        self.items.append(
+            f'<image x="{x:.1f}" y="{y:.1f}" width="{w}" height="{h}" preserveAspectRatio="none" '
+            f'style="image-rendering:pixelated" href="data:image/png;base64,{data}"/>'
+        )
+
+    def panel(self, x, y, w, h, x_range, y_range, label=None, x_title=None, y_title=None):
+        # Frame, gridlines, ticks and titles of a panel with data ranges
+        for v in _ticks(*x_range):
+            px = x + (v - x_range[0])/(x_range[1] - x_range[0])*w
+            self.line(px, y, px, y + h, color='#e5e5e5')
+            self.text(px, y + h + 14, _label(v), size=10, anchor='middle')
+        for v in _ticks(*y_range):
+            py = y + h - (v - y_range[0])/(y_range[1] - y_range[0])*h
+            self.line(x, py, x + w, py, color='#e5e5e5')
+            self.text(x - 4, py + 3, _label(v), size=10, anchor='end')
+        self.rect(x, y, w, h)
+        if label is not None:
+            self.text(x + w/2, y - 5, label, size=11, anchor='middle')
+        if x_title:
+            self.text(x + w/2, y + h + 30, x_title, size=12, anchor='middle')
+        if y_title:
+            self.text(x - 40, y + h/2, y_title, size=12, anchor='middle', rotate=-90)
+
+    def colorbar(self, x, y, h, stops, value_range, title, transform=None, inverse=None):
+        # Vertical colour bar; transform/inverse map values to/from bar units
+        transform = transform or (lambda v: v)
+        inverse   = inverse or (lambda v: v)
+        t = np.linspace(1, 0, int(h))[:, None]*np.ones((1, 14))
+        self.text(x, y - 8, title, size=11)
+        self.image(x, y, gradient(t, stops))
+        lo, hi = transform(value_range[0]), transform(value_range[1])
+        for u in _ticks(lo, hi, 4):
+            py = y + h - (u - lo)/(hi - lo)*h if hi > lo else y + h/2
+            self.text(x + 18, py + 3, _label(inverse(u)), size=10)
+
+    def legend(self, x, y, entries, title):
+        self.text(x, y - 8, title, size=11)
+        for k, (label, rgb) in enumerate(entries):
+            color = '#%02x%02x%02x' % tuple(rgb)
+            self.rect(x, y + 18*k, 14, 14, fill=color, stroke=color, opacity=0.6)
+            self.text(x + 20, y + 18*k + 11, label, size=11)
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            f.write(
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" '
+                f'viewBox="0 0 {self.width} {self.height}">\n' + '\n'.join(self.items) + '\n</svg>\n'
+            )
+
+
+def _layout(n_cols: int, n_rows: int = 1, size=FIGURE_SIZE) -> tuple[int, int, list]:
+    # Panel size and top-left corners, row-major
+    left, right, top, bottom = MARGINS
+    w = int((size[0] - left - right - PANEL_GAP*(n_cols - 1))/n_cols)
+    h = int((size[1] - top - bottom - PANEL_GAP*(n_rows - 1))/n_rows)
+    corners = [(left + c*(w + PANEL_GAP), top + r*(h + PANEL_GAP)) for r in range(n_rows) for c in range(n_cols)]
+    return w, h, corners
+
+
+def _sensors(data: dict) -> list:
+    # Elementwise identity comparisons, no hashing of every point's sensor
+    return [s for s in Sensor if (data['sensor'] == s).any()]
+
+
+def _extent(data: dict, w: int, h: int):
+    # Bins over the whole grid (all sensors), so panels line up
+    return bins(data['mach'], w), bins(data['altitude_kft'], h)
+# endregion
+
+
+# region Plots
+def make_sensor_feasibility_plot(data: dict, path: str, size=FIGURE_SIZE):
+    '''
+    Feasible (valid) region of each sensor over mach and altitude: shaded,
+    outlined, overlaid in one panel.
+    '''
+    fig = _Figure('Mach/Altitude Feasibility Envelope by Sensor', size=size)
+    w, h, [(x, y)] = _layout(1, size=size)
+    x_bins, y_bins = _extent(data, w, h)
+
+    canvas = np.zeros((h, w, 4))
+    sensors = _sensors(data)
+    masks = {}
+    for sensor in sensors:
+        sel = (data['sensor'] == sensor) & data['valid']
+        raster = aggregate(data['mach'][sel], data['altitude_kft'][sel], None, x_bins, y_bins, 'any')
+        masks[sensor] = ~np.isnan(_upscale(raster, w, h))
+        canvas = _over(canvas, SENSOR_COLORS[sensor], np.where(masks[sensor], 0.3, 0.0))
+    for sensor in sensors:
+        canvas = _over(canvas, SENSOR_COLORS[sensor], np.where(_outline(masks[sensor]), 1.0, 0.0))
+
+    fig.panel(x, y, w, h, x_bins[:2], y_bins[:2], x_title='Mach', y_title='Altitude (kft)')
+    fig.image(x, y, np.round(canvas*255).astype(np.uint8))
+    fig.legend(x + w + 16, y + 10, [(s.name, SENSOR_COLORS[s]) for s in sensors], 'Sensor Type')
+    fig.save(path)
+
+
+def make_cost_heatmap(data: dict, path: str, how: str = 'min', size=FIGURE_SIZE):
+    '''
+    onsta_req_cost over mach and altitude, a panel per sensor, log colour
+    scale shared by the panels. Each pixel shows the how-aggregate of its
+    valid designs.
+    '''
+    fig = _Figure('ONSTA Aircraft Cost by Sensor', size=size)
+    sensors = _sensors(data)
+    w, h, corners = _layout(len(sensors), size=size)
+    x_bins, y_bins = _extent(data, w, h)
+
+    rasters = []
+    for sensor in sensors:
+        sel = (data['sensor'] == sensor) & data['valid']
+        rasters.append(aggregate(data['mach'][sel], data['altitude_kft'][sel], data['onsta_req_cost'][sel], x_bins, y_bins, how))
+    finite = np.concatenate([r[np.isfinite(r)] for r in rasters]) if rasters else np.empty(0)
+    lo, hi = (np.log10(finite.min()), np.log10(finite.max())) if len(finite) else (0.0, 1.0)
+
+    for k, (sensor, raster, (x, y)) in enumerate(zip(sensors, rasters, corners)):
+        fig.panel(x, y, w, h, x_bins[:2], y_bins[:2], label=sensor.name, x_title='Mach',
+                  y_title='Altitude (kft)' if k == 0 else None)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (np.log10(raster) - lo)/(hi - lo) if hi > lo else np.where(np.isnan(raster), np.nan, 0.5)
+        fig.image(x, y, gradient(_upscale(t, w, h)))
+
+    fig.colorbar(corners[-1][0] + w + 16, corners[0][1] + 20, h*0.6, GREEN_WHITE_RED,
+                 (10**lo, 10**hi), 'Cost ($M)', transform=math.log10, inverse=lambda u: 10**u)
+    fig.save(path)
+
+
+def make_elasticity_heatmap(data: dict, path: str, how: str = 'mean', size=FIGURE_SIZE):
+    '''
+    Elasticity of onsta_req_cost (calc_elasticity) to altitude, mach and
+    sensor, a row per variable and a column per sensor, on a diverging
+    scale centred on 0.
+    '''
+    names = ('altitude_kft', 'mach', 'sensor')
+    fig = _Figure('Elasticity Heatmap', 'Red = Positive, White = Zero, Green = Negative', size=size)
+    sensors = _sensors(data)
+    w, h, corners = _layout(len(sensors), len(names), size=size)
+    x_bins, y_bins = _extent(data, w, h)
+
+    rasters = {}
+    of_sensor = {sensor: data['sensor'] == sensor for sensor in sensors}
+    for name in names:
+        elasticity = calc_elasticity(data, name)
+        for sensor in sensors:
+            sel = of_sensor[sensor] & ~np.isnan(elasticity)
+            rasters[name, sensor] = aggregate(data['mach'][sel], data['altitude_kft'][sel], elasticity[sel], x_bins, y_bins, how)
+    finite = np.concatenate([r[np.isfinite(r)] for r in rasters.values()] + [np.zeros(1)])
+    scale = float(np.abs(finite).max()) or 1.0
+
+    for (name, sensor), (x, y) in zip(rasters, corners):
+        row, col = names.index(name), sensors.index(sensor)
+        fig.panel(
+            x, y, w, h, x_bins[:2], y_bins[:2],
+            label    = sensor.name if row == 0 else None,
+            x_title  = 'Mach' if row == len(names) - 1 else None,
+            y_title  = 'Altitude (kft)' if col == 0 and row == 1 else None
+        )
+        if col == len(sensors) - 1:
+            fig.text(x + w + 6, y + h/2, name, size=10, rotate=90)
+        fig.image(x, y, gradient(_upscale(0.5 + rasters[name, sensor]/(2*scale), w, h)))
+
+    fig.colorbar(corners[-1][0] + w + 30, corners[0][1] + 20, h*1.5, GREEN_WHITE_RED, (-scale, scale), 'Elasticity')
+    fig.save(path)
+
+
+def render_plots(data: dict, out_dir: str = PLOTS_OUTPUT_PATH) -> list[str]:
+    '''
+    The three plots of r/analysis.R, as SVG files in out_dir. The
+    elasticity heatmap needs gridded designs (is_grid) and is skipped for
+    scattered ones.
+
+    Returns:
+        list[str]: paths written.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, name) for name in (
+        'sensor_feasibility.svg', 'onsta_cost_by_mach_alt_sensor.svg', 'elasticity.svg'
+    )]
+    make_sensor_feasibility_plot(data, paths[0])
+    make_cost_heatmap(data, paths[1])
+    if not is_grid(data):
+        return paths[:2]
+    make_elasticity_heatmap(data, paths[2])
+    return paths
+# endregion
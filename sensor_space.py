@@ -0,0 +1,233 @@
+from dataclasses import dataclass, replace
+import math
+import numpy as np
+from constants import *
+from performance import PERFORMANCE_MODELS
+from batch import ConfigBatch, BatchResult, aircraft_stage, evaluate_batch
+
+
+# Continuous sensor design space: instead of the three Sensor members with
+# fixed SensorAssumptions, sweep FOV, resolution and Johnson requirement as
+# dimensions of their own, price each design with a parametric cost model, and
+# trade them against the airframe (altitude x mach) in one run.
+#
+# Airframe cost and endurance don't depend on the sensor, so they're computed
+# once per (altitude, mach) and broadcast over the sensor designs; everything
+# from the sensor performance on is evaluated for every (sensor design,
+# airframe) pair, a chunk of pairs at a time so memory stays bounded however
+# big the space is.
+#
+# Designs carry no Sensor member (sensor is None in their configs).
+
+
+@dataclass(frozen=True)
+class SensorCostModel:
+    '''
+    Sensor cost in $M as a power law in pixel count and FOV:
+
+        ref_cost * (pixels/ref_pixels)**pixel_exponent * (fov/ref_fov_deg)**fov_exponent
+
+    with fov the mean of the horizontal and vertical FOV. The defaults match
+    the MED sensor and give LOW and HIGH within a factor of 1.6.
+    '''
+    ref_cost:       float = 1.0
+    ref_pixels:     float = 960*960
+    pixel_exponent: float = 2.0
+    ref_fov_deg:    float = 30.0
+    fov_exponent:   float = 0.0
+
+    def cost(self, fov_deg: np.ndarray, resolution: np.ndarray) -> np.ndarray:
+        '''
+        Cost of each design; fov_deg and resolution are (m, 2).
+        '''
+        pixels = resolution[:, 0]*resolution[:, 1]
+        fov    = fov_deg.mean(axis=1)
+        return self.ref_cost*(pixels/self.ref_pixels)**self.pixel_exponent*(fov/self.ref_fov_deg)**self.fov_exponent
+
+    @classmethod
+    def fit(cls, assumptions, ref_pixels: float = 960*960) -> 'SensorCostModel':
+        '''
+        Least-squares fit (in log space) of ref_cost and pixel_exponent to
+        existing SensorAssumptions, e.g. main.SENSOR_ASSUMPTIONS.values().
+        '''
+        assumptions = list(assumptions)
+        x = np.log([a.resolution[0]*a.resolution[1]/ref_pixels for a in assumptions])
+        y = np.log([a.cost for a in assumptions])
+        pixel_exponent, log_ref_cost = np.polyfit(x, y, 1)
+        return cls(ref_cost=float(np.exp(log_ref_cost)), ref_pixels=ref_pixels, pixel_exponent=float(pixel_exponent))
+
+
+def _pairs(values) -> np.ndarray:
+    '''
+    (k,) values of a square quantity, or (k, 2) (horizontal, vertical) pairs,
+    as (k, 2).
+    '''
+    values = np.asarray(values, dtype=float)
+    return np.stack([values, values], axis=1) if values.ndim == 1 else values.reshape(-1, 2)
+
+
+@dataclass
+class SensorSpace:
+    '''
+    Grid of sensor designs: every combination of FOV, resolution and Johnson
+    requirement. FOV and resolution take (k,) values (square) or (k, 2)
+    (horizontal, vertical) pairs.
+    '''
+    fov_deg:     np.ndarray
+    resolution:  np.ndarray
+    johnson_req: np.ndarray
+    cost_model:  SensorCostModel = SensorCostModel()
+
+    def __post_init__(self):
+        self.fov_deg     = _pairs(self.fov_deg)
+        self.resolution  = _pairs(self.resolution)
+        self.johnson_req = np.atleast_1d(np.asarray(self.johnson_req, dtype=float))
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return (len(self.fov_deg), len(self.resolution), len(self.johnson_req))
+
+    def __len__(self):
+        return math.prod(self.shape)
+
+    def designs(self, idx=slice(None)) -> dict:
+        '''
+        Flattened designs idx (FOV slowest, Johnson requirement fastest) as
+        arrays: fov_deg and resolution (m, 2), johnson_req and cost (m,).
+        '''
+        f, r, j = np.unravel_index(np.arange(len(self))[idx], self.shape)
+        fov_deg, resolution = self.fov_deg[f], self.resolution[r]
+        return {
+            'fov_deg':     fov_deg,
+            'resolution':  resolution,
+            'johnson_req': self.johnson_req[j],
+            'cost':        self.cost_model.cost(fov_deg, resolution),
+        }
+
+
+@dataclass
+class SensorTradeResult:
+    '''
+    Results over the sensor space x altitude x mach. Per-design arrays are
+    indexed by flattened design (see SensorSpace.designs); results have shape
+    (designs, altitudes, machs).
+    '''
+    space:                 SensorSpace
+    altitudes:             np.ndarray
+    machs:                 np.ndarray
+    sensor_cost:           np.ndarray
+    valid:                 np.ndarray
+    reason:                np.ndarray
+    ac_cost:               np.ndarray
+    effective_sweep_width: np.ndarray
+    search_rate:           np.ndarray
+    onsta_req_n:           np.ndarray
+    onsta_req_cost:        np.ndarray
+
+    def best(self, objective: str = 'onsta_req_cost') -> dict:
+        '''
+        The valid (design, altitude, mach) minimizing objective, with the
+        design's parameters.
+        '''
+        values = np.where(self.valid, getattr(self, objective), np.inf)
+        d, a, m = np.unravel_index(np.argmin(values), values.shape)
+        design = {name: value[0] for name, value in self.space.designs([d]).items()}
+        return {
+            'design':       int(d),
+            **design,
+            'altitude_kft': float(self.altitudes[a]),
+            'mach':         float(self.machs[m]),
+            objective:      float(values[d, a, m]),
+        }
+
+
+def iter_sensor_space(
+        template: Config,
+        space: SensorSpace,
+        altitudes,
+        machs,
+        chunk_size: int = 200_000,
+        solver: SolverSettings = SolverSettings()
+    ):
+    '''
+    Lazily evaluate the sensor space against every (altitude, mach), about
+    chunk_size pairs at a time.
+
+    Args:
+        template (Config): everything but altitude, mach and the sensor.
+        space (SensorSpace)
+        altitudes, machs: 1-D values of the airframe grid.
+        chunk_size (int): (design, airframe) pairs per evaluate_batch call.
+        solver (SolverSettings): for the effective sweep width.
+
+    Yields:
+        tuple[slice, BatchResult]: the designs in the chunk, and their results,
+        design-major over the (altitude, mach) grid.
+    '''
+    altitudes = np.asarray(altitudes, dtype=float)
+    machs     = np.asarray(machs, dtype=float)
+    alt, mach = (x.ravel() for x in np.meshgrid(altitudes, machs, indexing='ij'))
+    n_air     = len(alt)
+
+    # Sensor-independent: airframe cost and endurance, once per airframe
+    airframe_cost = np.full(n_air, np.nan)
+    endurance_sec = np.full(n_air, np.nan)
+    if template.performance_model in PERFORMANCE_MODELS:
+        airframe_cost, endurance_sec = aircraft_stage(
+            mach, alt, np.zeros(n_air), np.full(n_air, template.performance_model, dtype=object)
+        )
+
+    base = ConfigBatch.from_configs([template])
+    per_chunk = max(chunk_size//n_air, 1)
+    for d0 in range(0, len(space), per_chunk):
+        designs = slice(d0, min(d0 + per_chunk, len(space)))
+        d = space.designs(designs)
+        k = len(d['cost'])
+
+        batch = replace(
+            base.take(np.zeros(k*n_air, dtype=int)),
+            altitude_kft                  = np.tile(alt, k),
+            mach                          = np.tile(mach, k),
+            sensor                        = np.full(k*n_air, None, dtype=object),
+            sensor_assumption_fov_deg     = np.repeat(d['fov_deg'], n_air, axis=0),
+            sensor_assumption_resolution  = np.repeat(d['resolution'], n_air, axis=0),
+            sensor_assumption_johnson_req = np.repeat(d['johnson_req'], n_air),
+            sensor_assumption_cost        = np.repeat(d['cost'], n_air),
+        )
+        aircraft = (np.tile(airframe_cost, k) + batch.sensor_assumption_cost, np.tile(endurance_sec, k))
+        yield designs, evaluate_batch(batch, aircraft=aircraft, solver=solver)
+
+
+def evaluate_sensor_space(
+        template: Config,
+        space: SensorSpace,
+        altitudes,
+        machs,
+        chunk_size: int = 200_000,
+        solver: SolverSettings = SolverSettings()
+    ) -> SensorTradeResult:
+    '''
+    Evaluate the sensor space against every (altitude, mach) (see
+    iter_sensor_space), keeping the headline results.
+
+    Returns:
+        SensorTradeResult
+    '''
+    shape = (len(space), len(altitudes), len(machs))
+    out = {
+        'valid':  np.zeros(shape, dtype=bool),
+        'reason': np.empty(shape, dtype=object),
+        **{name: np.full(shape, np.nan) for name in
+           ('ac_cost', 'effective_sweep_width', 'search_rate', 'onsta_req_n', 'onsta_req_cost')}
+    }
+    for designs, result in iter_sensor_space(template, space, altitudes, machs, chunk_size, solver):
+        for name, values in out.items():
+            values[designs] = getattr(result, name).reshape((-1,) + shape[1:])
+
+    return SensorTradeResult(
+        space       = space,
+        altitudes   = np.asarray(altitudes, dtype=float),
+        machs       = np.asarray(machs, dtype=float),
+        sensor_cost = space.designs()['cost'],
+        **out
+    )
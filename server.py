@@ -0,0 +1,409 @@
+import json
+import math
+import queue
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from dataclasses import fields, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from constants import *
+from batch import ConfigBatch, BatchResult, evaluate_batch
+from flyweight import intern
+from performance import PERFORMANCE_MODELS
+
+
+# Long-lived local evaluation server, for dashboards that ask for one design
+# point at a time: the process (imports, performance models, compiled
+# kernels) stays warm, and so does a cache of results by Config.
+#
+# Requests are handled on threads, but evaluation goes through one batcher
+# thread: it takes the first waiting point, collects whatever else arrives
+# within MAX_WAIT_SEC (up to MAX_BATCH points), evaluates them together with
+# evaluate_batch and hands each request its rows, so concurrent single-point
+# requests share one vectorized evaluation instead of each paying for its
+# own.
+#
+# HTTP on localhost only (stdlib, JSON):
+# - POST /evaluate: a point, or a list of points; a point is a dict of Config
+#                   fields that differ from the template (altitude_kft, mach,
+#                   sensor by name, manx_*, aoi_revisit_time_hr, ...). Returns
+#                   a result (BatchResult fields) or a list of them
+# - GET /stats:     request latency percentiles, batch sizes, cache hits
+# - GET /health
+# Client calls the server from Python.
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+MAX_BATCH    = 512
+MAX_WAIT_SEC = 0.002
+CACHE_SIZE   = 100_000 # results kept, by Config
+
+LATENCY_WINDOW = 10_000 # most recent requests the percentiles are over
+PERCENTILES    = (50, 90, 99, 99.9)
+
+# Config fields a point can set directly: numbers, and names of models
+NUMERIC_POINT_FIELDS = (
+    'altitude_kft',
+    'mach',
+    'manx_bank_angle_rad',
+    'manx_decel_gees',
+    'manx_min_mach',
+    'aoi_revisit_time_hr',
+)
+POINT_FIELDS = NUMERIC_POINT_FIELDS + ('performance_model', 'aspect_model')
+
+
+def _row(result: BatchResult, i: int) -> dict:
+    # The i-th result as JSON (NaN as null, pairs as lists)
+    row = {}
+    for f in fields(result):
+        value = getattr(result, f.name)[i]
+        if isinstance(value, np.ndarray):
+            value = [None if math.isnan(v) else v for v in value.tolist()]
+        elif isinstance(value, np.generic):
+            value = value.item()
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+        row[f.name] = value
+    return row
+
+
+class LatencyStats:
+    '''
+    Rolling request latencies and batch sizes. Thread safe.
+    '''
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.lock       = threading.Lock()
+        self.latencies  = deque(maxlen=window) # sec
+        self.batches    = deque(maxlen=window) # points per evaluate_batch
+        self.requests   = 0
+        self.errors     = 0 # requests answered with an error (in requests)
+        self.points     = 0
+        self.cache_hits = 0
+
+    def record_request(self, latency_sec: float, points: int, cache_hits: int, error: bool = False):
+        with self.lock:
+            self.latencies.append(latency_sec)
+            self.requests   += 1
+            self.errors     += error
+            self.points     += points
+            self.cache_hits += cache_hits
+
+    def record_batch(self, size: int):
+        with self.lock:
+            self.batches.append(size)
+
+    def summary(self, percentiles: tuple[float, ...] = PERCENTILES) -> dict:
+        '''
+        Counts, latency percentiles (ms, over all requests, errors
+        included) and mean batch size.
+        '''
+        with self.lock:
+            latencies = np.array(self.latencies)*1000
+            batches   = np.array(self.batches)
+            summary = {
+                'requests':        self.requests,
+                'errors':          self.errors,
+                'points':          self.points,
+                'cache_hits':      self.cache_hits,
+                'batches':         len(batches),
+                'mean_batch_size': float(batches.mean()) if len(batches) else None,
+                'max_batch_size':  int(batches.max()) if len(batches) else None,
+            }
+        for p in percentiles:
+            summary[f'p{p:g}_ms'] = float(np.percentile(latencies, p)) if len(latencies) else None
+        return summary
+
+
+class _Pending:
+    # Points of one request waiting for the batcher
+    def __init__(self, configs: list[Config]):
+        self.configs = configs
+        self.rows    = None
+        self.error   = None
+        self.done    = threading.Event()
+
+
+class MicroBatcher:
+    '''
+    Evaluates points from many threads in shared batches, with a result
+    cache. evaluate blocks until the request's points are done.
+    '''
+
+    def __init__(
+            self,
+            solver: SolverSettings = SolverSettings(),
+            max_batch: int = MAX_BATCH,
+            max_wait_sec: float = MAX_WAIT_SEC,
+            cache_size: int = CACHE_SIZE,
+            stats: LatencyStats = None
+        ):
+        self.solver       = solver
+        self.max_batch    = max_batch
+        self.max_wait_sec = max_wait_sec
+        self.cache_size   = cache_size
+        self.stats        = stats or LatencyStats()
+        self.cache        = OrderedDict() # Config -> row, least recently used first
+        self.cache_lock   = threading.Lock()
+        self.queue        = queue.Queue()
+        self.thread       = threading.Thread(target=self._run, name='batcher', daemon=True)
+        self.thread.start()
+
+    def _cached(self, config: Config):
+        with self.cache_lock:
+            row = self.cache.get(config)
+            if row is not None:
+                self.cache.move_to_end(config)
+            return row
+
+    def _store(self, config: Config, row: dict):
+        with self.cache_lock:
+            self.cache[config] = row
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def evaluate(self, configs: list[Config]) -> tuple[list[dict], int]:
+        '''
+        Results of configs (from the cache where possible).
+
+        Returns:
+            tuple[list[dict], int]: (a result row per config, cache hits)
+        '''
+        rows = [self._cached(config) for config in configs]
+        missing = [config for config, row in zip(configs, rows) if row is None]
+        if missing:
+            pending = _Pending(missing)
+            self.queue.put(pending)
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            fresh = iter(pending.rows)
+            rows = [next(fresh) if row is None else row for row in rows]
+        return rows, len(configs) - len(missing)
+
+    def _run(self):
+        while True:
+            waiting = [self.queue.get()]
+            size = len(waiting[0].configs)
+            deadline = time.perf_counter() + self.max_wait_sec
+            while size < self.max_batch:
+                try:
+                    pending = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                waiting.append(pending)
+                size += len(pending.configs)
+            self._evaluate(waiting)
+
+    def _evaluate(self, waiting: list[_Pending]):
+        # One evaluate_batch over the distinct configs of the waiting
+        # requests. If it fails, each request is evaluated on its own, so only
+        # the ones that fail alone get the error.
+        try:
+            self._evaluate_together(waiting)
+        except Exception as e:
+            if len(waiting) == 1:
+                waiting[0].error = e
+                waiting[0].done.set()
+                return
+            for pending in waiting:
+                self._evaluate([pending])
+
+    def _evaluate_together(self, waiting: list[_Pending]):
+        index = {}
+        for pending in waiting:
+            for config in pending.configs:
+                index.setdefault(config, len(index))
+        configs = list(index)
+        result = evaluate_batch(ConfigBatch.from_configs(configs), solver=self.solver)
+        rows = [_row(result, i) for i in range(len(configs))]
+
+        self.stats.record_batch(len(configs))
+        for config, row in zip(configs, rows):
+            self._store(config, row)
+        for pending in waiting:
+            pending.rows = [rows[index[config]] for config in pending.configs]
+            pending.done.set()
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads     = True
+    request_queue_size = 256 # listen backlog: bursts of concurrent clients
+
+
+class EvaluationServer:
+    '''
+    The evaluation server, on host:port (port 0 picks a free one).
+
+    Args:
+        template (Config): values of everything a point doesn't set.
+        sensor_assumptions (dict): Sensor -> SensorAssumption, for points
+            that set sensor.
+        solver (SolverSettings): for the effective sweep width.
+        max_batch (int), max_wait_sec (float), cache_size (int): see
+            MicroBatcher.
+    '''
+
+    def __init__(
+            self,
+            template: Config,
+            sensor_assumptions: dict,
+            host: str = DEFAULT_HOST,
+            port: int = DEFAULT_PORT,
+            solver: SolverSettings = SolverSettings(),
+            max_batch: int = MAX_BATCH,
+            max_wait_sec: float = MAX_WAIT_SEC,
+            cache_size: int = CACHE_SIZE
+        ):
+        self.template           = template
+        self.sensor_assumptions = sensor_assumptions
+        self.stats              = LatencyStats()
+        self.batcher            = MicroBatcher(solver, max_batch, max_wait_sec, cache_size, self.stats)
+        self.httpd              = _HTTPServer((host, port), self._handler())
+        self.thread             = None
+
+        # Warm up: imports, performance models and compiled kernels
+        evaluate_batch(ConfigBatch.from_configs([template]), solver=solver)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def config(self, point: dict) -> Config:
+        '''
+        The Config of a point (see POINT_FIELDS; sensor by name). Raises
+        ValueError for anything that isn't a valid point, so a bad point is
+        rejected before it can share a batch with good ones.
+        '''
+        if not isinstance(point, dict):
+            raise ValueError(f'A point must be an object, not {point!r}')
+        unknown = set(point) - set(POINT_FIELDS) - {'sensor'}
+        if unknown:
+            raise ValueError(f'Unknown fields {sorted(unknown)}, a point can set {list(POINT_FIELDS) + ["sensor"]}')
+
+        changes = {}
+        for name in NUMERIC_POINT_FIELDS:
+            if name in point:
+                value = point[name]
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                    raise ValueError(f'{name} must be a finite number, not {value!r}')
+                changes[name] = float(value)
+        for name, known in (('performance_model', PERFORMANCE_MODELS), ('aspect_model', ASPECT_MODELS)):
+            if name in point:
+                if not isinstance(point[name], str) or point[name] not in known:
+                    raise ValueError(f'Unknown {name} {point[name]!r}, must be one of {list(known)}')
+                changes[name] = point[name]
+        if 'sensor' in point:
+            try:
+                if not isinstance(point['sensor'], str):
+                    raise KeyError
+                sensor = Sensor[point['sensor']]
+            except KeyError:
+                raise ValueError(f"Unknown sensor {point['sensor']!r}, must be one of {[s.name for s in Sensor]}")
+            if sensor not in self.sensor_assumptions:
+                raise ValueError(f'No sensor assumption for {sensor.name}')
+            changes['sensor'] = sensor
+            changes['sensor_assumption'] = intern(self.sensor_assumptions[sensor])
+        return replace(self.template, **changes)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status: int, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._send(200, server.stats.summary())
+                elif self.path == '/health':
+                    self._send(200, {'ok': True})
+                else:
+                    self._send(404, {'error': f'No such path {self.path}'})
+
+            def do_POST(self):
+                start = time.perf_counter()
+                if self.path != '/evaluate':
+                    self._send(404, {'error': f'No such path {self.path}'})
+                    return
+                configs = []
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    single = not isinstance(body, list)
+                    configs = [server.config(point) for point in ([body] if single else body)]
+                except (ValueError, TypeError) as e:
+                    self._send(400, {'error': str(e)})
+                    server.stats.record_request(time.perf_counter() - start, len(configs), 0, error=True)
+                    return
+                try:
+                    rows, hits = server.batcher.evaluate(configs)
+                except Exception as e:
+                    self._send(500, {'error': f'{type(e).__name__}: {e}'})
+                    server.stats.record_request(time.perf_counter() - start, len(configs), 0, error=True)
+                    return
+                self._send(200, rows[0] if single else rows)
+                server.stats.record_request(time.perf_counter() - start, len(configs), hits)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'EvaluationServer':
+        '''
+        Serve on a background thread.
+        '''
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='server', daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class Client:
+    '''
+    Calls an EvaluationServer (one keep-alive-free HTTP request per call).
+    '''
+
+    def __init__(self, url: str = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}', timeout: float = 60):
+        self.url     = url
+        self.timeout = timeout
+
+    def _call(self, path: str, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def evaluate(self, point: dict | list[dict]) -> dict | list[dict]:
+        '''
+        Result of a point, or results of a list of points.
+        '''
+        return self._call('/evaluate', point)
+
+    def stats(self) -> dict:
+        return self._call('/stats')
+
+    def health(self) -> bool:
+        return self._call('/health')['ok']
@@ -0,0 +1,188 @@
+import numpy as np
+
+
+# Solvers for the effective sweep width self-consistency condition: the
+# lateral offset between legs sets the turn-around time, which sets the sweep
+# width the limiting targets allow, which has to equal the lateral offset.
+#
+# All solvers work on a batch of configs at once. They're given the map
+#
+#     g(idx, offset) -> (sweep width, turn-around time)
+#
+# for the configs idx at the given offsets, and a starting offset per config.
+# Converged means the relative self-consistency error |g(w) - w|/|w| is within
+# tol. Every solver returns the width and turn time at its final offset, as
+# calc_effective_sweep_width does, and counts iterations as evaluations of g
+# (each one a turn-around calculation).
+#
+# As in calc_effective_sweep_width, a config whose first width is <= 0 is
+# infeasible and stops there.
+
+SOLVERS = ('fixed_point', 'aitken', 'secant', 'brentq')
+
+
+def _rel_change(new, old):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs((new - old)/old)
+
+
+def solve(g, w0, method: str = 'fixed_point', tol: float = 0.01, max_iter: int = 25):
+    '''
+    Solve the sweep width fixed point for a batch of configs.
+
+    Args:
+        g: map (idx, offset) -> (sweep width, turn-around time).
+        w0 (np.ndarray): starting offsets.
+        method (str): one of SOLVERS
+            - 'fixed_point': successive substitution (the original scheme)
+            - 'aitken':      Steffensen's method (Aitken delta-squared on two
+                             substitution steps)
+            - 'secant':      secant method on the residual g(w) - w
+            - 'brentq':      scipy.optimize.brentq on the residual, bracketed
+                             between g(w0) and w0 (one config at a time)
+        tol (float): relative self-consistency tolerance.
+        max_iter (int): iterations allowed after the first evaluation of g.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: (sweep width,
+        turn-around time, iterations, converged)
+    '''
+    if method not in SOLVERS:
+        raise ValueError(f'Unknown sweep width solver {method!r}, choose from {SOLVERS}')
+
+    n = len(w0)
+    everything = np.arange(n)
+    w = np.array(w0, dtype=float)
+    width, turn_time = (np.asarray(x, dtype=float).copy() for x in g(everything, w))
+    iterations = np.ones(n, dtype=int)
+
+    # Infeasible or already self-consistent configs are done
+    active = (width > 0) & (_rel_change(width, w) > tol)
+
+    if method == 'fixed_point':
+        _fixed_point(g, w, width, turn_time, iterations, active, tol, max_iter)
+    elif method == 'aitken':
+        _aitken(g, w, width, turn_time, iterations, active, tol, max_iter)
+    elif method == 'secant':
+        _secant(g, w, width, turn_time, iterations, active, tol, max_iter)
+    else:
+        _brentq(g, w, width, turn_time, iterations, active, tol, max_iter)
+
+    converged = (width <= 0) | ~(_rel_change(width, w) > tol)
+    return width, turn_time, iterations, converged
+
+
+def _evaluate(g, idx, w, width, turn_time, iterations, active, tol):
+    width[idx], turn_time[idx] = g(idx, w[idx])
+    iterations[idx] += 1
+    active[idx] = _rel_change(width[idx], w[idx]) > tol
+
+
+def _fixed_point(g, w, width, turn_time, iterations, active, tol, max_iter):
+    i = 0
+    while active.any() and i < max_iter:
+        i = i+1
+        idx = np.flatnonzero(active)
+        w[idx] = width[idx]
+        _evaluate(g, idx, w, width, turn_time, iterations, active, tol)
+
+
+def _aitken(g, w, width, turn_time, iterations, active, tol, max_iter):
+    while active.any():
+        # Each step costs 2 evaluations
+        idx = np.flatnonzero(active & (iterations + 2 <= max_iter + 1))
+        if len(idx) == 0:
+            break
+
+        w_0 = w[idx]
+        w_1 = width[idx]
+        w_2, _ = g(idx, w_1)
+        w_2 = np.asarray(w_2, dtype=float)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w_new = w_0 - (w_1 - w_0)**2/(w_2 - 2*w_1 + w_0)
+        # Fall back to the plain substitution step if extrapolation misbehaves
+        bad = ~np.isfinite(w_new) | (w_new <= 0)
+        w_new[bad] = w_2[bad]
+
+        iterations[idx] += 1
+        w[idx] = w_new
+        _evaluate(g, idx, w, width, turn_time, iterations, active, tol)
+
+
+def _secant(g, w, width, turn_time, iterations, active, tol, max_iter):
+    # Start from the first substitution step
+    w_prev = w.copy()
+    r_prev = width - w
+
+    i = 0
+    while active.any() and i < max_iter:
+        idx = np.flatnonzero(active)
+        r   = width[idx] - w[idx]
+
+        if i == 0:
+            w_new = width[idx].copy()
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                w_new = w[idx] - r*(w[idx] - w_prev[idx])/(r - r_prev[idx])
+            bad = ~np.isfinite(w_new) | (w_new <= 0)
+            w_new[bad] = width[idx][bad]
+
+        i = i+1
+        w_prev[idx], r_prev[idx] = w[idx], r
+        w[idx] = w_new
+        _evaluate(g, idx, w, width, turn_time, iterations, active, tol)
+
+
+def _brentq(g, w, width, turn_time, iterations, active, tol, max_iter):
+    from scipy.optimize import brentq
+
+    for k in np.flatnonzero(active):
+        if iterations[k] >= max_iter + 1:
+            # No evaluations left to bracket with
+            continue
+        idx = np.array([k])
+
+        # Evaluations of g by offset: brentq re-evaluates the bracket ends and
+        # returns one of its evaluations, which shouldn't cost iterations
+        seen = {float(w[k]): (width[k], turn_time[k])}
+
+        def evaluate(offset):
+            if offset not in seen:
+                width_k, turn_time_k = g(idx, np.array([offset]))
+                seen[offset] = (float(width_k[0]), float(turn_time_k[0]))
+                iterations[k] += 1
+            return seen[offset]
+
+        def residual(offset):
+            return evaluate(offset)[0] - offset
+
+        # Bracket: the starting offset (width shrinks below it) and the first
+        # width (always positive here)
+        hi = w[k]
+        lo = width[k]
+        r_lo = residual(float(lo))
+        if r_lo*(width[k] - hi) > 0:
+            # Residual has the same sign at both ends, can't bracket
+            continue
+
+        # brentq evaluates once per iteration after the (seen) bracket ends;
+        # what's left of the max_iter + 1 evaluations
+        budget = max_iter + 1 - iterations[k]
+        if budget <= 0:
+            continue
+
+        try:
+            offset = brentq(
+                residual, min(lo, hi), max(lo, hi),
+                rtol        = max(tol/4, 4*np.finfo(float).eps),
+                maxiter     = budget,
+                full_output = True,
+                disp        = False
+            )[0]
+        except ValueError:
+            continue
+
+        w[k] = offset
+        width[k], turn_time[k] = evaluate(offset)
+        active[k] = _rel_change(width[k], w[k]) > tol
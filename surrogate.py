@@ -0,0 +1,514 @@
+from dataclasses import dataclass
+import math
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from scipy.optimize import minimize
+from constants import *
+from batch import ConfigBatch, BatchResult, evaluate_batch
+from doe import DesignSpace, unit_points, concat_batches
+
+
+# Surrogate models of the tradespace, so trade studies can query
+# onsta_req_cost, onsta_req_n and feasibility without evaluating the model.
+#
+# Surrogates work in a DesignSpace's unit coordinates (doe.py), fitted from
+# any evaluated batch of configs in the space (a DOE, a grid sweep, ...):
+# - onsta_req_cost and onsta_req_n: regressions of their logs (they span
+#   decades), on the valid configs only
+# - feasibility: the same regression of the 0/1 valid flag, thresholded at
+#   0.5
+#
+# Models (SURROGATES):
+# - 'poly': polynomial chaos, Legendre polynomials up to a total degree,
+#           by (ridge) least squares. Query cost doesn't grow with the
+#           training set: the one for bulk queries (millions of points).
+# - 'rbf':  cubic radial basis function interpolation with a linear tail,
+#           with optional smoothing.
+# - 'gp':   Gaussian process with an anisotropic squared-exponential kernel,
+#           hyperparameters by maximum marginal likelihood. Usually the most
+#           accurate, and gives the predictive standard deviation, which
+#           drives active learning.
+#
+# Every model predicts as features(X) @ weights + tail(X): Legendre basis,
+# RBF kernel or GP kernel columns. SurrogateSet.predict evaluates each
+# distinct feature matrix once per chunk of points (the three poly models
+# share one basis, the rbf cost and fleet-size models their centers) and gets
+# all targets from one matrix product. 'rbf' and 'gp' queries still cost one
+# kernel evaluation per training point, so the GP is fitted to at most
+# max_train points (a random subset).
+#
+# Measured on one core, a whole set fitted to 2048 points over 4 dimensions
+# (altitude, mach, sensor, revisit time): poly ~1.9M points/s, rbf ~30k/s,
+# gp ~70k/s (1024 kept). Fit with 5-fold cross-validation: poly < 0.1 s,
+# rbf ~27 s, gp ~15 s.
+#
+# Each model saves to and loads from a .npz of its arrays. The results have
+# discontinuities (legs per sortie are an integer, validity switches), which
+# no smooth surrogate reproduces exactly: check cross_validate before relying
+# on one.
+
+SURROGATES = ('poly', 'rbf', 'gp')
+
+# Query chunks hold about this many feature values (points x features), small
+# enough to stay in cache: ~1000 points for poly, 64 for rbf and gp
+QUERY_CHUNK_VALUES = 1 << 16
+
+
+def _chunk_rows(n_features: int) -> int:
+    return max(64, QUERY_CHUNK_VALUES//max(n_features, 1))
+
+
+def _predict_linear(model, X, chunk_size: int = None) -> np.ndarray:
+    # features(X) @ weights + tail(X), chunk by chunk
+    out = np.empty(len(X))
+    chunk_size = chunk_size or _chunk_rows(len(model.weights))
+    for i in range(0, len(X), chunk_size):
+        x = X[i:i+chunk_size]
+        out[i:i+chunk_size] = model.features(x)@model.weights + model.tail(x)
+    return out
+
+
+def _total_degree(d: int, degree: int):
+    '''
+    Exponent tuples of the d-variate monomials of total degree <= degree.
+    '''
+    if d == 0:
+        yield ()
+        return
+    for k in range(degree + 1):
+        for rest in _total_degree(d - 1, degree - k):
+            yield (k,) + rest
+
+
+class PolynomialChaos:
+    '''
+    Legendre polynomial expansion over the unit hypercube.
+    '''
+    kind = 'poly'
+
+    def __init__(self, degree: int = 4, ridge: float = 1e-8):
+        self.degree = degree
+        self.ridge  = ridge
+
+    def _basis(self, X):
+        # Legendre polynomials of each coordinate on [-1, 1], by recurrence:
+        # P[j, k] is degree k of coordinate j over the points. Built with
+        # points along rows (row gathers and products are contiguous), and
+        # returned as a transposed view, (points, basis functions).
+        z = 2*X.T - 1
+        P = np.empty((X.shape[1], self.degree + 1, len(X)))
+        P[:, 0] = 1
+        if self.degree > 0:
+            P[:, 1] = z
+        for k in range(1, self.degree):
+            P[:, k+1] = ((2*k + 1)*z*P[:, k] - k*P[:, k-1])/(k + 1)
+
+        out = P[0][self.powers[:, 0]]
+        for j in range(1, X.shape[1]):
+            out *= P[j][self.powers[:, j]]
+        return out.T
+
+    def fit(self, X, y) -> 'PolynomialChaos':
+        d = X.shape[1]
+        self.powers = np.array(list(_total_degree(d, self.degree))).reshape(-1, d)
+        A = self._basis(X)
+        self.coef = np.linalg.solve(A.T@A + self.ridge*np.eye(A.shape[1]), A.T@y)
+        return self
+
+    def features(self, X):
+        return self._basis(X)
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.coef
+
+    def tail(self, X):
+        return 0.0
+
+    def feature_key(self):
+        return ('poly', self.powers.tobytes())
+
+    def predict(self, X, chunk_size: int = None) -> np.ndarray:
+        return _predict_linear(self, X, chunk_size)
+
+    def arrays(self) -> dict:
+        return {'degree': self.degree, 'ridge': self.ridge, 'powers': self.powers, 'coef': self.coef}
+
+    @classmethod
+    def from_arrays(cls, a) -> 'PolynomialChaos':
+        model = cls(int(a['degree']), float(a['ridge']))
+        model.powers, model.coef = a['powers'], a['coef']
+        return model
+
+
+def _sq_dist(A, B, scale=1.0):
+    A, B = A/scale, B/scale
+    return np.maximum((A**2).sum(axis=1)[:, None] + (B**2).sum(axis=1)[None, :] - 2*A@B.T, 0)
+
+
+def _cubic(r2):
+    # r**3 from r**2, in place (much faster than r2**1.5)
+    r = np.sqrt(r2)
+    r2 *= r
+    return r2
+
+
+class RadialBasis:
+    '''
+    Cubic RBF interpolant, phi(r) = r**3, plus a linear polynomial.
+    smoothing > 0 trades interpolation for smoothness.
+    '''
+    kind = 'rbf'
+
+    def __init__(self, smoothing: float = 0.0):
+        self.smoothing = smoothing
+
+    def fit(self, X, y) -> 'RadialBasis':
+        n, d = X.shape
+        Phi = _cubic(_sq_dist(X, X)) + self.smoothing*np.eye(n)
+        P   = np.column_stack([np.ones(n), X])
+        A   = np.block([[Phi, P], [P.T, np.zeros((d + 1, d + 1))]])
+        w   = np.linalg.lstsq(A, np.concatenate([y, np.zeros(d + 1)]), rcond=None)[0]
+        self.centers, self.weights, self.linear = X, w[:n], w[n:]
+        return self
+
+    def features(self, X):
+        return _cubic(_sq_dist(X, self.centers))
+
+    def tail(self, X):
+        return self.linear[0] + X@self.linear[1:]
+
+    def feature_key(self):
+        return ('rbf', self.centers.tobytes())
+
+    def predict(self, X, chunk_size: int = None) -> np.ndarray:
+        return _predict_linear(self, X, chunk_size)
+
+    def arrays(self) -> dict:
+        return {'smoothing': self.smoothing, 'centers': self.centers, 'weights': self.weights, 'linear': self.linear}
+
+    @classmethod
+    def from_arrays(cls, a) -> 'RadialBasis':
+        model = cls(float(a['smoothing']))
+        model.centers, model.weights, model.linear = a['centers'], a['weights'], a['linear']
+        return model
+
+
+class GaussianProcess:
+    '''
+    GP regression, squared-exponential kernel with one length scale per
+    dimension, constant mean (of the training data) and Gaussian noise.
+    Hyperparameters maximize the marginal likelihood of up to max_opt
+    training points (L-BFGS-B, analytic gradient), and the GP conditions on
+    up to max_train of them (random subsets): fitting is cubic and queries
+    linear in the number kept.
+    '''
+    kind = 'gp'
+
+    def __init__(self, optimize: bool = True, max_opt: int = 512, max_train: int = 1024, seed: int = 0):
+        self.optimize  = optimize
+        self.max_opt   = max_opt
+        self.max_train = max_train
+        self.seed      = seed
+
+    @staticmethod
+    def _nll(theta, X, y):
+        # theta: log length scales (d), log signal std, log noise std
+        d = X.shape[1]
+        ell, sf2, sn2 = np.exp(theta[:d]), np.exp(2*theta[d]), np.exp(2*theta[d+1])
+        Kf = sf2*np.exp(-0.5*_sq_dist(X, X, ell))
+        K  = Kf + (sn2 + 1e-10)*np.eye(len(X))
+        try:
+            c = cho_factor(K, lower=True)
+        except np.linalg.LinAlgError:
+            return 1e25, np.zeros_like(theta)
+        alpha = cho_solve(c, y)
+        nll = 0.5*y@alpha + np.log(np.diag(c[0])).sum() + 0.5*len(X)*math.log(2*math.pi)
+
+        W = np.outer(alpha, alpha) - cho_solve(c, np.eye(len(X)))
+        grad = np.empty_like(theta)
+        for j in range(d):
+            D = (X[:, j, None] - X[None, :, j])**2/ell[j]**2
+            grad[j] = -0.5*(W*(Kf*D)).sum()
+        grad[d]   = -0.5*(W*(2*Kf)).sum()
+        grad[d+1] = -0.5*np.trace(W)*2*sn2
+        return nll, grad
+
+    def fit(self, X, y) -> 'GaussianProcess':
+        rng = np.random.default_rng(self.seed)
+        if len(X) > self.max_train:
+            keep = np.sort(rng.choice(len(X), self.max_train, replace=False))
+            X, y = X[keep], y[keep]
+        self.y_mean, self.y_std = float(y.mean()), float(y.std()) or 1.0
+        z = (y - self.y_mean)/self.y_std
+        d = X.shape[1]
+
+        if self.optimize:
+            sub = rng.choice(len(X), min(len(X), self.max_opt), replace=False)
+            theta0 = np.concatenate([np.full(d, math.log(0.3)), [0.0, math.log(0.05)]])
+            bounds = [(math.log(1e-3), math.log(1e2))]*d + [(math.log(1e-2), math.log(1e2)), (math.log(1e-5), 0.0)]
+            self.theta = minimize(self._nll, theta0, args=(X[sub], z[sub]), jac=True, method='L-BFGS-B', bounds=bounds).x
+        elif not hasattr(self, 'theta'):
+            self.theta = np.concatenate([np.full(d, math.log(0.3)), [0.0, math.log(0.05)]])
+
+        ell, sf2, sn2 = self._hyper()
+        K = sf2*np.exp(-0.5*_sq_dist(X, X, ell)) + (sn2 + 1e-10)*np.eye(len(X))
+        self.L     = np.linalg.cholesky(K)
+        self.alpha = cho_solve((self.L, True), z)
+        self.X     = X
+        return self
+
+    def _hyper(self):
+        d = len(self.theta) - 2
+        return np.exp(self.theta[:d]), math.exp(2*self.theta[d]), math.exp(2*self.theta[d+1])
+
+    def features(self, X):
+        ell, sf2, _ = self._hyper()
+        Ks = _sq_dist(X, self.X, ell)
+        Ks *= -0.5
+        np.exp(Ks, out=Ks)
+        Ks *= sf2
+        return Ks
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.y_std*self.alpha
+
+    def tail(self, X):
+        return self.y_mean
+
+    def feature_key(self):
+        return ('gp', self.X.tobytes(), np.asarray(self.theta).tobytes())
+
+    def predict(self, X, return_std: bool = False, chunk_size: int = None):
+        if not return_std:
+            return _predict_linear(self, X, chunk_size)
+        _, sf2, _ = self._hyper()
+        chunk_size = chunk_size or _chunk_rows(len(self.X))
+        mean = np.empty(len(X))
+        std  = np.empty(len(X))
+        for i in range(0, len(X), chunk_size):
+            Ks = self.features(X[i:i+chunk_size])
+            mean[i:i+chunk_size] = Ks@self.weights + self.y_mean
+            v = solve_triangular(self.L, Ks.T, lower=True)
+            std[i:i+chunk_size] = np.sqrt(np.maximum(sf2 - (v**2).sum(axis=0), 0))
+        return mean, self.y_std*std
+
+    def arrays(self) -> dict:
+        return {
+            'theta': self.theta, 'X': self.X, 'L': self.L, 'alpha': self.alpha,
+            'y_mean': self.y_mean, 'y_std': self.y_std
+        }
+
+    @classmethod
+    def from_arrays(cls, a) -> 'GaussianProcess':
+        model = cls(optimize=False, max_train=len(a['X']))
+        model.theta, model.X, model.L, model.alpha = a['theta'], a['X'], a['L'], a['alpha']
+        model.y_mean, model.y_std = float(a['y_mean']), float(a['y_std'])
+        return model
+
+
+_MODELS = {cls.kind: cls for cls in (PolynomialChaos, RadialBasis, GaussianProcess)}
+
+
+def make_surrogate(kind: str, **kwargs):
+    if kind not in _MODELS:
+        raise ValueError(f'Unknown surrogate {kind!r}, must be one of {SURROGATES}')
+    return _MODELS[kind](**kwargs)
+
+
+@dataclass
+class CVScore:
+    '''
+    k-fold cross-validated error, in the target's own units.
+    '''
+    rmse:           float
+    mae:            float
+    median_rel_err: float # |error|/|value|, NaN for a classifier
+    error_rate:     float # misclassified fraction, NaN for a regression
+
+
+def cross_validate(kind: str, X, y, k: int = 5, log: bool = False, classify: bool = False, seed: int = 0, **kwargs) -> CVScore:
+    '''
+    k-fold cross-validation of a surrogate kind on (X, y). With log, the model
+    is fitted to log(y); with classify, predictions are thresholded at 0.5.
+    '''
+    folds = np.array_split(np.random.default_rng(seed).permutation(len(X)), k)
+    pred  = np.empty(len(X))
+    for fold in folds:
+        train = np.setdiff1d(np.arange(len(X)), fold)
+        model = make_surrogate(kind, **kwargs).fit(X[train], np.log(y[train]) if log else y[train])
+        pred[fold] = model.predict(X[fold])
+    if log:
+        pred = np.exp(pred)
+
+    err = pred - y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel = np.nan if classify else float(np.median(np.abs(err)/np.abs(y)))
+    return CVScore(
+        rmse           = float(np.sqrt(np.mean(err**2))),
+        mae            = float(np.mean(np.abs(err))),
+        median_rel_err = rel,
+        error_rate     = float(np.mean((pred >= 0.5) != (y >= 0.5))) if classify else np.nan
+    )
+
+
+# Targets: name -> (fitted on valid configs only, log-transformed)
+TARGETS = {
+    'onsta_req_cost': (True, True),
+    'onsta_req_n':    (True, True),
+    'valid':          (False, False),
+}
+
+
+class SurrogateSet:
+    '''
+    One surrogate per target in TARGETS, over a DesignSpace's unit
+    coordinates.
+    '''
+
+    def __init__(self, models: dict, scores: dict = None):
+        self.models = models
+        self.scores = scores or {}
+
+    def predict(self, unit: np.ndarray) -> dict:
+        '''
+        Predictions at unit points (n, dims): p_valid (clipped to [0, 1]),
+        valid, and the regressions (NaN where predicted invalid).
+
+        Models with the same features (see feature_key) share one feature
+        matrix per chunk and one matrix product.
+        '''
+        groups = {}
+        for name, model in self.models.items():
+            groups.setdefault(model.feature_key(), []).append(name)
+        groups = [(self.models[names[0]], names, np.column_stack([self.models[n].weights for n in names]))
+                  for names in groups.values()]
+
+        raw = {name: np.empty(len(unit)) for name in self.models}
+        chunk_size = _chunk_rows(max(W.shape[0] for _, _, W in groups))
+        for i in range(0, len(unit), chunk_size):
+            x = unit[i:i+chunk_size]
+            for model, names, W in groups:
+                values = W.T@model.features(x).T
+                for k, name in enumerate(names):
+                    raw[name][i:i+chunk_size] = values[k] + self.models[name].tail(x)
+
+        p = np.clip(raw['valid'], 0, 1)
+        out = {'p_valid': p, 'valid': p >= 0.5}
+        for name, (_, log) in TARGETS.items():
+            if name == 'valid':
+                continue
+            out[name] = np.where(out['valid'], np.exp(raw[name]) if log else raw[name], np.nan)
+        return out
+
+    def predict_batch(self, space: DesignSpace, batch: ConfigBatch) -> dict:
+        return self.predict(space.to_unit(batch))
+
+    def save(self, path: str):
+        arrays = {}
+        for name, model in self.models.items():
+            arrays[f'{name}.kind'] = model.kind
+            arrays.update({f'{name}.{key}': value for key, value in model.arrays().items()})
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'SurrogateSet':
+        with np.load(path) as data:
+            models = {}
+            for name in TARGETS:
+                a = {key.split('.', 1)[1]: data[key] for key in data.files if key.startswith(f'{name}.')}
+                models[name] = _MODELS[str(a['kind'])].from_arrays(a)
+        return cls(models)
+
+
+def fit_surrogates(
+        space: DesignSpace,
+        batch: ConfigBatch,
+        result: BatchResult,
+        kind: str = 'gp',
+        cv_folds: int = 5,
+        **kwargs
+    ) -> SurrogateSet:
+    '''
+    Fit a SurrogateSet of the given kind to evaluated configs of the space,
+    with cross-validated scores (cv_folds=0 to skip). Keyword arguments go to
+    the model.
+    '''
+    X = space.to_unit(batch)
+    models, scores = {}, {}
+    for name, (valid_only, log) in TARGETS.items():
+        y    = getattr(result, name).astype(float)
+        rows = result.valid if valid_only else slice(None)
+        Xn, yn = X[rows], y[rows]
+        models[name] = make_surrogate(kind, **kwargs).fit(Xn, np.log(yn) if log else yn)
+        if cv_folds:
+            scores[name] = cross_validate(kind, Xn, yn, cv_folds, log=log, classify=name == 'valid', **kwargs)
+    return SurrogateSet(models, scores)
+
+
+def _diverse_top(candidates, score, k: int, spacing: float) -> np.ndarray:
+    '''
+    Greedily pick k high-scoring candidates, discounting the score of those
+    within about spacing of the ones already picked, so a round doesn't pile
+    its points into one uncertain spot.
+    '''
+    score = score.copy()
+    pick  = []
+    for _ in range(min(k, len(candidates))):
+        i = int(np.argmax(score))
+        pick.append(i)
+        score *= 1 - np.exp(-0.5*((candidates - candidates[i])**2).sum(axis=1)/spacing**2)
+        score[i] = -np.inf
+    return np.array(pick, dtype=int)
+
+
+def active_learning(
+        space: DesignSpace,
+        n_init: int = 256,
+        rounds: int = 8,
+        per_round: int = 64,
+        explore: float = 0.5,
+        n_candidates: int = 8192,
+        seed: int = 0,
+        solver: SolverSettings = SolverSettings()
+    ) -> tuple[SurrogateSet, ConfigBatch, BatchResult]:
+    '''
+    Grow a training set where the surrogates are least sure. Start from the
+    first n_init points of a Sobol' sequence; each round, fit GPs and
+    evaluate per_round more points:
+    - a fraction explore of them the sequence's next points, so the space
+      keeps being filled in
+    - the rest the candidates (out of a fresh Sobol' set) with the highest
+      uncertainty, spread out (see _diverse_top). Uncertainty is the larger
+      of the feasibility boundary, 1 - |2 p_valid - 1|, and, where predicted
+      feasible, the cost GP's predictive std of log cost relative to the
+      largest over the candidates.
+
+    Returns:
+        tuple[SurrogateSet, ConfigBatch, BatchResult]: final surrogates (with
+        CV scores) and every config evaluated.
+    '''
+    n_explore = round(explore*per_round)
+    n_total   = 2**math.ceil(math.log2(n_init + rounds*n_explore)) # Sobol' balance
+    sequence  = next(unit_points(len(space), n_total, 'sobol', n_total, seed))
+
+    batch  = space.to_batch(sequence[:n_init])
+    result = evaluate_batch(batch, solver=solver)
+
+    for r in range(rounds):
+        surrogates = fit_surrogates(space, batch, result, 'gp', cv_folds=0, seed=seed)
+
+        candidates = next(unit_points(len(space), n_candidates, 'sobol', n_candidates, seed + r + 1))
+        p = np.clip(surrogates.models['valid'].predict(candidates), 0, 1)
+        _, std = surrogates.models['onsta_req_cost'].predict(candidates, return_std=True)
+        std = np.where(p >= 0.5, std/max(std.max(), 1e-12), 0)
+        score = np.maximum(1 - np.abs(2*p - 1), std)
+
+        pick = _diverse_top(candidates, score, per_round - n_explore, spacing=len(result)**(-1/len(space)))
+        start = n_init + r*n_explore
+        new_batch = space.to_batch(np.vstack([sequence[start:start+n_explore], candidates[pick]]))
+        batch  = concat_batches([batch, new_batch])
+        result = concat_batches([result, evaluate_batch(new_batch, solver=solver)])
+
+    return fit_surrogates(space, batch, result, 'gp', seed=seed), batch, result
@@ -0,0 +1,278 @@
+import itertools
+from dataclasses import dataclass, fields, replace
+import numpy as np
+from constants import *
+from lib import validate_config
+from batch import (
+    ConfigBatch,
+    STAGES,
+    REASON_NO_SEARCH_LEGS,
+    evaluate_batch,
+    first_stage,
+    search_rate_stage,
+    onsta_stage
+)
+
+
+# Extra sweep dimensions that first enter at one of these stages are evaluated
+# by broadcasting the stages from there on over the dimension, from upstream
+# results computed once per design point. Anything else falls back to a full
+# evaluation of every (design point, sweep value) pair.
+#
+# - 'onsta':       aoi_revisit_time_hr, aoi_width
+# - 'search_rate': aoi_ingress, aoi_egress (basing distance), reusing the
+#                  sensor, search performance and sweep width results
+BROADCAST_STAGES = ('search_rate', 'onsta')
+
+# Validation checks on fields that can be broadcast (all must be > 0)
+_VALIDATED_POSITIVE = {'aoi_length', 'aoi_width', 'aoi_ingress', 'aoi_egress'}
+
+
+@dataclass
+class SweepResult:
+    '''
+    Results of a sweep of extra dimensions over a batch of design points.
+    Arrays have shape (len(batch), *[len(v) for v in axes.values()]).
+
+    stage is the stage evaluation restarted from for each sweep value (e.g.
+    'onsta' for the revisit-time/AOI-width fast path), None if every pair was
+    evaluated in full.
+    '''
+    axes:                  dict
+    stage:                 str | None
+    valid:                 np.ndarray
+    reason:                np.ndarray
+    ac_cost:               np.ndarray
+    ac_turn_time:          np.ndarray
+    effective_sweep_width: np.ndarray
+    search_rate:           np.ndarray
+    onsta_req_n:           np.ndarray
+    onsta_req_cost:        np.ndarray
+
+
+def _axis_fields(key) -> tuple[str, ...]:
+    '''
+    ConfigBatch fields set by an axis. An axis key is a field name, or a tuple
+    of field names that take the same values (e.g. ingress and egress).
+    '''
+    return key if isinstance(key, tuple) else (key,)
+
+
+def restart_stage(fields_swept) -> str | None:
+    '''
+    The earliest stage that reads any of the swept fields, i.e. the stage
+    evaluation has to restart from for each sweep value.
+    '''
+    stages = [first_stage(name) for name in fields_swept]
+    stages = [stage for stage in stages if stage is not None]
+    if not stages:
+        return STAGES[-1]
+    return min(stages, key=STAGES.index)
+
+
+def evaluate_sweep(batch: ConfigBatch, axes: dict) -> SweepResult:
+    '''
+    Evaluate every design point in the batch at every combination of values of
+    the extra sweep dimensions.
+
+    If the swept fields only enter the final stages (e.g. aoi_revisit_time_hr
+    and aoi_width only enter calc_onsta_requirement; aoi_ingress and aoi_egress
+    only enter calc_ac_search_rate), the upstream stages are evaluated once per
+    design point and only the final stages are broadcast over the sweep values.
+
+    Args:
+        batch: ConfigBatch of design points.
+        axes: dict of ConfigBatch field name (or tuple of names that share the
+            values) -> 1-D array of values to sweep. Only scalar fields (not
+            fov/resolution/target dims) can be swept.
+
+    Returns:
+        SweepResult
+    '''
+    axes = {key: np.asarray(values) for key, values in axes.items()}
+    swept = [name for key in axes for name in _axis_fields(key)]
+    for name in swept:
+        if getattr(batch, name).ndim != 1:
+            raise ValueError(f'Can only sweep scalar fields, {name} is not')
+    if len(set(swept)) != len(swept):
+        raise ValueError(f'Fields swept on more than one axis: {swept}')
+
+    stage = restart_stage(swept)
+    if stage in BROADCAST_STAGES:
+        return _broadcast_sweep(batch, axes, stage)
+
+    return _full_sweep(batch, axes)
+
+
+def evaluate_basing_sweep(batch: ConfigBatch, distances, egress_distances=None) -> SweepResult:
+    '''
+    Evaluate every design point for each candidate basing distance. By default
+    the aircraft egresses back where it came from (egress == ingress); pass
+    egress_distances to sweep egress as a separate axis.
+
+    Returns:
+        SweepResult with axes ('aoi_ingress', 'aoi_egress') or aoi_ingress and
+        aoi_egress.
+    '''
+    if egress_distances is None:
+        return evaluate_sweep(batch, {('aoi_ingress', 'aoi_egress'): distances})
+    return evaluate_sweep(batch, {'aoi_ingress': distances, 'aoi_egress': egress_distances})
+
+
+def _grid(batch: ConfigBatch, axes: dict, name: str) -> np.ndarray:
+    '''
+    Field values on the (design point, *sweep values) grid, broadcast (not
+    copied).
+    '''
+    for k, key in enumerate(axes):
+        if name in _axis_fields(key):
+            shape = [1]*(len(axes)+1)
+            shape[k+1] = -1
+            return axes[key].reshape(shape)
+
+    return _column(getattr(batch, name), len(axes))
+
+
+def _column(values: np.ndarray, n_axes: int) -> np.ndarray:
+    return values.reshape((-1,) + (1,)*n_axes)
+
+
+def _sweep_reasons(batch, axes, reason, value_valid):
+    '''
+    Fill in reasons where a swept value is itself invalid (validate_config
+    reports that one, in its usual order). Only the validated axes matter, so
+    validate_config runs once per (design point, invalid validated values) and
+    is broadcast over the rest.
+    '''
+    keys      = list(axes)
+    validated = [k for k, key in enumerate(keys) if set(_axis_fields(key)) & _VALIDATED_POSITIVE]
+    others    = tuple(k+1 for k in range(len(keys)) if k not in validated)
+    invalid   = ~value_valid.all(axis=others, keepdims=True) if others else ~value_valid
+
+    for index in zip(*np.nonzero(invalid)):
+        changes = {
+            name: axes[keys[k]][index[k+1]].item()
+            for k in validated for name in _axis_fields(keys[k])
+        }
+        config = _replace_config(batch.config(index[0]), changes)
+        # Broadcast over the axes that don't affect validation
+        target = tuple(slice(None) if k in others else i for k, i in enumerate(index))
+        reason[target] = validate_config(config)[1]
+
+    return reason
+
+
+def _replace_config(config: Config, changes: dict) -> Config:
+    aoi_changes = {name.removeprefix('aoi_'): value for name, value in changes.items()
+                   if name in _VALIDATED_POSITIVE}
+    other = {name: value for name, value in changes.items() if name not in _VALIDATED_POSITIVE}
+    if aoi_changes:
+        config = replace(config, aoi=replace(config.aoi, **aoi_changes))
+    return replace(config, **other)
+
+
+def _broadcast_sweep(batch: ConfigBatch, axes: dict, stage: str) -> SweepResult:
+    n      = len(batch)
+    n_axes = len(axes)
+    shape  = (n,) + tuple(len(v) for v in axes.values())
+    swept  = [name for key in axes for name in _axis_fields(key)]
+
+    # Upstream results don't depend on the swept fields: evaluate once with
+    # them set to a placeholder that passes validation
+    base = evaluate_batch(replace(batch, **{name: np.ones(n) for name in swept if name in _VALIDATED_POSITIVE}))
+
+    # Validity of the swept values themselves
+    value_valid = np.ones(shape, dtype=bool)
+    for name in swept:
+        if name in _VALIDATED_POSITIVE:
+            value_valid = value_valid & (_grid(batch, axes, name) > 0)
+
+    reason = np.empty(shape, dtype=object)
+
+    if stage == 'search_rate':
+        # Valid through the sweep width stage; whether the aircraft can get
+        # there and back depends on the swept basing distance
+        upstream_ok = base.valid | (base.reason == REASON_NO_SEARCH_LEGS)
+        reason[...] = _column(np.where(upstream_ok, None, base.reason), n_axes)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            search_rate = search_rate_stage(
+                _column(batch.mach, n_axes),
+                _column(base.ac_endurance_sec, n_axes),
+                _grid(batch, axes, 'aoi_length'),
+                _grid(batch, axes, 'aoi_ingress'),
+                _grid(batch, axes, 'aoi_egress'),
+                _column(base.ac_turn_time, n_axes),
+                _column(base.effective_sweep_width, n_axes)
+            )
+        search_rate = np.where(value_valid, search_rate, np.nan)
+        ok      = _column(upstream_ok, n_axes) & value_valid
+        no_legs = ok & np.isnan(search_rate)
+        reason[no_legs] = REASON_NO_SEARCH_LEGS
+        valid = ok & ~no_legs
+    else:
+        reason[...] = _column(base.reason, n_axes)
+        search_rate = np.where(value_valid, _column(base.search_rate, n_axes), np.nan)
+        valid = _column(base.valid, n_axes) & value_valid
+
+    # Broadcast the final stage over the sweep values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        onsta = onsta_stage(
+            _grid(batch, axes, 'aoi_length'),
+            _grid(batch, axes, 'aoi_width'),
+            search_rate,
+            _grid(batch, axes, 'aoi_revisit_time_hr')
+        )
+    onsta = np.where(valid, onsta, np.nan)
+
+    # Upstream results, NaN where a swept value fails validation, as a full
+    # evaluation leaves them (where the base evaluation failed they're NaN
+    # already)
+    def upstream(values):
+        return np.where(value_valid, _column(values, n_axes), np.nan)
+
+    return SweepResult(
+        axes                  = axes,
+        stage                 = stage,
+        valid                 = valid,
+        reason                = _sweep_reasons(batch, axes, reason, value_valid),
+        ac_cost               = upstream(base.ac_cost),
+        ac_turn_time          = upstream(base.ac_turn_time),
+        effective_sweep_width = upstream(base.effective_sweep_width),
+        search_rate           = search_rate,
+        onsta_req_n           = onsta,
+        onsta_req_cost        = onsta*_column(base.ac_cost, n_axes),
+    )
+
+
+def _full_sweep(batch: ConfigBatch, axes: dict) -> SweepResult:
+    n     = len(batch)
+    shape = (n,) + tuple(len(v) for v in axes.values())
+
+    # Every (sweep values, design point) pair, design point fastest
+    combos = list(itertools.product(*axes.values()))
+    tiled  = ConfigBatch(**{
+        f.name: np.concatenate([getattr(batch, f.name)]*len(combos)) for f in fields(batch)
+    })
+    tiled = replace(tiled, **{
+        name: np.repeat(np.array([combo[k] for combo in combos]), n)
+        for k, key in enumerate(axes) for name in _axis_fields(key)
+    })
+    result = evaluate_batch(tiled)
+
+    def grid(values):
+        # (combos, n) -> (n, *axis lengths)
+        return np.moveaxis(values.reshape((len(combos), n)), 0, -1).reshape(shape)
+
+    return SweepResult(
+        axes                  = axes,
+        stage                 = None,
+        valid                 = grid(result.valid),
+        reason                = grid(result.reason),
+        ac_cost               = grid(result.ac_cost),
+        ac_turn_time          = grid(result.ac_turn_time),
+        effective_sweep_width = grid(result.effective_sweep_width),
+        search_rate           = grid(result.search_rate),
+        onsta_req_n           = grid(result.onsta_req_n),
+        onsta_req_cost        = grid(result.onsta_req_cost),
+    )
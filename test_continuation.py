@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from constants import *
+import solvers
+from main import grid_configs
+from batch import ConfigBatch, evaluate_batch
+from continuation import evaluate_continuation
+
+
+# Warm starting must never change which points are feasible: compare against
+# cold solves of main.py's grid, continuing in every direction.
+
+@pytest.fixture(scope='module')
+def grid():
+    return ConfigBatch.from_configs(list(grid_configs()))
+
+
+@pytest.mark.parametrize('method', solvers.SOLVERS)
+@pytest.mark.parametrize('along', ['mach', 'altitude_kft'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_continuation_keeps_feasibility(grid, method, along, descending):
+    solver = SolverSettings(method=method, tol=0.01 if method == 'fixed_point' else 1e-6, max_iter=50)
+    cold = evaluate_batch(grid, solver=solver)
+    warm, _ = evaluate_continuation(grid, along, descending, solver=solver)
+
+    assert np.array_equal(warm.valid, cold.valid)
+    assert np.array_equal(warm.reason, cold.reason)
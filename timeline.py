@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+import math
+from constants import *
+from batch import ConfigBatch, BatchResult, evaluate_batch
+from lawnmower import LawnmowerScenario
+
+
+# Mission timeline of a single config: the sortie as a sequence of segments,
+# generated lazily so arbitrarily long missions (e.g. an endless search for an
+# animation) take constant memory.
+#
+# Positions are (x, y) in m in the AOI's frame, as in lawnmower.py: legs run
+# along x over [0, aoi.length], offset laterally (y) by the effective sweep
+# width. The aircraft ingresses along x to the start of the first leg, flies
+# search legs joined by the turn-around of
+# calc_coordinated_level_turnaround_time (straight deceleration out of the
+# AOI, the turn, straight acceleration back in), and egresses straight on
+# from the end of its last leg. It starts another leg only if it can still
+# fly it and egress within its endurance.
+#
+# Like the lawnmower simulation, legs and transits are flown at the physical
+# cruise speed, so the number of legs per sortie is what the aircraft could
+# actually fly rather than calc_ac_search_rate's count.
+
+SEGMENT_KINDS = ('ingress', 'leg', 'decel', 'turn', 'accel', 'egress')
+
+
+@dataclass(frozen=True)
+class Segment:
+    kind:  str                 # one of SEGMENT_KINDS
+    t0:    float               # s from launch
+    t1:    float               # s from launch
+    start: tuple[float, float] # m, (x, y)
+    end:   tuple[float, float] # m, (x, y)
+    mach0: float
+    mach1: float
+    leg:   int                 # number of the search leg it belongs to or follows
+
+    @property
+    def duration(self) -> float:
+        return self.t1 - self.t0
+
+
+def segments(
+        scenario: LawnmowerScenario,
+        aoi_ingress: float,
+        aoi_egress: float,
+        endurance_sec: float = math.inf
+    ):
+    '''
+    Lazily yield the Segments of a sortie, in order.
+
+    Args:
+        scenario (LawnmowerScenario)
+        aoi_ingress (float): m from launch to the AOI.
+        aoi_egress (float): m from the AOI back.
+        endurance_sec (float): time available; math.inf never egresses.
+    '''
+    s       = scenario
+    speed   = s.mach*MACH_M_PER_SEC
+    t_in    = aoi_ingress/speed
+    t_out   = aoi_egress/speed
+    t_turn  = s.turn_time - 2*s.straight_time # the turn itself
+
+    if t_in + s.leg_time + t_out > endurance_sec:
+        raise ValueError('Endurance does not cover the transit to and from the AOI and one search leg')
+
+    y = s.sweep_width/2
+    yield Segment('ingress', 0.0, t_in, (-aoi_ingress, y), (0.0, y), s.mach, s.mach, 0)
+
+    t, k, step, direction, n = t_in, 0, 1, 1, 0
+    while True:
+        x0, x1 = (0.0, s.aoi_length) if direction > 0 else (s.aoi_length, 0.0)
+        yield Segment('leg', t, t + s.leg_time, (x0, y), (x1, y), s.mach, s.mach, n)
+        t += s.leg_time
+
+        if t + s.turn_time + s.leg_time + t_out > endurance_sec:
+            break
+
+        # Turn around outside the AOI onto the next leg
+        k, step = s.next_leg(k, step)
+        y_next  = s.sweep_width/2 + k*s.sweep_width
+        x_out   = x1 + direction*s.straight_dist
+        yield Segment('decel', t, t + s.straight_time, (x1, y), (x_out, y), s.mach, s.manx_mach, n)
+        t += s.straight_time
+        yield Segment('turn', t, t + t_turn, (x_out, y), (x_out, y_next), s.manx_mach, s.manx_mach, n)
+        t += t_turn
+        yield Segment('accel', t, t + s.straight_time, (x_out, y_next), (x1, y_next), s.manx_mach, s.mach, n)
+        t += s.straight_time
+
+        y, direction, n = y_next, -direction, n + 1
+
+    x_end = x1 + direction*aoi_egress
+    yield Segment('egress', t, t + t_out, (x1, y), (x_end, y), s.mach, s.mach, n)
+
+
+def batch_timeline(batch: ConfigBatch, result: BatchResult, i: int, endurance_sec: float = None):
+    '''
+    Lazy timeline of config i of an evaluated batch, over its endurance unless
+    endurance_sec is given.
+    '''
+    if endurance_sec is None:
+        endurance_sec = result.ac_endurance_sec[i]
+    return segments(
+        LawnmowerScenario.from_batch(batch, result, i),
+        aoi_ingress   = float(batch.aoi_ingress[i]),
+        aoi_egress    = float(batch.aoi_egress[i]),
+        endurance_sec = float(endurance_sec)
+    )
+
+
+def mission_timeline(config: Config, solver: SolverSettings = SolverSettings(), endurance_sec: float = None):
+    '''
+    Lazy timeline of a Config's sortie (see segments).
+
+    Args:
+        config (Config)
+        solver (SolverSettings): for the effective sweep width.
+        endurance_sec (float): default the aircraft's endurance; math.inf for
+            an endless search.
+
+    Returns:
+        generator of Segment
+    '''
+    batch  = ConfigBatch.from_configs([config])
+    result = evaluate_batch(batch, solver=solver)
+    return batch_timeline(batch, result, 0, endurance_sec)